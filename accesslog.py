@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import fcntl
+import hmac
+import sqlite3
+import hashlib
+import threading
+from collections import deque
+
+
+SORTS = {'hits': 'hits', 'bytes': 'bytes', 'clients': 'clients', 'recent': 'last_seen'}
+
+
+class AccessLog:
+    # record() only appends to a bounded in-memory ring; a background thread
+    # drains it every `interval` seconds into <directory>/access.log (ndjson,
+    # rotated to access.log.1 .. access.log.<keep>) and folds the batch into
+    # per-file totals in <directory>/stats.db, shared by every process.
+    def __init__(self, directory, secret, interval=2.0, max_bytes=16 * 1024 * 1024, keep=5, buffer_size=65536):
+        self.directory = directory
+        self.path = os.path.join(directory, 'access.log')
+        self.lock_path = os.path.join(directory, 'access.lock')
+        self.db_path = os.path.join(directory, 'stats.db')
+        self.key = hashlib.sha256(f"access-log:{secret}".encode('utf-8')).digest()
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self._buffer = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self._local = threading.local()
+        self._thread = None
+        self._stopped = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS file_stats (name TEXT PRIMARY KEY, hits INTEGER NOT NULL, "
+                         "bytes INTEGER NOT NULL, not_modified INTEGER NOT NULL, ranges INTEGER NOT NULL, "
+                         "last_seen REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS file_clients (name TEXT NOT NULL, client TEXT NOT NULL, "
+                         "PRIMARY KEY (name, client)) WITHOUT ROWID")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def client_id(self, address):
+        # Addresses are stored as a keyed hash: enough to count unique clients.
+        return hmac.new(self.key, (address or '').encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+    def record(self, name, status, size, address, method='GET', duration=None):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((time.time(), name, status, size or 0, address, method, duration))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="access-log", daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Failed to write the access log: {e}")
+
+    def _drain(self):
+        records = []
+        while True:
+            try:
+                records.append(self._buffer.popleft())
+            except IndexError:
+                return records
+
+    def flush(self):
+        records = self._drain()
+        if not records:
+            return
+        entries = [{'t': round(t, 3), 'f': name, 's': status, 'b': size, 'c': self.client_id(address), 'm': method,
+                    'ms': None if duration is None else round(duration * 1000, 2)}
+                   for t, name, status, size, address, method, duration in records]
+        self._write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries))
+        self._aggregate(entries)
+
+    def _write(self, lines):
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(lines)
+                    size = f.tell()
+                if size > self.max_bytes:
+                    for index in range(self.keep - 1, 0, -1):
+                        if os.path.exists(f"{self.path}.{index}"):
+                            os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+                    os.replace(self.path, f"{self.path}.1")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _aggregate(self, entries):
+        totals, clients = {}, set()
+        for entry in entries:
+            if entry['s'] == 404:
+                continue
+            row = totals.setdefault(entry['f'], [0, 0, 0, 0, 0.0])
+            row[0] += 1
+            row[1] += entry['b'] if entry['m'] == 'GET' else 0
+            row[2] += entry['s'] == 304
+            row[3] += entry['s'] == 206
+            row[4] = max(row[4], entry['t'])
+            clients.add((entry['f'], entry['c']))
+        with self._conn() as conn:
+            conn.executemany("INSERT INTO file_stats VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+                             "hits = hits + excluded.hits, bytes = bytes + excluded.bytes, "
+                             "not_modified = not_modified + excluded.not_modified, ranges = ranges + excluded.ranges, "
+                             "last_seen = max(last_seen, excluded.last_seen)",
+                             [(name, *row) for name, row in totals.items()])
+            conn.executemany("INSERT OR IGNORE INTO file_clients VALUES (?, ?)", sorted(clients))
+
+    # Every process sees each change event, so these must be idempotent.
+    def rename(self, old_name, new_name):
+        with self._conn() as conn:
+            conn.execute("UPDATE OR REPLACE file_stats SET name = ? WHERE name = ?", (new_name, old_name))
+            conn.execute("UPDATE OR IGNORE file_clients SET name = ? WHERE name = ?", (new_name, old_name))
+            conn.execute("DELETE FROM file_clients WHERE name = ?", (old_name,))
+
+    def forget(self, name):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM file_stats WHERE name = ?", (name,))
+            conn.execute("DELETE FROM file_clients WHERE name = ?", (name,))
+
+    def _describe(self, row):
+        hits = row['hits']
+        return {'name': row['name'], 'hits': hits, 'bytes': row['bytes'], 'clients': row['clients'],
+                'not_modified_ratio': row['not_modified'] / hits if hits else 0.0,
+                'range_ratio': row['ranges'] / hits if hits else 0.0, 'last_seen': row['last_seen']}
+
+    def top(self, sort='hits', limit=25):
+        if sort not in SORTS:
+            raise ValueError(f"Unknown sort key '{sort}'.")
+        rows = self._conn().execute(
+            "SELECT s.*, (SELECT COUNT(*) FROM file_clients c WHERE c.name = s.name) AS clients "
+            f"FROM file_stats s ORDER BY {SORTS[sort]} DESC LIMIT ?", (limit,)).fetchall()
+        return [self._describe(row) for row in rows]
+
+    def stats(self, name):
+        row = self._conn().execute(
+            "SELECT s.*, (SELECT COUNT(*) FROM file_clients c WHERE c.name = s.name) AS clients "
+            "FROM file_stats s WHERE s.name = ?", (name,)).fetchone()
+        return self._describe(row) if row is not None else None
+
+    def totals(self):
+        row = self._conn().execute("SELECT COUNT(*) AS files, COALESCE(SUM(hits), 0) AS hits, "
+                                   "COALESCE(SUM(bytes), 0) AS bytes FROM file_stats").fetchone()
+        return {'files': row['files'], 'hits': row['hits'], 'bytes': row['bytes'], 'dropped': self.dropped}
+
+    def close(self):
+        self._stopped.set()
+        try:
+            self.flush()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Failed to write the access log: {e}")
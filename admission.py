@@ -0,0 +1,221 @@
+import os
+import math
+import time
+import fcntl
+import random
+import sqlite3
+import threading
+
+
+class RateLimiter:
+    # Token buckets kept in this process only. A bucket that has refilled is
+    # the same as a missing one, so idle keys are dropped once the table grows.
+    def __init__(self, rate, burst, max_keys=100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _level(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _wait(self, tokens, cost):
+        return 0 if tokens >= cost else math.ceil((cost - tokens) / self.rate) if self.rate > 0 else 3600
+
+    def peek(self, key, cost=1):
+        # Seconds until `cost` tokens are available, without spending any.
+        with self._lock:
+            return self._wait(self._level(key, time.monotonic()), cost)
+
+    def take(self, key, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._level(key, now)
+            wait = self._wait(tokens, cost)
+            if not wait:
+                self._buckets[key] = (tokens - cost, now)
+                if len(self._buckets) > self.max_keys:
+                    self._prune(now)
+            return wait
+
+    def _prune(self, now):
+        buckets = {key: value for key, value in self._buckets.items() if self._level(key, now) < self.burst}
+        if len(buckets) > self.max_keys // 2:
+            buckets = dict(sorted(buckets.items(), key=lambda item: item[1][1])[-(self.max_keys // 2):])
+        self._buckets = buckets
+
+
+class SharedRateLimiter:
+    # The same buckets, kept in a SQLite table so every process spends from
+    # one budget. Only used for failed password attempts, which are rare.
+    def __init__(self, path, table, rate, burst, refresh=1.0):
+        self.path = path
+        self.table = table
+        self.rate = rate
+        self.burst = burst
+        self.refresh = refresh
+        self._local = threading.local()
+        self._keys = set()
+        self._loaded_at = float('-inf')
+        with self._conn() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                         "updated REAL NOT NULL) WITHOUT ROWID")
+        self._failing()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _level(self, conn, key, now):
+        row = conn.execute(f"SELECT tokens, updated FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+
+    def _wait(self, tokens, cost):
+        return 0 if tokens >= cost else math.ceil((cost - tokens) / self.rate) if self.rate > 0 else 3600
+
+    def _failing(self):
+        # Keys with a bucket in the table, re-read at most every `refresh`
+        # seconds, so clients that never failed pass without a query.
+        now = time.monotonic()
+        if now - self._loaded_at >= self.refresh:
+            self._keys = {row[0] for row in self._conn().execute(f"SELECT key FROM {self.table}")}
+            self._loaded_at = now
+        return self._keys
+
+    def peek(self, key, cost=1):
+        if key not in self._failing():
+            return 0
+        return self._wait(self._level(self._conn(), key, time.time()), cost)
+
+    def take(self, key, cost=1):
+        conn, now = self._conn(), time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens = self._level(conn, key, now)
+            wait = self._wait(tokens, cost)
+            if not wait:
+                conn.execute(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)", (key, tokens - cost, now))
+                # Buckets that have filled up again are the same as missing ones.
+                if self.rate > 0:
+                    conn.execute(f"DELETE FROM {self.table} WHERE tokens + (? - updated) * ? >= ?",
+                                 (now, self.rate, self.burst))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if not wait:
+            self._keys.add(key)
+        return wait
+
+
+class TransferSlots:
+    # A cap on large downloads shared by every process: each download holds
+    # an flock on one of `limit` slot files for as long as its body is being
+    # sent. The kernel drops the locks of a process that dies. Up to
+    # `max_waiting` requests per process wait for a slot, polling, for at
+    # most `timeout` seconds; the rest are refused at once, so only a few
+    # worker threads are ever parked.
+    def __init__(self, directory, limit, max_waiting=4, poll_interval=0.1):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.poll_interval = poll_interval
+        self.waiting = 0
+        self._waiting_lock = threading.Lock()
+        self._slots = [(threading.Lock(), os.path.join(directory, f"slot-{index}.lock")) for index in range(limit)]
+        self._files = [None] * limit
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def active(self):
+        # Slots held by this process; summed over processes by the metrics.
+        return sum(lock.locked() for lock, _ in self._slots)
+
+    def acquire(self, timeout=0):
+        # Returns the slot to hand to release(), or None.
+        index = self._try_acquire()
+        if index is not None or timeout <= 0:
+            return index
+        with self._waiting_lock:
+            if self.waiting >= self.max_waiting:
+                return None
+            self.waiting += 1
+        try:
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                time.sleep(min(self.poll_interval * random.uniform(0.5, 1.5), max(0, deadline - time.monotonic())))
+                index = self._try_acquire()
+                if index is not None:
+                    return index
+            return None
+        finally:
+            with self._waiting_lock:
+                self.waiting -= 1
+
+    def _try_acquire(self):
+        # flock is per open file, so threads of one process also need a lock
+        # of their own per slot.
+        start = random.randrange(self.limit) if self.limit else 0
+        for offset in range(self.limit):
+            index = (start + offset) % self.limit
+            lock, path = self._slots[index]
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if self._files[index] is None:
+                    self._files[index] = open(path, 'a')
+                fcntl.flock(self._files[index], fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.release()
+                continue
+            return index
+        return None
+
+    def release(self, index):
+        fcntl.flock(self._files[index], fcntl.LOCK_UN)
+        self._slots[index][0].release()
+
+
+def limiter(settings, rate, burst):
+    return RateLimiter(settings.get('rate', rate), settings.get('burst', burst))
+
+
+class Admission:
+    # Everything here is checked before a request touches the catalog or the
+    # disk. The request buckets live in each worker's memory; failed password
+    # attempts and the large-download slots are shared through `state_dir`.
+    def __init__(self, config):
+        self.enabled = config.get('enabled', True)
+        self.client_header = config.get('client_header') or None
+        self.clients = limiter(config.get('per_client', {}), 20, 60)
+        self.files = limiter(config.get('per_file', {}), 200, 400)
+        self.admin = limiter(config.get('admin', {}), 20, 100)
+        state_dir = config.get('state_dir', 'cdn_admission')
+        os.makedirs(state_dir, exist_ok=True)
+        failures_path = os.path.join(state_dir, 'failures.db')
+        password_failures = config.get('password_failures', {})
+        self.password_failures = SharedRateLimiter(failures_path, 'password_failures', password_failures.get('rate', 0.1),
+                                                   password_failures.get('burst', 10))
+        login_failures = config.get('login_failures', {})
+        self.login_failures = SharedRateLimiter(failures_path, 'login_failures', login_failures.get('rate', 0.02),
+                                                login_failures.get('burst', 5))
+        self.large_transfer_bytes = config.get('large_transfer_bytes', 16 * 1024 * 1024)
+        self.transfers = TransferSlots(os.path.join(state_dir, 'transfers'), config.get('max_large_transfers', 16),
+                                       max_waiting=config.get('max_queued_transfers', 4))
+        self.queue_timeout = config.get('queue_timeout', 5)
+        self.retry_after = config.get('retry_after', 5)
+
+    def client(self, request):
+        # Behind a proxy every request comes from the proxy, so the real
+        # address is taken from the header it sets, when configured.
+        if self.client_header:
+            forwarded = request.headers.get(self.client_header, '').split(',')[0].strip()
+            if forwarded:
+                return forwarded
+        return request.remote_addr
@@ -0,0 +1,103 @@
+import os
+from werkzeug.utils import secure_filename
+from maintenance import expiry_time
+from layout import valid_name
+
+
+MAX_OPERATIONS = 5000
+
+
+class BatchError(Exception):
+    pass
+
+
+class BatchOperations:
+    def __init__(self, layout, metadata_store, blob_store, compressed_variants, change_feed):
+        self.layout = layout
+        self.metadata_store = metadata_store
+        self.blob_store = blob_store
+        self.compressed_variants = compressed_variants
+        self.change_feed = change_feed
+
+    def apply(self, operations):
+        if not isinstance(operations, list) or not operations:
+            raise BatchError('Expected a non-empty list of operations.')
+        if len(operations) > MAX_OPERATIONS:
+            raise BatchError(f'At most {MAX_OPERATIONS} operations per batch.')
+        # Every catalog change goes into one transaction; files are only moved
+        # or removed once it has committed, so a rollback leaves the disk alone.
+        results, events, moves = [], [], []
+        planned = {}
+        with self.layout.writing():
+            with self.metadata_store.batch():
+                for index, operation in enumerate(operations):
+                    name = operation.get('name') if isinstance(operation, dict) else None
+                    try:
+                        result, event, move = self._apply(operation, planned)
+                    except BatchError as e:
+                        results.append({'index': index, 'name': name, 'ok': False, 'error': str(e)})
+                        continue
+                    results.append({'index': index, 'name': name, 'ok': True, **result})
+                    events.append(event)
+                    moves.append((results[-1], move))
+            for result, move in moves:
+                if move is None:
+                    continue
+                try:
+                    move()
+                except OSError as e:
+                    result.update(ok=False, error=str(e))
+        self.change_feed.publish_many(events)
+        return results
+
+    def _exists(self, name, planned):
+        # Names renamed or deleted earlier in the batch are still on disk.
+        return planned[name] if name in planned else self.layout.exists(name)
+
+    def _apply(self, operation, planned):
+        if not isinstance(operation, dict):
+            raise BatchError('Operation must be an object.')
+        op, name = operation.get('op'), operation.get('name')
+        if not valid_name(name):
+            raise BatchError('Invalid file name.')
+        if not self._exists(name, planned):
+            raise BatchError('File not found.')
+
+        if op == 'delete':
+            digest = (self.metadata_store.get(name) or {}).get('sha256')
+            self.metadata_store.delete(name)
+            planned[name] = False
+            def move():
+                self.blob_store.remove(self.layout.locate(name) or self.layout.path(name), digest)
+                self.compressed_variants.invalidate(name)
+            return {}, ('delete', name, None), move
+
+        if op == 'rename':
+            new_name_base = secure_filename(str(operation.get('new_name') or ''))
+            if not new_name_base:
+                raise BatchError('New name is invalid.')
+            new_name = f"{new_name_base}{os.path.splitext(name)[1]}"
+            if self._exists(new_name, planned):
+                raise BatchError(f'A file named "{new_name}" already exists.')
+            self.metadata_store.rename(name, new_name)
+            planned[name], planned[new_name] = False, True
+            def move():
+                self.layout.rename(name, new_name)
+                self.compressed_variants.invalidate(name)
+            return {'new_name': new_name}, ('rename', name, new_name), move
+
+        if op == 'password':
+            self.metadata_store.set_password(name, operation.get('password') or None)
+            return {}, ('update', name, None), None
+
+        if op == 'lock':
+            limit = operation.get('limit')
+            valid = limit and str(limit).isdigit() and int(limit) > 0
+            self.metadata_store.set_visit_limit(name, int(limit) if valid else None)
+            return {}, ('update', name, None), None
+
+        if op == 'expiry':
+            self.metadata_store.set_expiry(name, expiry_time(operation.get('hours')))
+            return {}, ('update', name, None), None
+
+        raise BatchError(f"Unknown operation '{op}'.")
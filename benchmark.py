@@ -0,0 +1,375 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import quote
+from werkzeug.security import generate_password_hash
+
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+from metadata_store import open_metadata_store
+from blobstore import BlobStore
+from layout import FileLayout
+
+ADMIN_PATH = 'bench-admin'
+ADMIN_PASSWORD = 'bench'
+FILE_PASSWORD = 'secret'
+SIZES = [(1024, 'txt'), (32 * 1024, 'png'), (512 * 1024, 'jpg'), (4 * 1024 * 1024, 'mp4')]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+class Corpus:
+    def __init__(self, workdir, config, seed):
+        self.workdir = workdir
+        self.random = random.Random(seed)
+        self.metadata_store = open_metadata_store(config, 'file_metadata.json', 'cdn_files')
+        self.blob_store = BlobStore('cdn_files')
+        self.layout = FileLayout('cdn_files')
+        self.files = {'plain': [], 'password': [], 'limited': []}
+        self.count = 0
+
+    def add(self, name, size, kind):
+        with self.blob_store.writer() as writer:
+            remaining = size
+            while remaining > 0:
+                chunk = self.random.randbytes(min(remaining, 1024 * 1024))
+                writer.write(chunk)
+                remaining -= len(chunk)
+        path = self.layout.target(name)
+        digest = self.blob_store.store(writer.path, path, writer.hexdigest())
+        st = os.stat(path)
+        meta = {'visit_count': 0, 'size': st.st_size, 'mtime': st.st_mtime, 'sha256': digest}
+        if kind == 'password': meta['password'] = FILE_PASSWORD
+        if kind == 'limited': meta['visit_limit'] = 10 ** 9
+        self.metadata_store.put(name, meta)
+        self.files[kind].append((name, size))
+        self.count += 1
+
+    def generate(self, count):
+        kinds = list(self.files)
+        for i in range(count):
+            size, ext = SIZES[i % len(SIZES)]
+            self.add(f"file-{i:06d}.{ext}", size, kinds[i % len(kinds)])
+
+    def pad(self, total):
+        # Small extra entries to grow the catalog for the listing benchmark.
+        while self.count < total:
+            self.add(f"pad-{self.count:07d}.txt", 16, 'plain')
+
+    def close(self):
+        self.metadata_store.flush()
+        self.metadata_store.close()
+
+
+class Server:
+    def __init__(self, workdir, mode, workers, threads):
+        self.workdir = workdir
+        self.port = free_port()
+        self.mode, self.workers, self.threads = mode, workers, threads
+        self.process = None
+
+    def start(self):
+        with open(os.path.join(self.workdir, 'config.json'), 'r') as f:
+            config = json.load(f)
+        config['server'] = {'mode': self.mode, 'host': '127.0.0.1', 'port': self.port, 'workers': self.workers,
+                            'threads': self.threads, 'graceful_timeout': 2, 'pidfile': os.path.join(self.workdir, 'server.pid')}
+        with open(os.path.join(self.workdir, 'config.json'), 'w') as f:
+            json.dump(config, f, indent=4)
+        self.log = open(os.path.join(self.workdir, 'server.log'), 'ab')
+        self.process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, 'server.py')], cwd=self.workdir,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=1):
+                    return
+            except OSError:
+                if self.process.poll() is not None:
+                    break
+                time.sleep(0.1)
+        raise RuntimeError(f"Server did not start, see {self.workdir}/server.log")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+            self.log.close()
+            self.process = None
+
+
+class Client:
+    def __init__(self, port, cookie=None):
+        self.port = port
+        self.cookie = cookie
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie: headers['Cookie'] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            raise
+        return response, data
+
+    def login(self):
+        body = f"password={ADMIN_PASSWORD}"
+        response, _ = self.request('POST', f'/{ADMIN_PATH}', body=body, headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        self.cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+        return self.cookie
+
+
+def load(port, make_request, duration, concurrency, cookie=None):
+    latencies, errors, transferred = [], [0], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(seed):
+        client = Client(port, cookie)
+        rng = random.Random(seed)
+        local, local_errors, local_bytes = [], 0, 0
+        while time.monotonic() < deadline:
+            method, path, headers, expected = make_request(rng)
+            start = time.perf_counter()
+            try:
+                response, data = client.request(method, path, headers=headers)
+                ok = response.status in expected
+                local_bytes += len(data)
+            except (http.client.HTTPException, OSError):
+                ok = False
+            local.append(time.perf_counter() - start)
+            local_errors += not ok
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+            transferred[0] += local_bytes
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies), 'errors': errors[0], 'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'mb_per_second': round(transferred[0] / elapsed / (1024 * 1024), 2),
+    }
+
+
+def bench_files(port, corpus, args):
+    results = {}
+    for kind, query in (('plain', ''), ('password', f'?password={FILE_PASSWORD}'), ('limited', '')):
+        names = [name for name, size in corpus.files[kind] if size <= args.max_file_size]
+        make_request = lambda rng, names=names, query=query: ('GET', f"/files/{quote(rng.choice(names))}{query}", {}, (200,))
+        results[f'files_{kind}'] = load(port, make_request, args.duration, args.concurrency)
+    large = [name for name, size in corpus.files['plain'] if size >= 512 * 1024]
+
+    def range_request(rng):
+        start = rng.randrange(0, 256 * 1024)
+        return 'GET', f"/files/{quote(rng.choice(large))}", {'Range': f"bytes={start}-{start + 65535}"}, (206,)
+    results['files_range_64k'] = load(port, range_request, args.duration, args.concurrency)
+    results['files_not_modified'] = load(
+        port, lambda rng: ('GET', f"/files/{quote(rng.choice(large))}", {'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}, (304,)),
+        args.duration, args.concurrency)
+    return results
+
+
+def bench_uploads(port, cookie, args):
+    payload = random.Random(1).randbytes(args.upload_size * 1024 * 1024)
+    chunk_size = 8 * 1024 * 1024
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+    deadline = time.monotonic() + args.duration
+
+    def worker():
+        client = Client(port, cookie)
+        while time.monotonic() < deadline:
+            with lock:
+                index = next(counter)
+            start = time.perf_counter()
+            try:
+                response, data = client.request('POST', '/api/uploads', body=json.dumps(
+                    {'filename': f'upload-{index}.mp4', 'length': len(payload), 'custom_name': f'bench-upload-{os.getpid()}-{index}'}),
+                    headers={'Content-Type': 'application/json'})
+                location = response.getheader('Location')
+                for offset in range(0, len(payload), chunk_size):
+                    response, data = client.request('PATCH', location, body=payload[offset:offset + chunk_size],
+                                                    headers={'Upload-Offset': str(offset), 'Content-Type': 'application/offset+octet-stream'})
+                ok = response.status == 200
+            except (http.client.HTTPException, OSError):
+                ok = False
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                errors[0] += not ok
+
+    threads = [threading.Thread(target=worker) for _ in range(args.upload_concurrency)]
+    started = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'uploads': len(latencies), 'errors': errors[0], 'size_mb': args.upload_size, 'seconds': round(elapsed, 3),
+        'mb_per_second': round(len(latencies) * args.upload_size / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+    }
+
+
+def bench_listing(server, corpus, args):
+    results = {}
+    for size in args.catalog_sizes:
+        corpus.pad(size)
+        corpus.metadata_store.flush()
+        server.stop()
+        server.start()
+        client = Client(server.port)
+        cookie = client.login()
+        timings = {}
+        for label, path in (('page', '/api/files?sort=modified&order=desc'), ('filtered', '/api/files?status=password'),
+                            ('search', '/api/search?q=file-0001')):
+            samples = []
+            for _ in range(args.listing_repeats + 1):
+                start = time.perf_counter()
+                response, _ = client.request('GET', path)
+                samples.append(time.perf_counter() - start)
+                if response.status != 200:
+                    raise RuntimeError(f"{path} returned {response.status}")
+            timings[f'{label}_cold_ms'] = round(samples[0] * 1000, 3)
+            timings[f'{label}_p50_ms'] = round(percentile(samples[1:], 0.5) * 1000, 3)
+        results[str(size)] = timings
+    return results
+
+
+def compare(results, settings, baseline_path):
+    with open(baseline_path, 'r') as f:
+        report = json.load(f)
+    baseline = report['results']
+    print(f"\nChange against {baseline_path}:")
+    if report.get('settings', {}).get('admission', False) != settings['admission']:
+        print("  Warning: rate limiting was on in one run and off in the other; the numbers are not comparable.")
+    for group, scenarios in results.items():
+        for scenario, values in scenarios.items():
+            before_values = baseline.get(group, {}).get(scenario) or {}
+            for metric, value in values.items():
+                before = before_values.get(metric)
+                if metric in ('requests_per_second', 'mb_per_second') or metric.endswith('_ms'):
+                    if isinstance(value, (int, float)) and before:
+                        print(f"  {group}.{scenario}.{metric}: {before} -> {value} ({(value - before) / before * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a local content delivery node against a generated corpus.")
+    parser.add_argument('--files', type=int, default=200, help="number of files in the generated corpus")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per load scenario")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mode', choices=('production', 'development'), default='production')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--max-file-size', type=int, default=4 * 1024 * 1024, help="largest file fetched in full by the /files scenarios")
+    parser.add_argument('--upload-size', type=int, default=16, help="upload size in MB")
+    parser.add_argument('--upload-concurrency', type=int, default=3)
+    parser.add_argument('--catalog-sizes', type=lambda value: [int(v) for v in value.split(',')], default=[1000, 10000])
+    parser.add_argument('--listing-repeats', type=int, default=20)
+    parser.add_argument('--skip', default='', help="comma separated groups to skip: files,uploads,listing")
+    parser.add_argument('--workdir', help="directory for the corpus (default: a new temporary directory)")
+    parser.add_argument('--keep', action='store_true', help="keep the temporary corpus directory afterwards")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="print the change against an earlier results file")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--admission', action='store_true',
+                        help="keep rate limits on; every request comes from 127.0.0.1, so most would get 429")
+    args = parser.parse_args()
+    skip = set(filter(None, args.skip.split(',')))
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='cdn-bench-'))
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    for folder in ('templates', 'static'):
+        if not os.path.exists(folder):
+            os.symlink(os.path.join(REPO_DIR, folder), folder)
+    config = {'password_hash': generate_password_hash(ADMIN_PASSWORD), 'secret_key': os.urandom(24).hex(), 'admin_path': ADMIN_PATH}
+    if os.path.exists('config.json'):
+        with open('config.json', 'r') as f:
+            config.update(json.load(f))
+        config['password_hash'] = generate_password_hash(ADMIN_PASSWORD)
+    config['admission'] = {**config.get('admission', {}), 'enabled': args.admission}
+    with open('config.json', 'w') as f:
+        json.dump(config, f, indent=4)
+    print(f"Generating {args.files} files in {workdir}...")
+    corpus = Corpus(workdir, config, args.seed)
+    corpus.generate(args.files)
+    corpus.metadata_store.flush()
+
+    server = Server(workdir, args.mode, args.workers, args.threads)
+    results = {}
+    try:
+        server.start()
+        if 'files' not in skip:
+            print("Benchmarking /files...")
+            results['files'] = bench_files(server.port, corpus, args)
+        if 'uploads' not in skip:
+            print("Benchmarking uploads...")
+            results['uploads'] = {'resumable': bench_uploads(server.port, Client(server.port).login(), args)}
+        if 'listing' not in skip:
+            print("Benchmarking listing...")
+            results['listing'] = bench_listing(server, corpus, args)
+    finally:
+        server.stop()
+        corpus.close()
+
+    report = {
+        'version': git_version(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'workdir', 'keep')},
+        'workdir': workdir, 'results': results,
+    }
+    print(json.dumps(report, indent=2))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if baseline:
+        compare(results, report['settings'], baseline)
+    if not args.workdir and not args.keep:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
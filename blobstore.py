@@ -0,0 +1,159 @@
+import os
+import time
+import uuid
+import hashlib
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class HashingWriter:
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self._file = open(path, 'wb')
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BlobStore:
+    # Every stored file is a hard link to .blobs/<ab>/<sha256>, so the link
+    # count doubles as the reference count of a blob.
+    def __init__(self, upload_folder, tmp_ttl=24 * 3600):
+        self.upload_folder = upload_folder
+        self.blob_dir = os.path.join(upload_folder, '.blobs')
+        self.tmp_dir = os.path.join(self.blob_dir, 'tmp')
+        self.tmp_ttl = tmp_ttl
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def temp_path(self):
+        return os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.tmp")
+
+    def writer(self, path=None):
+        return HashingWriter(path or self.temp_path())
+
+    def hash_file(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def store(self, tmp_path, final_path, digest=None):
+        digest = digest or self.hash_file(tmp_path)
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        while True:
+            try:
+                os.link(tmp_path, blob)
+            except FileExistsError:
+                link_path = f"{tmp_path}.link"
+                try:
+                    os.link(blob, link_path)
+                except FileNotFoundError:
+                    continue  # the blob was released in between; store ours instead
+                os.replace(link_path, final_path)
+                os.remove(tmp_path)
+                return digest
+            except OSError as e:
+                if isinstance(e, FileNotFoundError) and not os.path.exists(tmp_path):
+                    raise
+                print(f"Could not link {final_path} into the blob store, storing it as a plain file: {e}")
+            os.replace(tmp_path, final_path)
+            return digest
+
+    def adopt(self, path):
+        digest = self.hash_file(path)
+        blob = self.blob_path(digest)
+        try:
+            if os.path.samestat(os.stat(path), os.stat(blob)):
+                return digest
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        while True:
+            try:
+                os.link(path, blob)
+                return digest
+            except FileExistsError:
+                pass
+            tmp_path = self.temp_path()
+            try:
+                os.link(blob, tmp_path)
+            except FileNotFoundError:
+                continue
+            os.replace(tmp_path, path)
+            return digest
+
+    def verified(self, path, digest):
+        if not digest:
+            return None
+        try:
+            return digest if os.path.samestat(os.stat(path), os.stat(self.blob_path(digest))) else None
+        except FileNotFoundError:
+            return None
+
+    def release(self, digest):
+        if not digest:
+            return
+        blob = self.blob_path(digest)
+        try:
+            if os.stat(blob).st_nlink <= 1:
+                os.remove(blob)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, path, digest):
+        os.remove(path)
+        self.release(digest)
+
+    def gc(self):
+        removed = 0
+        cutoff = time.time() - self.tmp_ttl
+        for entry in os.scandir(self.tmp_dir):
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        for shard in os.scandir(self.blob_dir):
+            if shard.name == 'tmp' or not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.stat().st_nlink <= 1:
+                    os.remove(entry.path)
+                    removed += 1
+        return removed
+
+
+if __name__ == '__main__':
+    import json
+    from metadata_store import open_metadata_store
+    from layout import FileLayout
+
+    with open('config.json', 'r') as f:
+        config = json.load(f)
+    metadata_store = open_metadata_store(config, 'file_metadata.json', 'cdn_files')
+    blob_store = BlobStore('cdn_files')
+    adopted = 0
+    for name, path in FileLayout('cdn_files').files():
+        metadata_store.update(name, sha256=blob_store.adopt(path))
+        adopted += 1
+    print(f"Stored {adopted} files in the blob store, removed {blob_store.gc()} unused blobs.")
+    metadata_store.close()
@@ -0,0 +1,87 @@
+import os
+import asyncio
+import aiohttp
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class IngestJob:
+    def __init__(self, attachment, filename, file_meta):
+        self.attachment = attachment
+        self.filename = filename
+        self.file_meta = file_meta
+        self.received = 0
+        self.status = 'queued'
+        self.error = None
+
+    def describe(self):
+        size = self.attachment.size or 0
+        if self.status == 'downloading' and size:
+            return f"⏳ {self.filename}: {self.received * 100 // size}% of {size / (1024 * 1024):.1f} MB"
+        if self.status == 'done':
+            return f"✅ {self.filename}"
+        if self.status == 'failed':
+            return f"❌ {self.attachment.filename}: {self.error}"
+        return f"🕓 {self.filename}: {self.status}"
+
+
+class AttachmentIngest:
+    # Attachments are streamed from Discord's CDN straight into blob store
+    # temp files, so memory use is bounded by concurrency * CHUNK_SIZE.
+    def __init__(self, storage, blob_store, max_size, concurrency=3):
+        self.storage = storage
+        self.blob_store = blob_store
+        self.max_size = max_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+
+    async def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=60))
+        return self._session
+
+    async def ingest(self, jobs, on_progress=None):
+        await asyncio.gather(*(self._run(job, on_progress) for job in jobs))
+        return jobs
+
+    async def _run(self, job, on_progress):
+        async with self.semaphore:
+            try:
+                await self._download(job, on_progress)
+                job.status = 'done'
+            except Exception as e:
+                job.status, job.error = 'failed', e
+        if on_progress is not None:
+            await on_progress()
+
+    async def _download(self, job, on_progress):
+        if (job.attachment.size or 0) > self.max_size:
+            raise ValueError(f"larger than {self.max_size // (1024 * 1024)} MB")
+        job.status = 'downloading'
+        if on_progress is not None:
+            await on_progress()
+        writer = await self.storage.run(self.blob_store.writer)
+        try:
+            session = await self.session()
+            async with session.get(job.attachment.url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    if writer.size + len(chunk) > self.max_size:
+                        raise ValueError(f"larger than {self.max_size // (1024 * 1024)} MB")
+                    await self.storage.run(writer.write, chunk)
+                    job.received = writer.size
+                    if on_progress is not None:
+                        await on_progress()
+            await self.storage.run(writer.close)
+            job.status = 'saving'
+            await self.storage.add_upload(writer.path, job.filename, writer.hexdigest(), job.file_meta)
+        except BaseException:
+            await self.storage.run(writer.close)
+            if os.path.exists(writer.path):
+                await self.storage.run(os.remove, writer.path)
+            raise
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from batch import BatchOperations
+from delivery import StaticFile
+
+
+class AsyncStorage:
+    # Filesystem and catalog work for the bot runs on a small thread pool so
+    # the gateway heartbeat never waits on the disk. Writes are queued and
+    # applied in batches, one catalog transaction per batch.
+    def __init__(self, layout, metadata_store, blob_store, compressed_variants, change_feed,
+                 file_index, search_index, max_workers=4, max_batch=64, video_variants=None):
+        self.layout = layout
+        self.metadata_store = metadata_store
+        self.blob_store = blob_store
+        self.compressed_variants = compressed_variants
+        self.change_feed = change_feed
+        self.file_index = file_index
+        self.search_index = search_index
+        self.video_variants = video_variants
+        self.max_batch = max_batch
+        self.batch_operations = BatchOperations(layout, metadata_store, blob_store, compressed_variants, change_feed)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bot-storage')
+        self._writes = None
+        self._writer = None
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _write(self, op):
+        if self._writes is None:
+            self._writes = asyncio.Queue()
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._drain())
+        future = asyncio.get_running_loop().create_future()
+        await self._writes.put((op, future))
+        return await future
+
+    async def _drain(self):
+        while True:
+            batch = [await self._writes.get()]
+            while not self._writes.empty() and len(batch) < self.max_batch:
+                batch.append(self._writes.get_nowait())
+            try:
+                results = await self.run(self._apply, [op for op, _ in batch])
+            except Exception as e:
+                results = [(None, e)] * len(batch)
+            for (_, future), (result, error) in zip(batch, results):
+                if future.done():
+                    continue
+                if error is not None: future.set_exception(error)
+                else: future.set_result(result)
+
+    def _apply(self, ops):
+        results, events = [], []
+        with self.layout.writing(), self.metadata_store.batch():
+            for op in ops:
+                try:
+                    result, op_events = op()
+                    results.append((result, None))
+                    events.extend(op_events)
+                except Exception as e:
+                    results.append((None, e))
+        self.change_feed.publish_many(events)
+        return results
+
+    async def file_names(self, query=None, limit=25):
+        def names():
+            if not os.path.isdir(self.layout.root):
+                return None
+            if query:
+                return self.search_index.search(query, limit=limit)
+            return [item['name'] for item in self.file_index.page(sort='name', descending=False, limit=limit)['items']]
+        return await self.run(names)
+
+    async def get(self, name):
+        return await self.run(self.metadata_store.get, name)
+
+    async def exists(self, name):
+        return await self.run(self.layout.exists, name)
+
+    async def rename(self, old_name, new_name):
+        def op():
+            if self.layout.exists(new_name):
+                raise FileExistsError(f"A file named '{new_name}' already exists.")
+            self.layout.rename(old_name, new_name)
+            self.metadata_store.rename(old_name, new_name)
+            self.compressed_variants.invalidate(old_name)
+            return True, [('rename', old_name, new_name)]
+        return await self._write(op)
+
+    async def delete(self, name):
+        def op():
+            path = self.layout.locate(name)
+            if path is None:
+                return False, []
+            self.blob_store.remove(path, (self.metadata_store.get(name) or {}).get('sha256'))
+            self.metadata_store.delete(name)
+            self.compressed_variants.invalidate(name)
+            return True, [('delete', name)]
+        return await self._write(op)
+
+    async def set_password(self, name, password):
+        def op():
+            return self.metadata_store.set_password(name, password), [('update', name)]
+        return await self._write(op)
+
+    async def set_visit_limit(self, name, limit):
+        def op():
+            return self.metadata_store.set_visit_limit(name, limit), [('update', name)]
+        return await self._write(op)
+
+    async def set_expiry(self, name, expires_at):
+        def op():
+            return self.metadata_store.set_expiry(name, expires_at), [('update', name)]
+        return await self._write(op)
+
+    async def batch(self, operations):
+        return await self.run(self.batch_operations.apply, operations)
+
+    async def add_upload(self, tmp_path, name, digest, file_meta):
+        def op():
+            if self.layout.exists(name):
+                os.remove(tmp_path)
+                raise FileExistsError(f"A file named '{name}' already exists.")
+            path = self.layout.target(name)
+            digest_stored = self.blob_store.store(tmp_path, path, digest)
+            self.metadata_store.put(name, {**file_meta, 'size': os.path.getsize(path), 'mtime': time.time(),
+                                           'sha256': digest_stored})
+            if self.video_variants is not None:
+                self.video_variants.process(StaticFile(path, digest=digest_stored), name)
+            return name, [('upload', name)]
+        return await self._write(op)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+
+
+HALVE = bytes(i >> 1 for i in range(256))
+
+
+class FrequencySketch:
+    def __init__(self, width=4096, depth=4):
+        self.width = width
+        self.depth = depth
+        self._rows = [bytearray(width) for _ in range(depth)]
+        self._additions = 0
+        self._reset_at = width * 10
+
+    def _indexes(self, item):
+        h = hash(item)
+        for i in range(self.depth):
+            yield (h ^ (h >> (7 * i + 3)) ^ (0x9E3779B1 * (i + 1))) % self.width
+
+    def increment(self, item):
+        for row, index in zip(self._rows, self._indexes(item)):
+            if row[index] < 15:
+                row[index] += 1
+        self._additions += 1
+        if self._additions >= self._reset_at:
+            for row in self._rows:
+                row[:] = row.translate(HALVE)
+            self._additions //= 2
+
+    def estimate(self, item):
+        return min(row[index] for row, index in zip(self._rows, self._indexes(item)))
+
+
+class ByteCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_item_bytes=1024 * 1024, policy='tinylfu'):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.policy = policy
+        self.sketch = FrequencySketch() if policy == 'tinylfu' else None
+        self._entries = OrderedDict()
+        self._keys_by_name = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def get(self, key):
+        with self._lock:
+            if self.sketch is not None:
+                self.sketch.increment(key[0])
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_item_bytes or len(data) > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                return True
+            old_key = self._keys_by_name.get(key[0], {}).get(key[1])
+            if old_key is not None:
+                self._remove(old_key)
+            victims = []
+            freed = 0
+            for victim in self._entries:
+                if self.size - freed + len(data) <= self.max_bytes:
+                    break
+                victims.append(victim)
+                freed += len(self._entries[victim])
+            # TinyLFU admission: only displace entries that are requested
+            # less often than the candidate.
+            if victims and self.sketch is not None:
+                candidate = self.sketch.estimate(key[0])
+                if any(self.sketch.estimate(victim[0]) >= candidate for victim in victims):
+                    self.rejections += 1
+                    return False
+            for victim in victims:
+                self._remove(victim)
+                self.evictions += 1
+            self._entries[key] = data
+            self._keys_by_name.setdefault(key[0], {})[key[1]] = key
+            self.size += len(data)
+            return True
+
+    def _remove(self, key):
+        data = self._entries.pop(key, None)
+        if data is not None:
+            self.size -= len(data)
+        variants = self._keys_by_name.get(key[0], {})
+        if variants.get(key[1]) == key:
+            del variants[key[1]]
+            if not variants:
+                del self._keys_by_name[key[0]]
+
+    def load(self, static_file, name):
+        if static_file.size > self.max_item_bytes:
+            return
+        st = static_file.stat
+        key = (name, static_file.variant, st.st_ino, st.st_mtime_ns, st.st_size)
+        data = self.get(key)
+        if data is None:
+            with open(static_file.path, 'rb') as f:
+                data = f.read()
+            if len(data) != st.st_size:
+                return
+            self.put(key, data)
+        static_file.data = data
+
+    def invalidate(self, name):
+        with self._lock:
+            for key in list(self._keys_by_name.get(name, {}).values()):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_name.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'policy': self.policy, 'items': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'rejections': self.rejections,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,194 @@
+import os
+import gzip
+import shutil
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIBLE_TYPES = {'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'}
+CHUNK_SIZE = 256 * 1024
+
+
+def is_compressible(mimetype):
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+def available_encodings():
+    encodings = []
+    if brotli is not None: encodings.append('br')
+    if zstandard is not None: encodings.append('zstd')
+    encodings.append('gzip')
+    return encodings
+
+
+class Unchanged(Exception):
+    # Raised by a build when the source is already what was asked for.
+    pass
+
+
+class VariantCache:
+    # Derived copies of a file live in <cache_dir>/<hash of name>/<etag>.<suffix>;
+    # a new etag replaces the old variants, and the whole cache is kept under
+    # max_bytes by evicting the least recently used files.
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._building = {}
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total = self.size()
+
+    def _key_dir(self, name):
+        return os.path.join(self.cache_dir, hashlib.sha256(name.encode('utf-8')).hexdigest()[:32])
+
+    def _cached(self, name, etag, suffix, build):
+        key_dir = self._key_dir(name)
+        variant_path = os.path.join(key_dir, f"{etag}.{suffix}")
+        if os.path.exists(variant_path):
+            os.utime(variant_path)
+            with self._lock:
+                self.hits += 1
+            return variant_path
+        with self._lock:
+            self.misses += 1
+            build_lock = self._building.setdefault(variant_path, threading.Lock())
+        with build_lock:
+            if not os.path.exists(variant_path):
+                self._store(key_dir, etag, variant_path, build)
+        with self._lock:
+            self._building.pop(variant_path, None)
+        return variant_path
+
+    def _store(self, key_dir, etag, variant_path, build):
+        os.makedirs(key_dir, exist_ok=True)
+        for entry in os.scandir(key_dir):
+            if not entry.name.startswith(f"{etag}."):
+                self._remove(entry.path)
+        tmp_path = f"{variant_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            build(tmp_path)
+            os.replace(tmp_path, variant_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._total += os.path.getsize(variant_path)
+        if self._total > self.max_bytes:
+            self._evict()
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._total -= size
+
+    def _evict(self):
+        entries = []
+        for key_dir in os.scandir(self.cache_dir):
+            if not key_dir.is_dir():
+                continue
+            for entry in os.scandir(key_dir.path):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            total -= size
+            self._remove(path)
+        with self._lock:
+            self._total = total
+
+    def size(self):
+        # Every process shares the directory but only counts its own builds
+        # in _total, so this re-reads it from the disk.
+        total = 0
+        for key_dir in os.scandir(self.cache_dir):
+            if not key_dir.is_dir():
+                continue
+            for entry in os.scandir(key_dir.path):
+                try:
+                    total += entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._total = total
+        return total
+
+    def stats(self):
+        return {'bytes': self._total, 'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def invalidate(self, name):
+        key_dir = self._key_dir(name)
+        if os.path.isdir(key_dir):
+            for entry in os.scandir(key_dir):
+                self._remove(entry.path)
+            shutil.rmtree(key_dir, ignore_errors=True)
+
+
+class CompressedVariants(VariantCache):
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024, min_size=256, max_source_size=64 * 1024 * 1024):
+        super().__init__(cache_dir, max_bytes)
+        self.min_size = min_size
+        self.max_source_size = max_source_size
+        self.encodings = available_encodings()
+
+    def negotiate(self, request):
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = request.accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def select(self, static_file, name, request):
+        if not is_compressible(static_file.mimetype):
+            return static_file
+        static_file.vary = 'Accept-Encoding'
+        if not self.min_size <= static_file.size <= self.max_source_size:
+            return static_file
+        encoding = self.negotiate(request)
+        if encoding is None:
+            return static_file
+        try:
+            variant_path = self._variant(static_file, name, encoding)
+        except OSError as e:
+            print(f"Failed to build {encoding} variant of {name}: {e}")
+            return static_file
+        return static_file.encoded(variant_path, encoding)
+
+    def _variant(self, static_file, name, encoding):
+        return self._cached(name, static_file.etag, encoding,
+                            lambda tmp_path: self._compress(static_file.path, tmp_path, encoding))
+
+    def _compress(self, source_path, tmp_path, encoding):
+        with open(source_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            if encoding == 'gzip':
+                with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=6, mtime=0) as gz:
+                    shutil.copyfileobj(src, gz, CHUNK_SIZE)
+            elif encoding == 'br':
+                compressor = brotli.Compressor(quality=9)
+                while chunk := src.read(CHUNK_SIZE):
+                    dst.write(compressor.process(chunk))
+                dst.write(compressor.finish())
+            elif encoding == 'zstd':
+                zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
@@ -0,0 +1,148 @@
+import os
+import fcntl
+import threading
+
+
+class VisitCounters:
+    def __init__(self, path, compact_bytes=1024 * 1024):
+        self.path = path
+        self.compact_bytes = compact_bytes
+        self.created = not os.path.exists(path)
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._fd = None
+        self._ino = None
+        self._offset = 0
+        self._compacted_size = 0
+        with self._lock:
+            self._open()
+            self._sync()
+
+    def _open(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._ino = os.fstat(self._fd).st_ino
+        self._offset = 0
+
+    def _replaced(self):
+        try:
+            return os.stat(self.path).st_ino != self._ino
+        except FileNotFoundError:
+            return True
+
+    def _sync(self, locked=False):
+        # Counts are rebuilt off to the side after a compaction so lock-free
+        # readers never observe a partially replayed table.
+        counts = self._counts
+        if self._replaced():
+            self._open()
+            counts = {}
+        size = os.fstat(self._fd).st_size
+        if size > self._offset:
+            data = os.pread(self._fd, size - self._offset, self._offset)
+            end = data.rfind(b'\n') + 1
+            for line in data[:end].decode('utf-8').splitlines():
+                self._apply(counts, line)
+            self._offset += end
+            if locked and end < len(data):
+                os.ftruncate(self._fd, self._offset)
+        self._counts = counts
+
+    def _apply(self, counts, line):
+        op, _, rest = line.partition('\t')
+        if op == '+':
+            counts[rest] = counts.get(rest, 0) + 1
+        elif op == '=':
+            value, _, name = rest.partition('\t')
+            counts[name] = int(value)
+        elif op == '-':
+            counts.pop(rest, None)
+
+    def _write(self, *lines):
+        data = ''.join(f"{line}\n" for line in lines).encode('utf-8')
+        os.write(self._fd, data)
+        for line in lines:
+            self._apply(self._counts, line)
+        self._offset += len(data)
+
+    def _exclusive(self):
+        while True:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            if not self._replaced():
+                return
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._sync()
+
+    def _mutate(self, *lines):
+        with self._lock:
+            self._exclusive()
+            try:
+                self._sync(locked=True)
+                self._write(*lines)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _try_sync(self):
+        if self._lock.acquire(blocking=False):
+            try:
+                self._sync()
+            finally:
+                self._lock.release()
+
+    def get(self, name):
+        self._try_sync()
+        return self._counts.get(name, 0)
+
+    def snapshot(self):
+        self._try_sync()
+        return dict(self._counts)
+
+    def hit(self, name, limit=None):
+        with self._lock:
+            self._exclusive()
+            try:
+                self._sync(locked=True)
+                if limit is not None and self._counts.get(name, 0) >= limit:
+                    return False
+                self._write(f"+\t{name}")
+                if self._offset >= max(self.compact_bytes, 2 * self._compacted_size):
+                    self._compact()
+                return True
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def set(self, name, value):
+        self._mutate(f"=\t{int(value)}\t{name}")
+
+    def discard(self, name):
+        self._mutate(f"-\t{name}")
+
+    def rename(self, old_name, new_name):
+        with self._lock:
+            self._exclusive()
+            try:
+                self._sync(locked=True)
+                if old_name in self._counts:
+                    self._write(f"=\t{self._counts[old_name]}\t{new_name}", f"-\t{old_name}")
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _compact(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for name, count in self._counts.items():
+                f.write(f"=\t{count}\t{name}\n")
+            f.flush()
+            os.fsync(f.fileno())
+            self._compacted_size = f.tell()
+        os.replace(tmp_path, self.path)
+
+    def compact(self):
+        with self._lock:
+            self._exclusive()
+            try:
+                self._sync(locked=True)
+                self._compact()
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
@@ -0,0 +1,203 @@
+import io
+import os
+import uuid
+import mimetypes
+from datetime import datetime, timezone
+from flask import Response
+from werkzeug.wsgi import ClosingIterator
+
+
+CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 16
+
+
+class StaticFile:
+    def __init__(self, path, mimetype=None, digest=None):
+        self.path = path
+        self.stat = os.stat(path)
+        self.size = self.stat.st_size
+        self.etag = f"sha256-{digest}" if digest else f"{self.stat.st_ino:x}-{self.stat.st_mtime_ns:x}-{self.size:x}"
+        self.last_modified = datetime.fromtimestamp(int(self.stat.st_mtime), tz=timezone.utc)
+        self.mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.content_encoding = None
+        self.variant = None
+        self.vary = None
+        self.data = None
+
+    def encoded(self, path, encoding):
+        variant = StaticFile(path, mimetype=self.mimetype)
+        variant.etag = f"{self.etag}-{encoding}"
+        variant.last_modified = self.last_modified
+        variant.content_encoding = encoding
+        variant.variant = encoding
+        variant.vary = self.vary
+        return variant
+
+    def derived(self, path, mimetype, variant_name):
+        variant = StaticFile(path, mimetype=mimetype)
+        variant.etag = f"{self.etag}-{variant_name}"
+        variant.last_modified = self.last_modified
+        variant.variant = variant_name
+        return variant
+
+    def not_modified(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(self.etag)
+        return request.if_modified_since is not None and request.if_modified_since >= self.last_modified
+
+    def requested_ranges(self, request):
+        if request.method not in ('GET', 'HEAD') or request.range is None or request.range.units != 'bytes':
+            return None
+        if_range = request.if_range
+        if if_range.etag is not None and if_range.etag != self.etag:
+            return None
+        if if_range.date is not None and if_range.date < self.last_modified:
+            return None
+        ranges = []
+        for start, stop in request.range.ranges:
+            if start < 0:
+                start, stop = max(self.size + start, 0), self.size
+            stop = self.size if stop is None else min(stop, self.size)
+            if start < stop:
+                ranges.append((start, stop))
+        ranges.sort()
+        merged = []
+        for start, stop in ranges:
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+            else:
+                merged.append((start, stop))
+        if len(merged) > MAX_RANGES:
+            return None
+        return merged
+
+    def is_new_visit(self, request):
+        # Only a request for the whole file counts; players probe with small
+        # ranges from byte 0 (bytes=0-1) before fetching the rest.
+        if self.not_modified(request):
+            return False
+        ranges = self.requested_ranges(request)
+        return ranges is None or ranges == [(0, self.size)]
+
+    def transfer_size(self, request):
+        # Body bytes a GET would send, leaving out multipart part headers.
+        if self.not_modified(request):
+            return 0
+        ranges = self.requested_ranges(request)
+        return self.size if ranges is None else sum(stop - start for start, stop in ranges)
+
+    # on_close, if given, runs once the server is done sending the body.
+    def response(self, request, cache_control='no-cache', on_close=None):
+        headers = {
+            'ETag': f'"{self.etag}"',
+            'Last-Modified': self.last_modified.strftime('%a, %d %b %Y %H:%M:%S GMT'),
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': cache_control,
+        }
+        if self.vary:
+            headers['Vary'] = self.vary
+        if self.content_encoding:
+            headers['Content-Encoding'] = self.content_encoding
+        if self.not_modified(request):
+            return _closing(Response(status=304, headers=headers), on_close)
+
+        ranges = self.requested_ranges(request)
+        if ranges == []:
+            headers['Content-Range'] = f"bytes */{self.size}"
+            return _closing(Response(status=416, headers=headers), on_close)
+        if ranges is None:
+            ranges = [(0, self.size)]
+
+        if len(ranges) == 1:
+            start, stop = ranges[0]
+            status = 200 if (start, stop) == (0, self.size) else 206
+            if status == 206:
+                headers['Content-Range'] = f"bytes {start}-{stop - 1}/{self.size}"
+            headers['Content-Length'] = str(stop - start)
+            body = self._file_body(request.environ, start, stop, on_close)
+            return _closing(Response(body, status=status, headers=headers, mimetype=self.mimetype,
+                                     direct_passthrough=True), on_close if body is None else None)
+
+        boundary = uuid.uuid4().hex
+        parts = [
+            (f"\r\n--{boundary}\r\nContent-Type: {self.mimetype}\r\n"
+             f"Content-Range: bytes {start}-{stop - 1}/{self.size}\r\n\r\n").encode('ascii')
+            for start, stop in ranges
+        ]
+        trailer = f"\r\n--{boundary}--\r\n".encode('ascii')
+        headers['Content-Length'] = str(sum(len(p) for p in parts) + sum(stop - start for start, stop in ranges) + len(trailer))
+        body = None
+        if request.method != 'HEAD':
+            body = self._multipart_body(ranges, parts, trailer)
+            body = ClosingIterator(body, on_close) if on_close else body
+        return _closing(Response(body, status=206, headers=headers, direct_passthrough=True,
+                                 content_type=f"multipart/byteranges; boundary={boundary}"),
+                        on_close if body is None else None)
+
+    def _file_body(self, environ, start, stop, on_close=None):
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return None
+        if self.data is not None:
+            return ClosingIterator([self.data[start:stop]], on_close) if on_close else [self.data[start:stop]]
+        f = _File(self.path, on_close) if on_close else open(self.path, 'rb')
+        f.seek(start)
+        # The server's file wrapper hands the descriptor to os.sendfile
+        # (gunicorn does), bounded by Content-Length. Werkzeug's wrapper
+        # streams to EOF, so it is only safe when the range ends there.
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper and (stop == self.size or environ.get('SERVER_SOFTWARE', '').startswith('gunicorn')):
+            return file_wrapper(f, CHUNK_SIZE)
+        # Closed from outside too, in case the server never starts the generator.
+        return ClosingIterator(_read_range(f, start, stop), f.close)
+
+    def _multipart_body(self, ranges, parts, trailer):
+        if self.data is not None:
+            for (start, stop), part in zip(ranges, parts):
+                yield part
+                yield self.data[start:stop]
+            yield trailer
+            return
+        with open(self.path, 'rb') as f:
+            for (start, stop), part in zip(ranges, parts):
+                yield part
+                f.seek(start)
+                yield from _read_range(f, start, stop, close=False)
+            yield trailer
+
+
+class _File(io.BufferedReader):
+    # A file wrapper body is handed to the server as is, so closing the file
+    # is the only sign that it has been sent.
+    def __init__(self, path, on_close):
+        super().__init__(io.FileIO(path, 'rb'), CHUNK_SIZE)
+        self._on_close = on_close
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()
+        finally:
+            self._on_close()
+
+
+def _closing(response, on_close):
+    if on_close:
+        response.call_on_close(on_close)
+    return response
+
+
+def _read_range(f, start, stop, close=True):
+    try:
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        if close:
+            f.close()
@@ -1,40 +1,94 @@
 import discord
 import os
+import atexit
 import json
 import uuid
 import re
+import time
 from discord import app_commands
 from discord.ui import View, Select, Button, Modal, TextInput
+from metadata_store import open_metadata_store
+from compression import CompressedVariants
+from video import VideoVariants
+from events import ChangeFeed
+from listing import FileIndex
+from search import SearchIndex
+from blobstore import BlobStore
+from layout import FileLayout
+from bot_storage import AsyncStorage
+from bot_ingest import AttachmentIngest, IngestJob
+from metrics import Metrics
+from profiler import Sampler
+from maintenance import expiry_time
+from tokens import DownloadTokens, ensure_secret_key
+from accesslog import AccessLog
 
 CONFIG_FILE = 'config.json'
 METADATA_FILE = 'file_metadata.json'
+EVENTS_FILE = 'cdn_events.log'
 UPLOAD_FOLDER = 'cdn_files'
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'webm'}
+MAX_UPLOAD_SIZE = 500 * 1024 * 1024
+MAX_BULK_FILES = 25
+PROGRESS_INTERVAL = 1.5
+MESSAGE_LINK = re.compile(r'https://(?:\w+\.)?discord(?:app)?\.com/channels/(?:\d+|@me)/(\d+)/(\d+)')
 
 def load_config():
     try:
-        with open(CONFIG_FILE, 'r') as f: return json.load(f)
+        with open(CONFIG_FILE, 'r') as f: return ensure_secret_key(json.load(f), CONFIG_FILE)
     except FileNotFoundError:
         print(f"[Bot] Error: {CONFIG_FILE} not found. Run the web app first.")
         exit()
 
-def load_metadata():
-    if not os.path.exists(METADATA_FILE): return {}
-    try:
-        with open(METADATA_FILE, 'r') as f: return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError): return {}
-
-def save_metadata(data):
-    with open(METADATA_FILE, 'w') as f: json.dump(data, f, indent=4)
-
 config = load_config()
+metadata_store = open_metadata_store(config, METADATA_FILE, UPLOAD_FOLDER)
+atexit.register(metadata_store.close)
+compressed_variants = CompressedVariants(config.get('compression', {}).get('cache_dir', 'cdn_cache/compressed'))
+video_config = config.get('video', {})
+video_variants = VideoVariants(
+    video_config.get('cache_dir', 'cdn_cache/video'),
+    max_bytes=video_config.get('max_bytes', 4 * 1024 * 1024 * 1024),
+    workers=video_config.get('workers', 1),
+    faststart=video_config.get('faststart', True),
+    hls=video_config.get('hls', True),
+    segment_seconds=video_config.get('segment_seconds', 6),
+)
+atexit.register(video_variants.close)
+change_feed = ChangeFeed(EVENTS_FILE)
+blob_store = BlobStore(UPLOAD_FOLDER)
+layout = FileLayout(UPLOAD_FOLDER)
+file_index = FileIndex(layout, rescan_interval=config.get('listing_rescan_interval', 300), metadata_store=metadata_store)
+search_index = SearchIndex(file_index, metadata_store)
+change_feed.subscribe(file_index.on_change)
+change_feed.subscribe(search_index.on_change)
+profiling_config = config.get('profiling', {})
+change_feed.subscribe(Sampler(profiling_config.get('dir', 'cdn_profiles'), 'bot',
+                              interval=1 / profiling_config.get('sample_hz', 100),
+                              max_seconds=profiling_config.get('max_seconds', 60)).on_change)
+metrics = Metrics(config.get('metrics', {}).get('dir', 'cdn_metrics'), 'bot', interval=config.get('metrics', {}).get('interval', 5))
+metrics.time_methods(metadata_store, 'cdn_metadata_operation_seconds',
+                     ('get', 'all', 'put', 'update', 'rename', 'delete', 'record_visit', 'flush', '_reload'))
+metrics.start()
+atexit.register(metrics.close)
+storage = AsyncStorage(layout, metadata_store, blob_store, compressed_variants, change_feed, file_index, search_index,
+                       max_workers=config.get('bot_storage_threads', 4), video_variants=video_variants)
+atexit.register(storage.close)
+attachment_ingest = AttachmentIngest(storage, blob_store, MAX_UPLOAD_SIZE, concurrency=config.get('bot_ingest_concurrency', 3))
 TOKEN = config.get('discord_bot_token')
 BASE_URL = config.get('base_url')
 AUTHORIZED_USER_IDS = set(config.get('authorized_user_ids', []))
 
-if not TOKEN or not BASE_URL:
-    print("[Bot] Error: 'discord_bot_token' or 'base_url' missing from config.")
+if not TOKEN or not BASE_URL or not config.get('secret_key'):
+    print("[Bot] Error: 'discord_bot_token', 'base_url' or 'secret_key' missing from config.")
     exit()
+download_tokens = DownloadTokens(
+    config['secret_key'],
+    default_ttl=config.get('tokens', {}).get('default_ttl_hours', 24) * 3600,
+    max_ttl=config.get('tokens', {}).get('max_ttl_hours', 720) * 3600,
+)
+access_log = None
+if config.get('access_log', {}).get('enabled', True):
+    access_log = AccessLog(config.get('access_log', {}).get('dir', 'cdn_access'), config['secret_key'])
 
 def is_authorized():
     return app_commands.check(lambda i: str(i.user.id) in AUTHORIZED_USER_IDS)
@@ -45,8 +99,69 @@ def allowed_file(filename):
 def sanitize_filename(name: str) -> str:
     return re.sub(r'[^a-zA-Z0-9_-]', '', name)
 
+def upload_options(password, visit_limit, expires_in_hours=None):
+    file_meta = {'visit_count': 0}
+    if password: file_meta['password'] = password
+    if visit_limit and visit_limit > 0: file_meta['visit_limit'] = visit_limit
+    if expires_at := expiry_time(expires_in_hours): file_meta['expires_at'] = expires_at
+    return file_meta
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+def describe_stats(file_stats):
+    return (f"`{file_stats['name']}`: {file_stats['hits']} requests, {format_bytes(file_stats['bytes'])} sent, "
+            f"{file_stats['clients']} clients, {file_stats['not_modified_ratio']:.0%} 304s, "
+            f"{file_stats['range_ratio']:.0%} ranges, last <t:{int(file_stats['last_seen'])}:R>")
+
+def ingest_report(jobs):
+    if len(jobs) == 1 and jobs[0].status == 'done':
+        return f"Success! File uploaded.\nYour link: {BASE_URL}/files/{jobs[0].filename}"
+    finished = sum(job.status in ('done', 'failed') for job in jobs)
+    lines = [f"Uploaded {sum(job.status == 'done' for job in jobs)} of {len(jobs)} files ({finished} finished)."]
+    for job in jobs:
+        lines.append(f"{job.describe()} <{BASE_URL}/files/{job.filename}>" if job.status == 'done' else job.describe())
+    report = '\n'.join(lines)
+    return report if len(report) <= 2000 else report[:1997] + '...'
+
+async def run_ingest(interaction: discord.Interaction, jobs):
+    message = await interaction.followup.send(ingest_report(jobs), ephemeral=True, wait=True)
+    last_edit = time.monotonic()
+
+    async def on_progress():
+        nonlocal last_edit
+        if time.monotonic() - last_edit < PROGRESS_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        try:
+            await message.edit(content=ingest_report(jobs))
+        except discord.HTTPException as e:
+            print(f"[Bot] Failed to update upload progress: {e}")
+
+    await attachment_ingest.ingest(jobs, on_progress)
+    await message.edit(content=ingest_report(jobs))
+
+async def linked_attachments(link: str):
+    match = MESSAGE_LINK.search(link)
+    if not match:
+        raise ValueError("That is not a Discord message link.")
+    channel_id, message_id = map(int, match.groups())
+    channel = client.get_channel(channel_id) or await client.fetch_channel(channel_id)
+    message = await channel.fetch_message(message_id)
+    return message.attachments
+
+class CDNClient(discord.Client):
+    async def close(self):
+        # The download session belongs to the bot's event loop, so it is
+        # closed there, before the loop stops.
+        await attachment_ingest.close()
+        await super().close()
+
 intents = discord.Intents.default()
-client = discord.Client(intents=intents)
+client = CDNClient(intents=intents)
 tree = app_commands.CommandTree(client)
 
 
@@ -68,24 +183,21 @@ class RenameModal(Modal, title='Rename File'):
             await interaction.response.edit_message(content="Error: New name cannot be empty.", view=self.parent_view)
             return
 
-        old_path = os.path.join(UPLOAD_FOLDER, self.original_filename)
         file_ext = os.path.splitext(self.original_filename)[1]
         new_filename = f"{new_name_base}{file_ext}"
-        new_path = os.path.join(UPLOAD_FOLDER, new_filename)
 
-        if os.path.exists(new_path):
+        try:
+            await storage.rename(self.original_filename, new_filename)
+        except FileExistsError:
             await interaction.response.edit_message(content=f"Error: A file named '{new_filename}' already exists.", view=self.parent_view)
             return
+        except Exception as e:
+            await interaction.response.edit_message(content=f"An unexpected error occurred during rename: {e}", view=self.parent_view)
+            return
         
         try:
-            os.rename(old_path, new_path)
-            metadata = load_metadata()
-            if self.original_filename in metadata:
-                metadata[new_filename] = metadata.pop(self.original_filename)
-                save_metadata(metadata)
-            
             self.parent_view.selected_file = None
-            self.parent_view.update_file_options()
+            await self.parent_view.update_file_options()
             for item in self.parent_view.children:
                 if isinstance(item, Button): item.disabled = True
             self.parent_view.select_file.disabled = not self.parent_view.select_file.options
@@ -102,7 +214,7 @@ class SearchModal(Modal, title="Search for Files"):
         self.parent_view = parent_view
         self.query_input = TextInput(
             label="Search Query",
-            placeholder="Leave blank to show all files.",
+            placeholder="Leave blank to show all files. Filters: is:password, is:locked, is:near-limit",
             required=False
         )
         self.add_item(self.query_input)
@@ -112,7 +224,7 @@ class SearchModal(Modal, title="Search for Files"):
         self.parent_view.query = query
         self.parent_view.selected_file = None
         
-        self.parent_view.update_file_options()
+        await self.parent_view.update_file_options()
         for item in self.parent_view.children:
             if isinstance(item, Button): item.disabled = True
         
@@ -135,7 +247,8 @@ class ManageFileModal(Modal):
 
         self.input_field = TextInput(
             label=f"New {mode.capitalize()}",
-            placeholder=f"Enter {mode} or leave blank to remove." if mode == "password" else "Enter a number (e.g., 10).",
+            placeholder=f"Enter {mode} or leave blank to remove." if mode == "password"
+                else "Hours until expiry, blank to remove." if mode == "expiry" else "Enter a number (e.g., 10).",
             required=False,
             style=discord.TextStyle.short
         )
@@ -143,25 +256,111 @@ class ManageFileModal(Modal):
 
     async def on_submit(self, interaction: discord.Interaction):
         value = str(self.input_field.value)
-        metadata = load_metadata()
-        if self.filename not in metadata: metadata[self.filename] = {}
-
         if self.mode == 'password':
-            if value: metadata[self.filename]['password'] = value
-            elif 'password' in metadata[self.filename]: del metadata[self.filename]['password']
+            await storage.set_password(self.filename, value)
         elif self.mode == 'lock':
-            if value and value.isdigit() and int(value) > 0:
-                metadata[self.filename]['visit_limit'] = int(value)
-                if 'visit_count' not in metadata[self.filename]: metadata[self.filename]['visit_count'] = 0
-            else:
-                if 'visit_limit' in metadata[self.filename]: del metadata[self.filename]['visit_limit']
-                if 'visit_count' in metadata[self.filename]: del metadata[self.filename]['visit_count']
-        
-        save_metadata(metadata)
+            await storage.set_visit_limit(self.filename, int(value) if value.isdigit() and int(value) > 0 else None)
+        elif self.mode == 'expiry':
+            await storage.set_expiry(self.filename, expiry_time(value))
         await self.parent_view.update_message_after_action(interaction, self.filename)
 
 
 
+class BulkValueModal(Modal):
+    def __init__(self, parent_view: 'BulkActionView', mode: str):
+        self.parent_view = parent_view
+        self.mode = mode
+        super().__init__(title=f"Set {mode.capitalize()} for {len(parent_view.selected_files)} Files")
+        self.input_field = TextInput(
+            label=f"New {mode.capitalize()}",
+            placeholder=f"Enter {mode} or leave blank to remove." if mode == "password"
+                else "Hours until expiry, blank to remove." if mode == "expiry" else "Enter a number, or leave blank to remove.",
+            required=False,
+            style=discord.TextStyle.short
+        )
+        self.add_item(self.input_field)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        value = str(self.input_field.value).strip()
+        key = {'password': 'password', 'lock': 'limit', 'expiry': 'hours'}[self.mode]
+        operations = [{'op': self.mode, 'name': name, key: value} for name in self.parent_view.selected_files]
+        await self.parent_view.run_batch(interaction, operations)
+
+
+
+class BulkActionView(View):
+    def __init__(self, query: str = None):
+        super().__init__(timeout=300)
+        self.query = query
+        self.selected_files = []
+        self.confirming_delete = False
+        self.select_files = Select(row=0, placeholder="Select files...", min_values=1)
+        self.select_files.callback = self.select_callback
+        self.add_item(self.select_files)
+
+        self.button_set_password = Button(label="Set Password", style=discord.ButtonStyle.secondary, emoji="🔑", row=1, disabled=True)
+        self.button_set_lock = Button(label="Set Lock", style=discord.ButtonStyle.secondary, emoji="🔒", row=1, disabled=True)
+        self.button_set_expiry = Button(label="Set Expiry", style=discord.ButtonStyle.secondary, emoji="⏳", row=1, disabled=True)
+        self.button_delete = Button(label="Delete", style=discord.ButtonStyle.danger, emoji="🗑️", row=1, disabled=True)
+
+        async def password_callback(interaction: discord.Interaction):
+            await interaction.response.send_modal(BulkValueModal(self, 'password'))
+        async def lock_callback(interaction: discord.Interaction):
+            await interaction.response.send_modal(BulkValueModal(self, 'lock'))
+        async def expiry_callback(interaction: discord.Interaction):
+            await interaction.response.send_modal(BulkValueModal(self, 'expiry'))
+        async def delete_callback(interaction: discord.Interaction):
+            if not self.confirming_delete:
+                self.confirming_delete = True
+                self.button_delete.label = f"Confirm Delete ({len(self.selected_files)})"
+                return await interaction.response.edit_message(view=self)
+            await self.run_batch(interaction, [{'op': 'delete', 'name': name} for name in self.selected_files])
+
+        self.button_set_password.callback = password_callback
+        self.button_set_lock.callback = lock_callback
+        self.button_set_expiry.callback = expiry_callback
+        self.button_delete.callback = delete_callback
+        self.add_item(self.button_set_password)
+        self.add_item(self.button_set_lock)
+        self.add_item(self.button_set_expiry)
+        self.add_item(self.button_delete)
+
+    async def update_file_options(self):
+        files = await storage.file_names(self.query, limit=25) or []
+        self.select_files.options.clear()
+        for name in files:
+            self.select_files.append_option(discord.SelectOption(label=name))
+        self.select_files.max_values = max(len(files), 1)
+        self.select_files.disabled = not files
+        return files
+
+    def reset_selection(self):
+        self.selected_files = []
+        self.confirming_delete = False
+        self.button_delete.label = "Delete"
+        for button in (self.button_set_password, self.button_set_lock, self.button_set_expiry, self.button_delete):
+            button.disabled = True
+
+    async def select_callback(self, interaction: discord.Interaction):
+        self.selected_files = list(self.select_files.values)
+        self.confirming_delete = False
+        self.button_delete.label = "Delete"
+        for button in (self.button_set_password, self.button_set_lock, self.button_set_expiry, self.button_delete):
+            button.disabled = False
+        await interaction.response.edit_message(content=f"{len(self.selected_files)} file(s) selected. Choose an action.", view=self)
+
+    async def run_batch(self, interaction: discord.Interaction, operations):
+        results = await storage.batch(operations)
+        failures = [result for result in results if not result['ok']]
+        lines = [f"Done: {len(results) - len(failures)} succeeded, {len(failures)} failed."]
+        lines += [f"❌ {result['name']}: {result['error']}" for result in failures[:10]]
+        self.reset_selection()
+        if not await self.update_file_options():
+            return await interaction.response.edit_message(content='\n'.join(lines + ["No files left to select."]), view=None)
+        await interaction.response.edit_message(content='\n'.join(lines), view=self)
+
+
+
 class FileManagementView(View):
     def __init__(self, query: str = None):
         super().__init__(timeout=300)
@@ -172,7 +371,6 @@ class FileManagementView(View):
 
     def create_select_menu(self):
         self.select_file = Select(row=0, placeholder="Select a file to manage...")
-        self.update_file_options()
         
         async def select_callback(interaction: discord.Interaction):
             self.selected_file = self.select_file.values[0]
@@ -185,6 +383,7 @@ class FileManagementView(View):
         self.button_rename = Button(label="Rename", style=discord.ButtonStyle.primary, emoji="✏️", row=1, disabled=True)
         self.button_set_password = Button(label="Set Password", style=discord.ButtonStyle.secondary, emoji="🔑", row=1, disabled=True)
         self.button_set_lock = Button(label="Set Lock", style=discord.ButtonStyle.secondary, emoji="🔒", row=1, disabled=True)
+        self.button_set_expiry = Button(label="Set Expiry", style=discord.ButtonStyle.secondary, emoji="⏳", row=1, disabled=True)
         self.button_delete = Button(label="Delete", style=discord.ButtonStyle.danger, emoji="🗑️", row=2, disabled=True)
         self.button_get_link = Button(label="Get Link", style=discord.ButtonStyle.success, emoji="🔗", row=2, disabled=True)
         self.button_rerun_query = Button(label="Search", style=discord.ButtonStyle.blurple, emoji="🔍", row=2)
@@ -195,17 +394,12 @@ class FileManagementView(View):
             await interaction.response.send_modal(ManageFileModal(self, self.selected_file, 'password'))
         async def lock_callback(interaction: discord.Interaction):
             await interaction.response.send_modal(ManageFileModal(self, self.selected_file, 'lock'))
+        async def expiry_callback(interaction: discord.Interaction):
+            await interaction.response.send_modal(ManageFileModal(self, self.selected_file, 'expiry'))
         async def delete_callback(interaction: discord.Interaction):
-            file_path = os.path.join(UPLOAD_FOLDER, self.selected_file)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                metadata = load_metadata()
-                if self.selected_file in metadata:
-                    del metadata[self.selected_file]
-                    save_metadata(metadata)
-                
+            if await storage.delete(self.selected_file):
                 self.selected_file = None
-                self.update_file_options()
+                await self.update_file_options()
                 for item in self.children: 
                     if isinstance(item, Button): item.disabled = True
                 self.button_rerun_query.disabled = False
@@ -215,12 +409,16 @@ class FileManagementView(View):
             else:
                 await interaction.response.edit_message(content=f"Error: '{self.selected_file}' no longer exists.", view=None)
         async def link_callback(interaction: discord.Interaction):
-            metadata = load_metadata()
-            file_meta = metadata.get(self.selected_file, {})
+            file_meta = await storage.get(self.selected_file) or {}
             base_link = f"{BASE_URL}/files/{self.selected_file}"
-            if password := file_meta.get('password'):
-                link = f"<{base_link}?password={password}>"
-                message_content = f"Link for **{self.selected_file}** (includes password):\n{link}"
+            if file_meta.get('password'):
+                limit = file_meta.get('visit_limit')
+                visits = limit - file_meta.get('visit_count', 0) if limit is not None else None
+                if visits is not None and visits <= 0:
+                    return await interaction.response.send_message(f"**{self.selected_file}** is locked; it has no visits left.", ephemeral=True)
+                token, expires = download_tokens.issue(self.selected_file, visits=visits, not_after=file_meta.get('expires_at'))
+                link = f"<{base_link}?token={token}>"
+                message_content = f"Signed link for **{self.selected_file}** (works without the password, expires <t:{expires}:R>):\n{link}"
             else:
                 link = f"<{base_link}>"
                 message_content = f"Link for **{self.selected_file}**:\n{link}"
@@ -232,6 +430,7 @@ class FileManagementView(View):
         self.button_rename.callback = rename_callback
         self.button_set_password.callback = password_callback
         self.button_set_lock.callback = lock_callback
+        self.button_set_expiry.callback = expiry_callback
         self.button_delete.callback = delete_callback
         self.button_get_link.callback = link_callback
         self.button_rerun_query.callback = search_callback
@@ -239,40 +438,41 @@ class FileManagementView(View):
         self.add_item(self.button_rename)
         self.add_item(self.button_set_password)
         self.add_item(self.button_set_lock)
+        self.add_item(self.button_set_expiry)
         self.add_item(self.button_delete)
         self.add_item(self.button_get_link)
         self.add_item(self.button_rerun_query)
         
-    def update_file_options(self):
+    async def update_file_options(self):
+        files = await storage.file_names(self.query, limit=25)
         self.select_file.options.clear()
-        try:
-            files = sorted([f for f in os.listdir(UPLOAD_FOLDER) if os.path.isfile(os.path.join(UPLOAD_FOLDER, f))])
-            if self.query:
-                files = [f for f in files if self.query.lower() in f.lower()]
-
-            if not files:
-                self.select_file.disabled = True
-                self.select_file.placeholder = "No files match your search." if self.query else "No files found."
-            else:
-                self.select_file.disabled = False
-                self.select_file.placeholder = "Select a file to manage..."
-                for filename in files[:25]:
-                    self.select_file.append_option(discord.SelectOption(label=filename))
-        except FileNotFoundError:
+        if files is None:
             self.select_file.disabled = True
             self.select_file.placeholder = "Error: CDN directory not found."
+            return
+
+        if not files:
+            self.select_file.disabled = True
+            self.select_file.placeholder = "No files match your search." if self.query else "No files found."
+        else:
+            self.select_file.disabled = False
+            self.select_file.placeholder = "Select a file to manage..."
+            for name in files:
+                self.select_file.append_option(discord.SelectOption(label=name))
 
     async def update_message_after_action(self, interaction: discord.Interaction, filename: str):
-        metadata = load_metadata()
-        file_meta = metadata.get(filename, {})
+        file_meta = await storage.get(filename) or {}
         pwd_status = f"**Password:** {'Yes' if file_meta.get('password') else 'No'}"
         lock_status = "**Lock:** Not set"
         if file_meta.get('visit_limit') is not None:
             count = file_meta.get('visit_count', 0)
             limit = file_meta.get('visit_limit')
             lock_status = f"**Lock:** {count}/{limit} visits"
+        expiry_status = "**Expiry:** Not set"
+        if expires_at := file_meta.get('expires_at'):
+            expiry_status = f"**Expiry:** {'Expired' if expires_at <= time.time() else 'Expires'} <t:{int(expires_at)}:R>"
 
-        message_content = f"Managing: **{filename}**\n{pwd_status}\n{lock_status}\n\nSelect an action."
+        message_content = f"Managing: **{filename}**\n{pwd_status}\n{lock_status}\n{expiry_status}\n\nSelect an action."
         for item in self.children:
             if isinstance(item, Button): item.disabled = False 
         
@@ -285,10 +485,11 @@ class FileManagementView(View):
     file="The file to upload.",
     custom_name="Optional custom name for the file (without extension).",
     password="Set a password to access the file.",
-    visit_limit="Lock the file after this many visits."
+    visit_limit="Lock the file after this many visits.",
+    expires_in_hours="Stop serving the file after this many hours."
 )
 @is_authorized()
-async def upload_command(interaction: discord.Interaction, file: discord.Attachment, custom_name: str = None, password: str = None, visit_limit: int = None):
+async def upload_command(interaction: discord.Interaction, file: discord.Attachment, custom_name: str = None, password: str = None, visit_limit: int = None, expires_in_hours: float = None):
     
     if not allowed_file(file.filename):
         return await interaction.response.send_message("Error: This file type is not allowed.", ephemeral=True)
@@ -301,39 +502,118 @@ async def upload_command(interaction: discord.Interaction, file: discord.Attachm
     base_name = sanitized_name or uuid.uuid4().hex
     new_filename = f"{base_name}{file_ext}"
 
-    save_path = os.path.join(UPLOAD_FOLDER, new_filename)
-    if os.path.exists(save_path):
+    if await storage.exists(new_filename):
         return await interaction.followup.send(f"Error: A file named '{new_filename}' already exists.", ephemeral=True)
-    try:
-        await file.save(save_path)
-        metadata = load_metadata()
-        metadata[new_filename] = {'visit_count': 0}
-        if password: metadata[new_filename]['password'] = password
-        if visit_limit and visit_limit > 0: metadata[new_filename]['visit_limit'] = visit_limit
-        save_metadata(metadata)
-        link = f"{BASE_URL}/files/{new_filename}"
-        await interaction.followup.send(f"Success! File uploaded.\nYour link: {link}", ephemeral=True)
-    except Exception as e:
-        await interaction.followup.send(f"An error occurred during upload: {e}", ephemeral=True)
+    await run_ingest(interaction, [IngestJob(file, new_filename, upload_options(password, visit_limit, expires_in_hours))])
+
+@tree.command(name="bulkupload", description="Upload several attachments, or every attachment of a linked message.")
+@discord.app_commands.user_install()
+@app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+@app_commands.describe(
+    message_link="Link to a message whose attachments should be uploaded.",
+    file1="A file to upload.", file2="A file to upload.", file3="A file to upload.",
+    file4="A file to upload.", file5="A file to upload.",
+    password="Set a password on every uploaded file.",
+    visit_limit="Lock each file after this many visits.",
+    expires_in_hours="Stop serving each file after this many hours."
+)
+@is_authorized()
+async def bulk_upload_command(interaction: discord.Interaction, message_link: str = None,
+                              file1: discord.Attachment = None, file2: discord.Attachment = None, file3: discord.Attachment = None,
+                              file4: discord.Attachment = None, file5: discord.Attachment = None,
+                              password: str = None, visit_limit: int = None, expires_in_hours: float = None):
+    await interaction.response.defer(ephemeral=True)
+    attachments = [file for file in (file1, file2, file3, file4, file5) if file is not None]
+    if message_link:
+        try:
+            attachments += await linked_attachments(message_link)
+        except (ValueError, discord.HTTPException) as e:
+            return await interaction.followup.send(f"Error: Could not read the linked message: {e}", ephemeral=True)
+    skipped = [file.filename for file in attachments if not allowed_file(file.filename)]
+    attachments = [file for file in attachments if allowed_file(file.filename)][:MAX_BULK_FILES]
+    if not attachments:
+        return await interaction.followup.send("Error: No attachments with an allowed file type were found.", ephemeral=True)
+    if skipped:
+        await interaction.followup.send(f"Skipping {len(skipped)} file(s) with a disallowed type: {', '.join(skipped)[:1800]}", ephemeral=True)
+
+    jobs, taken = [], set()
+    for file in attachments:
+        stem, file_ext = os.path.splitext(file.filename)
+        new_filename = f"{sanitize_filename(stem) or uuid.uuid4().hex}{file_ext}"
+        if new_filename in taken or await storage.exists(new_filename):
+            new_filename = f"{sanitize_filename(stem) or 'file'}-{uuid.uuid4().hex[:8]}{file_ext}"
+        taken.add(new_filename)
+        jobs.append(IngestJob(file, new_filename, upload_options(password, visit_limit, expires_in_hours)))
+    await run_ingest(interaction, jobs)
 
 @tree.command(name="manage", description="Manage files in the CDN. Can be filtered with a query.")
 @discord.app_commands.user_install()
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
-@app_commands.describe(query="An optional search term to filter the file list.")
+@app_commands.describe(query="An optional search term, e.g. 'report is:locked'.")
 @is_authorized()
 async def manage_command(interaction: discord.Interaction, query: str = None):
     view = FileManagementView(query=query)
+    await view.update_file_options()
     message_content = "Select a file to get started."
     if query:
         message_content = f"Showing results for \"{query}\". Select a file."
     await interaction.response.send_message(message_content, view=view, ephemeral=True)
 
+@tree.command(name="bulk", description="Apply one action to several files at once.")
+@discord.app_commands.user_install()
+@app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+@app_commands.describe(query="An optional search term to pick the files, e.g. 'is:locked'.")
+@is_authorized()
+async def bulk_command(interaction: discord.Interaction, query: str = None):
+    view = BulkActionView(query=query)
+    if not await view.update_file_options():
+        return await interaction.response.send_message("No files match your search." if query else "No files found.", ephemeral=True)
+    message_content = "Select up to 25 files, then choose an action."
+    if query:
+        message_content = f"Showing results for \"{query}\". Select up to 25 files, then choose an action."
+    await interaction.response.send_message(message_content, view=view, ephemeral=True)
+
+@tree.command(name="stats", description="Show download statistics for the busiest files, or for one file.")
+@discord.app_commands.user_install()
+@app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+@app_commands.describe(name="A file to show on its own.", sort="How to order the list.")
+@app_commands.choices(sort=[
+    app_commands.Choice(name="Most requested", value="hits"),
+    app_commands.Choice(name="Most bytes sent", value="bytes"),
+    app_commands.Choice(name="Most unique clients", value="clients"),
+    app_commands.Choice(name="Recently requested", value="recent"),
+])
+@is_authorized()
+async def stats_command(interaction: discord.Interaction, name: str = None, sort: str = 'hits'):
+    if access_log is None:
+        return await interaction.response.send_message("The access log is disabled.", ephemeral=True)
+    if name:
+        file_stats = await storage.run(access_log.stats, name)
+        content = describe_stats(file_stats) if file_stats else f"No downloads recorded for `{name}`."
+        return await interaction.response.send_message(content, ephemeral=True)
+    files = await storage.run(access_log.top, sort, 10)
+    totals = await storage.run(access_log.totals)
+    lines = [f"{totals['hits']} requests for {totals['files']} files, {format_bytes(totals['bytes'])} sent."]
+    lines += [f"{index}. {describe_stats(file_stats)}" for index, file_stats in enumerate(files, 1)]
+    content = '\n'.join(lines) if files else "No downloads recorded yet."
+    await interaction.response.send_message(content if len(content) <= 2000 else content[:1997] + '...', ephemeral=True)
+
+def record_command(interaction: discord.Interaction, outcome: str):
+    command = interaction.command.qualified_name if interaction.command else 'unknown'
+    metrics.inc('cdn_bot_commands_total', command=command, outcome=outcome)
+    metrics.observe('cdn_bot_command_duration_seconds', (discord.utils.utcnow() - interaction.created_at).total_seconds(), command=command)
+
+@client.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    record_command(interaction, 'ok')
+
 @tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
     
     content = "An unexpected error occurred."
     if isinstance(error, app_commands.CheckFailure):
         content = "You are not authorized to use this command."
+    record_command(interaction, 'denied' if isinstance(error, app_commands.CheckFailure) else 'error')
     print(f"[Bot Error] User: {interaction.user.id}, Command: {interaction.command.name if interaction.command else 'Unknown'}, Error: {error}")
     try:
         if interaction.response.is_done():
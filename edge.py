@@ -0,0 +1,225 @@
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import queue
+import shutil
+import mimetypes
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+from compression import VariantCache
+from delivery import StaticFile
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class OriginError(Exception):
+    pass
+
+
+class NodeClient:
+    def __init__(self, base_url, secret, timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.secret = secret
+        self.timeout = timeout
+
+    def request(self, method, path, data=None, headers=None):
+        headers = {'Authorization': f"Bearer {self.secret}", **(headers or {})}
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(f"{self.base_url}{path}", data=body, method=method, headers=headers)
+        try:
+            return urllib.request.urlopen(req, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            return e
+        except OSError as e:
+            raise OriginError(f"{self.base_url} is unreachable: {e}")
+
+    def json(self, method, path, data=None):
+        with self.request(method, path, data) as response:
+            if response.getcode() != 200:
+                raise OriginError(f"{self.base_url} answered {response.getcode()} for {method} {path}.")
+            return json.load(response)
+
+
+class EdgeCache(VariantCache):
+    # Local copies of origin files, stored as <key dir>/<etag>.<mtime>.file so
+    # they are served with the origin's validators. A copy is revalidated with If-None-Match once it is older than
+    # `revalidate` seconds in this process, in case an invalidation was lost.
+    def __init__(self, cache_dir, client, max_bytes=10 * 1024 * 1024 * 1024, revalidate=60):
+        super().__init__(cache_dir, max_bytes)
+        self.client = client
+        self.revalidate = revalidate
+        self._checked = {}
+
+    def _local(self, name):
+        try:
+            entries = list(os.scandir(self._key_dir(name)))
+        except FileNotFoundError:
+            return None
+        return next((entry.path for entry in entries if entry.name.endswith('.file')), None)
+
+    def _fresh(self, name):
+        return time.monotonic() - self._checked.get(name, float('-inf')) < self.revalidate
+
+    def get(self, name):
+        path = self._local(name)
+        if path is not None and self._fresh(name):
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            return path
+        with self._lock:
+            self.misses += 1
+            build_lock = self._building.setdefault(name, threading.Lock())
+        with build_lock:
+            path = self._local(name)
+            if path is None or not self._fresh(name):
+                path = self._fetch(name, path)
+        with self._lock:
+            self._building.pop(name, None)
+        return path
+
+    def _fetch(self, name, path):
+        headers = {'If-None-Match': f'"{os.path.basename(path).split(".")[0]}"'} if path else {}
+        with self.client.request('GET', f"/_node/files/{quote(name)}", headers=headers) as response:
+            status = response.getcode()
+            if status == 304:
+                os.utime(path)
+            elif status == 404:
+                self.invalidate(name)
+                return None
+            elif status != 200:
+                raise OriginError(f"{self.client.base_url} answered {status} for {name}.")
+            else:
+                etag = re.sub(r'[^A-Za-z0-9_-]', '', response.headers.get('ETag', '')) or uuid.uuid4().hex
+                key_dir = self._key_dir(name)
+                try:
+                    modified = int(parsedate_to_datetime(response.headers['Last-Modified']).timestamp())
+                except (KeyError, TypeError, ValueError):
+                    modified = int(time.time())
+                path = os.path.join(key_dir, f"{etag}.{modified}.file")
+                def download(tmp_path):
+                    with open(tmp_path, 'wb') as f:
+                        shutil.copyfileobj(response, f, CHUNK_SIZE)
+                self._store(key_dir, etag, path, download)
+        self._checked[name] = time.monotonic()
+        return path
+
+    def open(self, name, path):
+        etag, modified = os.path.basename(path).split('.')[:2]
+        static_file = StaticFile(path, mimetype=mimetypes.guess_type(name)[0])
+        static_file.etag = etag
+        static_file.last_modified = datetime.fromtimestamp(int(modified), tz=timezone.utc)
+        return static_file
+
+    def invalidate(self, name):
+        self._checked.pop(name, None)
+        super().invalidate(name)
+
+
+class OriginCatalog:
+    # Takes the metadata store's place on an edge: entries are read from the
+    # origin and cached until invalidated, and visits are counted there.
+    def __init__(self, client, ttl=60):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, name):
+        with self._lock:
+            cached = self._entries.get(name)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return dict(cached[1]) if cached[1] is not None else None
+        file_meta = self.client.json('GET', f"/_node/meta/{quote(name)}")['meta']
+        with self._lock:
+            self._entries[name] = (time.monotonic(), file_meta)
+        return dict(file_meta) if file_meta is not None else None
+
+    def all(self):
+        return {}
+
+    def record_visit(self, name, limit):
+        try:
+            return self.client.json('POST', f"/_node/visit/{quote(name)}", {})['allowed']
+        finally:
+            self.invalidate(name)
+
+    def invalidate(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class OriginTokenCounters:
+    # Takes the visit counters' place in an edge's DownloadTokens, so a
+    # link's quota is spent in the origin's log wherever it is used.
+    def __init__(self, client):
+        self.client = client
+
+    def hit(self, token_id, limit):
+        return self.client.json('POST', '/_node/token-visit', {'id': token_id, 'visits': limit})['allowed']
+
+
+class EdgeNotifier:
+    # Every origin worker sees every change event, so only the worker holding
+    # the lock forwards them; the others take over if it exits.
+    def __init__(self, edges, secret, lock_path='cdn_edges.lock', timeout=5, retries=3, max_batch=100):
+        self.edges = [NodeClient(edge, secret, timeout) for edge in edges]
+        self.lock_path = lock_path
+        self.retries = retries
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock_file = None
+        self._thread = None
+
+    def _is_leader(self):
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self._thread = threading.Thread(target=self._send_loop, name="edge-notifier", daemon=True)
+        self._thread.start()
+        return True
+
+    def on_change(self, op, name, new_name=None):
+        if self.edges and self._is_leader():
+            self._queue.put([op, name, new_name])
+
+    def _send_loop(self):
+        while True:
+            events = [self._queue.get()]
+            while not self._queue.empty() and len(events) < self.max_batch:
+                events.append(self._queue.get_nowait())
+            for edge in self.edges:
+                self._send(edge, events)
+
+    def _send(self, edge, events):
+        for attempt in range(self.retries):
+            try:
+                edge.json('POST', '/_node/invalidate', {'events': events})
+                return
+            except OriginError as e:
+                error = e
+                time.sleep(2 ** attempt)
+        print(f"Could not notify edge {edge.base_url} of {len(events)} change(s): {error}")
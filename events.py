@@ -0,0 +1,94 @@
+import os
+import fcntl
+import threading
+
+
+class ChangeFeed:
+    def __init__(self, path, poll_interval=1.0, max_bytes=1024 * 1024):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._fd = None
+        self._ino = None
+        self._offset = 0
+        self._thread = None
+        self._stopped = threading.Event()
+        self._open(skip_existing=True)
+
+    def _open(self, skip_existing=False):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDONLY | os.O_CREAT, 0o644)
+        st = os.fstat(self._fd)
+        self._ino = st.st_ino
+        self._offset = st.st_size if skip_existing else 0
+
+    def publish(self, op, name, new_name=None):
+        self.publish_many([(op, name, new_name)])
+
+    def publish_many(self, events):
+        if not events:
+            return
+        lines = ''.join('\t'.join(part for part in event if part is not None) + '\n' for event in events)
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                try:
+                    os.write(fd, lines.encode('utf-8'))
+                    size = os.fstat(fd).st_size
+                finally:
+                    os.close(fd)
+                # Rotation swaps in a fresh file; readers drain the old inode
+                # through their open descriptor before following the new one.
+                if size > self.max_bytes:
+                    tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                    open(tmp_path, 'w').close()
+                    os.replace(tmp_path, self.path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self.poll()
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._poll_loop, name="change-feed", daemon=True)
+            self._thread.start()
+
+    def _read_new(self):
+        size = os.fstat(self._fd).st_size
+        if size <= self._offset:
+            return []
+        data = os.pread(self._fd, size - self._offset, self._offset)
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        return data[:end].decode('utf-8').splitlines()
+
+    def poll(self):
+        with self._lock:
+            lines = self._read_new()
+            try:
+                rotated = os.stat(self.path).st_ino != self._ino
+            except FileNotFoundError:
+                rotated = False
+            if rotated:
+                lines += self._read_new()
+                self._open()
+                lines += self._read_new()
+        for line in lines:
+            op, name, *rest = line.split('\t')
+            for callback in self._subscribers:
+                try:
+                    callback(op, name, rest[0] if rest else None)
+                except Exception as e:
+                    print(f"Change feed subscriber failed on {op} {name}: {e}")
+
+    def _poll_loop(self):
+        while not self._stopped.wait(self.poll_interval):
+            self.poll()
+
+    def close(self):
+        self._stopped.set()
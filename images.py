@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+from compression import VariantCache, Unchanged
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+
+IMAGE_TYPES = {'image/png', 'image/jpeg', 'image/gif'}
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg'), 'png': ('PNG', 'image/png')}
+WIDTH_STEP = 32
+DEFAULT_QUALITY = 80
+THUMBNAIL_WIDTH = 96
+MAX_UNCHANGED = 10000
+
+
+def available_formats():
+    if Image is None:
+        return []
+    return [name for name in FORMATS if name != 'webp' or features.check('webp')]
+
+
+class ImageDerivatives(VariantCache):
+    # Resized and re-encoded copies of images, built on a small worker pool so
+    # a burst of new sizes can't take every request thread.
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024, workers=2, max_width=2048,
+                 max_source_pixels=50_000_000):
+        super().__init__(cache_dir, max_bytes)
+        self.max_width = max_width
+        self.max_source_pixels = max_source_pixels
+        self.formats = available_formats()
+        # (name, etag, variant) for requests the source already satisfies, so
+        # they aren't decoded again on every request. A new etag misses it.
+        self._unchanged = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-derivatives')
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def wants(self, args):
+        return any(args.get(key) for key in ('width', 'format', 'quality'))
+
+    def parse(self, args):
+        width, fmt = args.get('width', type=int), (args.get('format') or '').lower() or None
+        quality = args.get('quality', type=int)
+        if width is not None and width < 1:
+            raise ValueError('Width must be a positive number.')
+        if fmt == 'jpg':
+            fmt = 'jpeg'
+        if fmt is not None and fmt not in self.formats:
+            raise ValueError(f"Format must be one of: {', '.join(self.formats)}.")
+        if quality is not None and not 1 <= quality <= 100:
+            raise ValueError('Quality must be between 1 and 100.')
+        # Widths are rounded up to a step so arbitrary sizes can't flood the cache.
+        if width is not None:
+            width = min(-(-width // WIDTH_STEP) * WIDTH_STEP, self.max_width)
+        return width, fmt, quality
+
+    def select(self, static_file, name, width=None, fmt=None, quality=None):
+        if Image is None or static_file.mimetype not in IMAGE_TYPES:
+            return static_file
+        fmt = fmt or static_file.mimetype.split('/')[1]
+        if fmt == 'gif':
+            fmt = 'png'
+        variant_name = f"{width or 'full'}w-q{quality or DEFAULT_QUALITY}.{fmt}"
+        key = (name, static_file.etag, variant_name)
+        if key in self._unchanged:
+            return static_file
+        try:
+            variant_path = self._cached(name, static_file.etag, variant_name,
+                                        lambda tmp_path: self.executor.submit(
+                                            self._render, static_file.path, tmp_path, width, fmt, quality).result())
+        except Unchanged:
+            with self._lock:
+                if len(self._unchanged) >= MAX_UNCHANGED:
+                    del self._unchanged[next(iter(self._unchanged))]
+                self._unchanged[key] = True
+            return static_file
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            print(f"Failed to build {variant_name} derivative of {name}: {e}")
+            return static_file
+        return static_file.derived(variant_path, FORMATS[fmt][1], variant_name)
+
+    def _render(self, source_path, tmp_path, width, fmt, quality):
+        with Image.open(source_path) as image:
+            if image.width * image.height > self.max_source_pixels:
+                raise ValueError(f"image is larger than {self.max_source_pixels} pixels")
+            # Animations would lose their frames, and a same-format copy at
+            # full size and default quality gains nothing; both are served as they are.
+            same_format = FORMATS[fmt][1] == Image.MIME.get(image.format)
+            if getattr(image, 'is_animated', False) or (width or image.width) >= image.width and same_format and quality is None:
+                raise Unchanged()
+            image = ImageOps.exif_transpose(image)
+            if width and width < image.width:
+                image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            elif image.mode == 'P':
+                image = image.convert('RGBA')
+            options = {'optimize': True} if fmt == 'png' else {'quality': quality or DEFAULT_QUALITY}
+            image.save(tmp_path, FORMATS[fmt][0], **options)
+
+    def thumbnail(self, static_file, name):
+        return self.select(static_file, name, THUMBNAIL_WIDTH, 'webp' if 'webp' in self.formats else 'png')
+
+    def close(self):
+        self.executor.shutdown(wait=False)
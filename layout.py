@@ -0,0 +1,122 @@
+import os
+import time
+import fcntl
+import hashlib
+from contextlib import contextmanager
+
+
+def valid_name(name):
+    return isinstance(name, str) and name and os.path.basename(name) == name and not name.startswith('.')
+
+
+class FileLayout:
+    # Files live at <root>/<ab>/<cd>/<name>, where ab and cd come from a hash
+    # of the name, so no directory grows past a few hundred entries. Files left
+    # in the old flat layout (or copied in by hand) are still found at
+    # <root>/<name> until `python layout.py` moves them. Writers hold a shared
+    # lock and the mover an exclusive one, so a file never moves mid-rename.
+    def __init__(self, root, levels=2):
+        self.root = root
+        self.levels = levels
+        self.lock_path = os.path.join(root, '.layout.lock')
+        os.makedirs(root, exist_ok=True)
+
+    def shard(self, name):
+        digest = hashlib.sha256(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, *(digest[2 * i:2 * i + 2] for i in range(self.levels)))
+
+    def path(self, name):
+        return os.path.join(self.shard(name), name)
+
+    def locate(self, name):
+        if not valid_name(name):
+            return None
+        path = self.path(name)
+        if os.path.isfile(path):
+            return path
+        flat = os.path.join(self.root, name)
+        if os.path.isfile(flat):
+            return flat
+        # The mover may have taken it between the two checks.
+        return path if os.path.isfile(path) else None
+
+    def exists(self, name):
+        return self.locate(name) is not None
+
+    def target(self, name):
+        # Where a write to `name` goes: over the existing file, or a new sharded path.
+        path = self.locate(name)
+        if path is None:
+            os.makedirs(self.shard(name), exist_ok=True)
+            path = self.path(name)
+        return path
+
+    def rename(self, old_name, new_name):
+        os.makedirs(self.shard(new_name), exist_ok=True)
+        os.rename(self.locate(old_name) or self.path(old_name), self.path(new_name))
+
+    def files(self):
+        # Yields (name, path) for every stored file, sharded or flat.
+        stack = [(self.root, 0)]
+        while stack:
+            directory, depth = stack.pop()
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir() and depth < self.levels:
+                        stack.append((entry.path, depth + 1))
+                    elif entry.is_file() and depth in (0, self.levels):
+                        yield entry.name, entry.path
+
+    @contextmanager
+    def _locked(self, operation):
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def writing(self):
+        return self._locked(fcntl.LOCK_SH)
+
+    def flat_files(self, skip=()):
+        with os.scandir(self.root) as it:
+            return [entry.name for entry in it
+                    if not entry.name.startswith('.') and entry.name not in skip and entry.is_file()]
+
+    def migrate(self, batch_size=500, pause=0.05):
+        # Rescans until nothing is left, to pick up files uploaded meanwhile.
+        moved, skipped = 0, set()
+        while pending := self.flat_files(skipped):
+            for start in range(0, len(pending), batch_size):
+                with self._locked(fcntl.LOCK_EX):
+                    for name in pending[start:start + batch_size]:
+                        source, target = os.path.join(self.root, name), self.path(name)
+                        if os.path.exists(target):
+                            skipped.add(name)
+                            continue
+                        os.makedirs(self.shard(name), exist_ok=True)
+                        try:
+                            os.rename(source, target)
+                        except FileNotFoundError:
+                            continue
+                        moved += 1
+                time.sleep(pause)
+        return moved, sorted(skipped)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Move files from the flat cdn_files/ layout into hashed subdirectories while the server keeps running.")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--pause', type=float, default=0.05, help="seconds to wait between batches")
+    args = parser.parse_args()
+    layout = FileLayout('cdn_files')
+    print(f"{len(layout.flat_files())} file(s) to move.")
+    moved, skipped = layout.migrate(args.batch_size, args.pause)
+    print(f"Moved {moved} file(s) into the sharded layout.")
+    for name in skipped:
+        print(f"Skipped {name}: a file with that name is already in {layout.shard(name)}.")
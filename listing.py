@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import base64
+import bisect
+import threading
+
+
+SORT_KEYS = {
+    'name': lambda name, size, mtime: name.lower(),
+    'modified': lambda name, size, mtime: mtime,
+    'size': lambda name, size, mtime: size,
+}
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        key, name = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return key, name
+    except (ValueError, TypeError):
+        return None
+
+
+class FileIndex:
+    # Files are dated by the upload time kept in the catalog: a deduplicated
+    # upload is a hard link to an older blob, so its own mtime is not its own.
+    def __init__(self, layout, rescan_interval=300, metadata_store=None):
+        self.layout = layout
+        self.rescan_interval = rescan_interval
+        self.metadata_store = metadata_store
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._orders = {sort: [] for sort in SORT_KEYS}
+        self._scanned_at = None
+
+    def _uploaded_at(self, file_meta, st):
+        return (file_meta or {}).get('mtime') or st.st_mtime
+
+    def rescan(self):
+        entries = {}
+        metadata = self.metadata_store.all() if self.metadata_store is not None else {}
+        try:
+            for name, path in self.layout.files():
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries[name] = (st.st_size, self._uploaded_at(metadata.get(name), st))
+        except FileNotFoundError:
+            pass
+        orders = {
+            sort: sorted((key(name, size, mtime), name) for name, (size, mtime) in entries.items())
+            for sort, key in SORT_KEYS.items()
+        }
+        with self._lock:
+            self._entries = entries
+            self._orders = orders
+            self._scanned_at = time.monotonic()
+
+    def _maybe_rescan(self):
+        if self._scanned_at is None:
+            self.rescan()
+        elif self.rescan_interval and time.monotonic() - self._scanned_at > self.rescan_interval:
+            self._scanned_at = time.monotonic()
+            threading.Thread(target=self.rescan, name="file-index-rescan", daemon=True).start()
+
+    def _insert(self, name, size, mtime):
+        self._entries[name] = (size, mtime)
+        for sort, key in SORT_KEYS.items():
+            bisect.insort(self._orders[sort], (key(name, size, mtime), name))
+
+    def _delete(self, name):
+        size, mtime = self._entries.pop(name)
+        for sort, key in SORT_KEYS.items():
+            order = self._orders[sort]
+            index = bisect.bisect_left(order, (key(name, size, mtime), name))
+            if index < len(order) and order[index][1] == name:
+                del order[index]
+
+    def refresh(self, name):
+        if self._scanned_at is None:
+            return
+        path = self.layout.locate(name)
+        try:
+            st = os.stat(path) if path is not None else None
+        except FileNotFoundError:
+            st = None
+        file_meta = self.metadata_store.get(name) if st is not None and self.metadata_store is not None else None
+        with self._lock:
+            if name in self._entries:
+                self._delete(name)
+            if st is not None:
+                self._insert(name, st.st_size, self._uploaded_at(file_meta, st))
+
+    def on_change(self, op, name, new_name=None):
+        self.refresh(name)
+        if new_name:
+            self.refresh(new_name)
+
+    def names(self):
+        self._maybe_rescan()
+        with self._lock:
+            return list(self._entries)
+
+    def get(self, name):
+        self._maybe_rescan()
+        with self._lock:
+            entry = self._entries.get(name)
+        return None if entry is None else {'name': name, 'size': entry[0], 'mtime': entry[1]}
+
+    def page(self, sort='modified', descending=True, cursor=None, limit=50, predicate=None):
+        self._maybe_rescan()
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort}'.")
+        if limit < 1:
+            raise ValueError("limit must be at least 1.")
+        with self._lock:
+            order = self._orders[sort]
+            position = decode_cursor(cursor) if cursor else None
+            if descending:
+                start = len(order) - 1 if position is None else bisect.bisect_left(order, tuple(position)) - 1
+                indexes = range(start, -1, -1)
+            else:
+                start = 0 if position is None else bisect.bisect_right(order, tuple(position))
+                indexes = range(start, len(order))
+            total = len(order) if predicate is None else sum(1 for _, name in order if predicate(name))
+            items = []
+            last = None
+            for index in indexes:
+                key, name = order[index]
+                if predicate is not None and not predicate(name):
+                    continue
+                if len(items) == limit:
+                    return {'items': items, 'next_cursor': encode_cursor(last), 'total': total}
+                size, mtime = self._entries[name]
+                items.append({'name': name, 'size': size, 'mtime': mtime})
+                last = (key, name)
+            return {'items': items, 'next_cursor': None, 'total': total}
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import fcntl
+import threading
+
+
+def expiry_time(hours, now=None):
+    try:
+        hours = float(hours)
+    except (TypeError, ValueError):
+        return None
+    if not 0 < hours < float('inf'):
+        return None
+    return (now or time.time()) + hours * 3600
+
+def is_expired(file_meta, now=None):
+    expires_at = file_meta.get('expires_at')
+    return expires_at is not None and (now or time.time()) >= expires_at
+
+def is_locked(file_meta):
+    limit = file_meta.get('visit_limit')
+    return limit is not None and file_meta.get('visit_count', 0) >= limit
+
+
+class Maintenance:
+    # Every web worker starts the scheduler, but only the one holding the
+    # leader lock sweeps; the others take over if it exits. A sweep only looks
+    # at names from the change feed and files with an expiry or visit limit;
+    # the whole catalog and folder are read once every `full_interval`, which
+    # catches files copied in by hand and events that were missed. Work is
+    # split into small catalog transactions with a pause in between so
+    # requests never queue behind a long sweep.
+    def __init__(self, layout, metadata_store, blob_store, compressed_variants, change_feed,
+                 state_path='cdn_maintenance.json', interval=600, grace_period=7 * 24 * 3600,
+                 batch_size=100, pause=0.05, min_age=300, full_interval=24 * 3600):
+        self.layout = layout
+        self.metadata_store = metadata_store
+        self.blob_store = blob_store
+        self.compressed_variants = compressed_variants
+        self.change_feed = change_feed
+        self.state_path = state_path
+        self.lock_path = f"{state_path}.lock"
+        self.leader_path = f"{state_path}.leader"
+        self.interval = interval
+        self.grace_period = grace_period
+        self.batch_size = batch_size
+        self.pause = pause
+        self.min_age = min_age
+        self.full_interval = full_interval
+        self._thread = None
+        self._stopped = threading.Event()
+        self._leader_file = None
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._watched = None
+
+    def start(self):
+        if self._thread is None:
+            self.change_feed.subscribe(self.on_change)
+            self._thread = threading.Thread(target=self._loop, name="maintenance", daemon=True)
+            self._thread.start()
+
+    def _is_leader(self):
+        if self._leader_file is not None:
+            return True
+        lock_file = open(self.leader_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._leader_file = lock_file
+        return True
+
+    def _loop(self):
+        while not self._stopped.wait(min(self.interval, 60)):
+            if not self._is_leader():
+                continue
+            try:
+                self.run()
+            except Exception as e:
+                print(f"Maintenance run failed: {e}")
+
+    def on_change(self, op, name, new_name=None):
+        # Only the leader keeps track; a new leader starts with a full sweep.
+        if self._leader_file is None:
+            return
+        with self._lock:
+            self._changed.update(n for n in (name, new_name) if n)
+
+    def close(self):
+        self._stopped.set()
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_state(self, state):
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def run(self, force=False):
+        with open(self.lock_path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            try:
+                state = self._read_state()
+                if not force and time.time() - state.get('last_run', 0) < self.interval:
+                    return None
+                full = force or self._watched is None or time.time() - state.get('last_full', 0) >= self.full_interval
+                report = self.sweep(state, full)
+                state['last_run'] = time.time()
+                if full:
+                    state['last_full'] = state['last_run']
+                self._write_state(state)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        if any(report.values()):
+            print(f"Maintenance: reclaimed {report['reclaimed']} file(s), pruned {report['pruned']} catalog entries, "
+                  f"adopted {report['adopted']} file(s), removed {report['blobs']} unused blob(s).")
+        return report
+
+    def _watch(self, file_meta):
+        return file_meta.get('expires_at') is not None or file_meta.get('visit_limit') is not None
+
+    def sweep(self, state, full=True):
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        if full:
+            catalog = self.metadata_store.all()
+            on_disk = {name for name, _ in self.layout.files()}
+            checked = set(catalog) | on_disk
+            self._watched = {name for name, meta in catalog.items() if self._watch(meta)}
+        else:
+            checked = changed | set(state.get('orphans', [])) | set(state.get('untracked', []))
+            catalog = {}
+            for name in checked | self._watched:
+                file_meta = self.metadata_store.get(name)
+                if file_meta is not None:
+                    catalog[name] = file_meta
+            on_disk = {name for name in checked if self.layout.exists(name)}
+            for name in checked:
+                if name in catalog and self._watch(catalog[name]): self._watched.add(name)
+                else: self._watched.discard(name)
+        report = {'reclaimed': self.reclaim(catalog)}
+        # A rename or an upload briefly leaves the catalog and the folder out
+        # of step, so only act on names that looked wrong on the last run too.
+        orphans = sorted(name for name in checked if name in catalog and name not in on_disk)
+        untracked = sorted(on_disk - set(catalog))
+        report['pruned'] = self.prune(set(orphans) & set(state.get('orphans', [])))
+        report['adopted'] = self.adopt(set(untracked) & set(state.get('untracked', [])))
+        state['orphans'], state['untracked'] = orphans, untracked
+        report['blobs'] = self.blob_store.gc() if full else 0
+        self.metadata_store.compact()
+        return report
+
+    def _in_batches(self, names, apply):
+        names, done = list(names), 0
+        for start in range(0, len(names), self.batch_size):
+            if self._stopped.is_set():
+                break
+            events = []
+            with self.layout.writing(), self.metadata_store.batch():
+                for name in names[start:start + self.batch_size]:
+                    try:
+                        event = apply(name)
+                    except OSError as e:
+                        print(f"Maintenance could not process {name}: {e}")
+                        continue
+                    if event:
+                        events.append(event)
+            self.change_feed.publish_many(events)
+            done += len(events)
+            time.sleep(self.pause)
+        return done
+
+    def _reclaimable(self, file_meta, now):
+        if is_expired(file_meta, now - self.grace_period):
+            return True
+        locked_at = file_meta.get('locked_at')
+        return is_locked(file_meta) and locked_at is not None and now - locked_at >= self.grace_period
+
+    def reclaim(self, catalog):
+        now = time.time()
+        marks = [name for name, meta in catalog.items() if is_locked(meta) != (meta.get('locked_at') is not None)]
+        candidates = [name for name, meta in catalog.items() if self._reclaimable(meta, now)]
+
+        def mark(name):
+            file_meta = self.metadata_store.get(name)
+            if file_meta is not None:
+                self.metadata_store.update(name, locked_at=now if is_locked(file_meta) else None)
+
+        def reclaim_file(name):
+            file_meta = self.metadata_store.get(name)
+            if file_meta is None or not self._reclaimable(file_meta, now):
+                return None
+            path = self.layout.locate(name)
+            if path is not None:
+                self.blob_store.remove(path, file_meta.get('sha256'))
+            self.metadata_store.delete(name)
+            self.compressed_variants.invalidate(name)
+            return ('delete', name, None)
+
+        self._in_batches(marks, mark)
+        return self._in_batches(candidates, reclaim_file)
+
+    def prune(self, names):
+        def prune_entry(name):
+            if self.layout.exists(name):
+                return None
+            file_meta = self.metadata_store.get(name) or {}
+            self.metadata_store.delete(name)
+            self.blob_store.release(file_meta.get('sha256'))
+            return ('delete', name, None)
+        return self._in_batches(sorted(names), prune_entry)
+
+    def adopt(self, names):
+        # Hashing happens before the transaction opens so writers never wait on it.
+        cutoff, found = time.time() - self.min_age, {}
+        for name in sorted(names):
+            try:
+                with self.layout.writing():
+                    path = self.layout.locate(name)
+                    if path is None or os.stat(path).st_mtime > cutoff:
+                        continue
+                    digest = self.blob_store.adopt(path)
+                    stat = os.stat(path)
+            except OSError:
+                continue
+            found[name] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest}
+
+        def adopt_file(name):
+            if self.metadata_store.get(name) is not None:
+                return None
+            self.metadata_store.update(name, **found[name])
+            return ('upload', name, None)
+        return self._in_batches(found, adopt_file)
+
+
+if __name__ == '__main__':
+    from metadata_store import open_metadata_store
+    from blobstore import BlobStore
+    from compression import CompressedVariants
+    from events import ChangeFeed
+    from layout import FileLayout
+
+    with open('config.json', 'r') as f:
+        config = json.load(f)
+    maintenance_config = config.get('maintenance', {})
+    metadata_store = open_metadata_store(config, 'file_metadata.json', 'cdn_files')
+    maintenance = Maintenance(
+        FileLayout('cdn_files'), metadata_store, BlobStore('cdn_files'),
+        CompressedVariants(config.get('compression', {}).get('cache_dir', 'cdn_cache/compressed')),
+        ChangeFeed('cdn_events.log'),
+        grace_period=maintenance_config.get('grace_period_hours', 168) * 3600,
+        batch_size=maintenance_config.get('batch_size', 100),
+    )
+    report = maintenance.run(force=True)
+    if report is None:
+        print("Another process is running maintenance right now.")
+    elif not any(report.values()):
+        print("Nothing to clean up.")
+    metadata_store.close()
@@ -0,0 +1,386 @@
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import threading
+from contextlib import contextmanager
+from counters import VisitCounters
+
+
+class JsonMetadataStore:
+    def __init__(self, path, counters_path='visit_counts.log', flush_interval=2.0, reload_interval=1.0):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.flush_interval = flush_interval
+        self.reload_interval = reload_interval
+        self._lock = threading.RLock()
+        self._data = {}
+        self._pending = {}
+        self._disk_mtime = None
+        self._last_check = 0.0
+        self._stopped = threading.Event()
+        self.counters = VisitCounters(counters_path)
+        with self._lock:
+            self._reload()
+        self._flusher = threading.Thread(target=self._flush_loop, name="metadata-flush", daemon=True)
+        self._flusher.start()
+
+    def _stat_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read_disk(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+
+    def _reload(self):
+        self._disk_mtime = self._stat_mtime()
+        self._data = self._read_disk()
+        # visit_count lives in the counter log; older catalogs carried it
+        # inline, so seed the log from them the first time it is created.
+        for name, meta in self._data.items():
+            count = meta.pop('visit_count', None)
+            if count and self.counters.created:
+                self.counters.set(name, count)
+        self.counters.created = False
+        for name, meta in self._pending.items():
+            if meta is None: self._data.pop(name, None)
+            else: self._data[name] = meta
+        self._last_check = time.monotonic()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        if self._stat_mtime() != self._disk_mtime:
+            self._reload()
+
+    def _with_count(self, name, meta, counts):
+        meta = dict(meta)
+        if meta.get('visit_limit') is not None:
+            meta['visit_count'] = counts.get(name, 0)
+        return meta
+
+    def get(self, name):
+        with self._lock:
+            self._refresh()
+            meta = self._data.get(name)
+        if meta is None:
+            return None
+        return self._with_count(name, meta, {name: self.counters.get(name)})
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            data = dict(self._data)
+        counts = self.counters.snapshot()
+        return {name: self._with_count(name, meta, counts) for name, meta in data.items()}
+
+    def put(self, name, meta):
+        meta = dict(meta)
+        count = meta.pop('visit_count', 0)
+        with self._lock:
+            self._refresh()
+            self._data[name] = meta
+            self._pending[name] = meta
+        if count: self.counters.set(name, count)
+        else: self.counters.discard(name)
+
+    def update(self, name, **changes):
+        changes.pop('visit_count', None)
+        with self._lock:
+            self._refresh()
+            meta = dict(self._data.get(name, {}))
+            for key, value in changes.items():
+                if value is None: meta.pop(key, None)
+                else: meta[key] = value
+            self._data[name] = meta
+            self._pending[name] = meta
+            return dict(meta)
+
+    def rename(self, old_name, new_name):
+        with self._lock:
+            self._refresh()
+            if old_name not in self._data:
+                return False
+            self._data[new_name] = self._data.pop(old_name)
+            self._pending[new_name] = self._data[new_name]
+            self._pending[old_name] = None
+        self.counters.rename(old_name, new_name)
+        return True
+
+    def delete(self, name):
+        with self._lock:
+            self._refresh()
+            if name not in self._data:
+                return False
+            del self._data[name]
+            self._pending[name] = None
+        self.counters.discard(name)
+        return True
+
+    def set_password(self, name, password):
+        return self.update(name, password=password or None)
+
+    def set_visit_limit(self, name, limit):
+        if limit:
+            return self.update(name, visit_limit=int(limit), locked_at=None)
+        self.counters.discard(name)
+        return self.update(name, visit_limit=None, locked_at=None)
+
+    def set_expiry(self, name, expires_at):
+        return self.update(name, expires_at=expires_at)
+
+    def record_visit(self, name, limit):
+        return self.counters.hit(name, limit)
+
+    @contextmanager
+    def batch(self):
+        # Writes are already buffered and flushed together by the flush thread.
+        yield self
+
+    def compact(self):
+        self.flush()
+        self.counters.compact()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                with open(self.lock_path, 'a') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        data = self._data
+                        if self._stat_mtime() != self._disk_mtime:
+                            data = self._read_disk()
+                            for meta in data.values(): meta.pop('visit_count', None)
+                        for name, meta in pending.items():
+                            if meta is None: data.pop(name, None)
+                            else: data[name] = meta
+                        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                        with open(tmp_path, 'w') as f:
+                            json.dump(data, f, indent=4)
+                            f.flush()
+                            os.fsync(f.fileno())
+                        os.replace(tmp_path, self.path)
+                        self._data = data
+                        self._disk_mtime = self._stat_mtime()
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+            except OSError as e:
+                for name, meta in pending.items():
+                    self._pending.setdefault(name, meta)
+                print(f"Failed to flush metadata to {self.path}: {e}")
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stopped.set()
+        self.flush()
+
+
+class SqliteMetadataStore:
+    COLUMNS = ('password', 'visit_limit', 'visit_count', 'size', 'mtime', 'sha256', 'expires_at', 'locked_at')
+
+    def __init__(self, path, legacy_path=None, counters_path='visit_counts.log', upload_folder=None):
+        self.path = path
+        self._local = threading.local()
+        self._pid = os.getpid()
+        with self._transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0:
+                self._create_schema(conn)
+                if legacy_path and os.path.exists(legacy_path):
+                    self._migrate_json(conn, legacy_path, counters_path, upload_folder)
+            if version == 1:
+                conn.execute("ALTER TABLE files ADD COLUMN sha256 TEXT")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files(sha256)")
+            if version in (1, 2):
+                conn.execute("ALTER TABLE files ADD COLUMN expires_at REAL")
+                conn.execute("ALTER TABLE files ADD COLUMN locked_at REAL")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_files_expires_at ON files(expires_at)")
+            conn.execute("PRAGMA user_version = 3")
+
+    def _conn(self):
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        if getattr(self._local, 'batching', False):
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def batch(self):
+        with self._transaction() as conn:
+            nested = getattr(self._local, 'batching', False)
+            self._local.batching = True
+            try:
+                yield self
+            finally:
+                self._local.batching = nested
+
+    def _create_schema(self, conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                password TEXT,
+                has_password INTEGER GENERATED ALWAYS AS (password IS NOT NULL) VIRTUAL,
+                visit_limit INTEGER,
+                visit_count INTEGER NOT NULL DEFAULT 0,
+                size INTEGER,
+                mtime REAL,
+                sha256 TEXT,
+                expires_at REAL,
+                locked_at REAL
+            )""")
+        for column in ('size', 'mtime', 'visit_count', 'visit_limit', 'has_password', 'sha256', 'expires_at'):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_files_{column} ON files({column})")
+
+    def _migrate_json(self, conn, legacy_path, counters_path, upload_folder):
+        try:
+            with open(legacy_path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return
+        counts = VisitCounters(counters_path).snapshot() if os.path.exists(counters_path) else {}
+        for name, meta in data.items():
+            meta = dict(meta)
+            meta['visit_count'] = counts.get(name, meta.get('visit_count', 0))
+            if upload_folder and 'size' not in meta:
+                try:
+                    st = os.stat(os.path.join(upload_folder, name))
+                    meta['size'], meta['mtime'] = st.st_size, st.st_mtime
+                except FileNotFoundError:
+                    pass
+            self._upsert(conn, name, meta, replace=True)
+        print(f"Migrated {len(data)} metadata entries from {legacy_path} to {self.path}.")
+
+    def _upsert(self, conn, name, meta, replace=False):
+        columns = [c for c in self.COLUMNS if c in meta]
+        if replace:
+            values = [meta.get(c) or 0 if c == 'visit_count' else meta.get(c) for c in self.COLUMNS]
+            conn.execute(
+                f"INSERT OR REPLACE INTO files (name, {', '.join(self.COLUMNS)}) VALUES (?{', ?' * len(self.COLUMNS)})",
+                [name, *values])
+            return
+        if not columns:
+            conn.execute("INSERT OR IGNORE INTO files (name) VALUES (?)", (name,))
+            return
+        assignments = ', '.join(f"{c} = excluded.{c}" for c in columns)
+        conn.execute(
+            f"INSERT INTO files (name, {', '.join(columns)}) VALUES (?{', ?' * len(columns)}) "
+            f"ON CONFLICT(name) DO UPDATE SET {assignments}",
+            [name, *(meta[c] for c in columns)])
+
+    def _row_to_meta(self, row):
+        meta = {c: row[c] for c in self.COLUMNS if row[c] is not None}
+        if row['visit_limit'] is None:
+            meta.pop('visit_count', None)
+        return meta
+
+    def get(self, name):
+        row = self._conn().execute("SELECT * FROM files WHERE name = ?", (name,)).fetchone()
+        return self._row_to_meta(row) if row else None
+
+    def all(self):
+        return {row['name']: self._row_to_meta(row) for row in self._conn().execute("SELECT * FROM files")}
+
+    def put(self, name, meta):
+        self._upsert(self._conn(), name, meta, replace=True)
+
+    def update(self, name, **changes):
+        unknown = set(changes) - set(self.COLUMNS)
+        if unknown:
+            raise KeyError(f"Unknown metadata fields: {', '.join(sorted(unknown))}")
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO files (name) VALUES (?)", (name,))
+            if changes:
+                assignments = ', '.join("visit_count = COALESCE(?, 0)" if c == 'visit_count' else f"{c} = ?" for c in changes)
+                conn.execute(f"UPDATE files SET {assignments} WHERE name = ?", [*changes.values(), name])
+        return self.get(name)
+
+    def rename(self, old_name, new_name):
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM files WHERE name = ?", (old_name,)).fetchone() is None:
+                return False
+            conn.execute("DELETE FROM files WHERE name = ?", (new_name,))
+            conn.execute("UPDATE files SET name = ? WHERE name = ?", (new_name, old_name))
+            return True
+
+    def delete(self, name):
+        return self._conn().execute("DELETE FROM files WHERE name = ?", (name,)).rowcount == 1
+
+    def set_password(self, name, password):
+        return self.update(name, password=password or None)
+
+    def set_visit_limit(self, name, limit):
+        if limit:
+            return self.update(name, visit_limit=int(limit), locked_at=None)
+        return self.update(name, visit_limit=None, visit_count=0, locked_at=None)
+
+    def set_expiry(self, name, expires_at):
+        return self.update(name, expires_at=expires_at)
+
+    def record_visit(self, name, limit):
+        cur = self._conn().execute(
+            "UPDATE files SET visit_count = visit_count + 1 "
+            "WHERE name = ? AND (visit_limit IS NULL OR visit_count < visit_limit)", (name,))
+        return cur.rowcount == 1
+
+    def compact(self):
+        # Runs outside any transaction; VACUUM only once a quarter of the file is free pages.
+        conn = self._conn()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA optimize")
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free_pages * 4 > conn.execute("PRAGMA page_count").fetchone()[0]:
+            conn.execute("VACUUM")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def open_metadata_store(config, metadata_file, upload_folder):
+    backend = config.get('metadata_backend', 'sqlite')
+    if backend == 'json':
+        return JsonMetadataStore(metadata_file)
+    if backend == 'sqlite':
+        return SqliteMetadataStore(config.get('catalog_db', 'catalog.db'), legacy_path=metadata_file, upload_folder=upload_folder)
+    raise ValueError(f"Unknown metadata_backend '{backend}' in config.")
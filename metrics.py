@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS = {
+    'cdn_http_requests_total': ('counter', 'HTTP requests handled, by route, method and status.'),
+    'cdn_http_request_duration_seconds': ('histogram', 'Time until the response headers are ready, by route.'),
+    'cdn_request_phase_seconds': ('histogram', 'Time spent per request in each phase (metadata, auth, filesystem, render, send, app), by route.'),
+    'cdn_bytes_served_total': ('counter', 'Response body bytes sent for files under /files, by file.'),
+    'cdn_visit_lockouts_total': ('counter', 'Requests refused because a file reached its visit limit, by file.'),
+    'cdn_metadata_operation_seconds': ('histogram', 'Time spent in metadata store calls, by operation.'),
+    'cdn_cache_hits_total': ('counter', 'Cache lookups that were served from the cache.'),
+    'cdn_cache_misses_total': ('counter', 'Cache lookups that had to read or build the data.'),
+    'cdn_cache_bytes': ('gauge', 'Bytes currently held by each cache.'),
+    'cdn_cache_hit_ratio': ('gauge', 'Hits divided by lookups, over all processes.'),
+    'cdn_access_log_dropped_total': ('counter', 'Access log records dropped because the buffer was full.'),
+    'cdn_admission_rejections_total': ('counter', 'Requests refused by rate limits or the large-transfer cap, by reason.'),
+    'cdn_large_transfers': ('gauge', 'Large downloads in progress and waiting for a slot.'),
+    'cdn_bot_commands_total': ('counter', 'Discord commands handled, by command and outcome.'),
+    'cdn_bot_command_duration_seconds': ('histogram', 'Time from the Discord interaction to command completion.'),
+}
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+class Metrics:
+    # Each process keeps its own registry and periodically writes it to
+    # <directory>/<role>-<pid>.json; render() adds up every live process.
+    def __init__(self, directory, role, interval=5.0):
+        self.directory = directory
+        self.role = role
+        self.interval = interval
+        self.path = os.path.join(directory, f"{role}-{os.getpid()}.json")
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._shared_collectors = []
+        self._thread = None
+        self._stopped = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def time_methods(self, obj, name, methods):
+        for method in methods:
+            original = getattr(obj, method, None)
+            if original is None:
+                continue
+            def timed(*args, _original=original, _op=method.lstrip('_'), **kwargs):
+                with self.timer(name, op=_op):
+                    return _original(*args, **kwargs)
+            setattr(obj, method, timed)
+
+    def collect(self, callback, shared=False):
+        # Shared collectors report state that every process sees alike, such
+        # as a cache directory, so they are read once by render() instead of
+        # being added up over the processes.
+        (self._shared_collectors if shared else self._collectors).append(callback)
+
+    def snapshot(self):
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()]
+        for callback in self._collectors:
+            try:
+                counters += [[name, sorted(labels.items()), value] for name, labels, value in callback()]
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return {'pid': os.getpid(), 'role': self.role, 'counters': counters, 'histograms': histograms}
+
+    def write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, self.path)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._write_loop, name="metrics-writer", daemon=True)
+            self._thread.start()
+
+    def _write_loop(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Failed to write metrics snapshot: {e}")
+
+    def close(self):
+        self._stopped.set()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _snapshots(self):
+        snapshots = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, 'r') as f:
+                    snapshot = json.load(f)
+                os.kill(snapshot['pid'], 0)
+            except PermissionError:
+                pass
+            except (OSError, ValueError, KeyError):
+                try:
+                    if time.time() - entry.stat().st_mtime > 10 * self.interval:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+                continue
+            snapshots.append(snapshot)
+        return snapshots
+
+    def render(self):
+        self.write()
+        counters, histograms = {}, {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                totals = histograms.setdefault(key, [0] * len(values))
+                histograms[key] = [a + b for a, b in zip(totals, values)]
+        for callback in self._shared_collectors:
+            try:
+                for name, labels, value in callback():
+                    counters[(name, tuple(sorted(labels.items())))] = value
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        for (name, labels), hits in list(counters.items()):
+            if name == 'cdn_cache_hits_total':
+                lookups = hits + counters.get(('cdn_cache_misses_total', labels), 0)
+                counters[('cdn_cache_hit_ratio', labels)] = hits / lookups if lookups else 0.0
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            series = sorted((labels, value) for (metric, labels), value in counters.items() if metric == name)
+            series_histograms = sorted((labels, values) for (metric, labels), values in histograms.items() if metric == name)
+            if not series and not series_histograms:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series:
+                lines.append(f"{name}{format_labels(labels)} {value}")
+            for labels, values in series_histograms:
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {values[-1]}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
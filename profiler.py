@@ -0,0 +1,216 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+_current = contextvars.ContextVar('request_trace', default=None)
+
+
+class RequestTrace:
+    # Splits a request's time into phases. Phases nest but are counted
+    # exclusively, so a template rendered during the auth check is 'render'
+    # time, not 'auth' time. Whatever is left over is 'app'.
+    def __init__(self, method, path, route):
+        self.method = method
+        self.path = path
+        self.route = route
+        self.status = None
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._stack = []
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            parent = self._stack[-1]
+            self.phases[parent[0]] = self.phases.get(parent[0], 0.0) + now - parent[1]
+        self._stack.append([name, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        name, entered = self._stack.pop()
+        self.phases[name] = self.phases.get(name, 0.0) + now - entered
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def finish(self):
+        while self._stack:
+            self.exit()
+        total = time.perf_counter() - self.started
+        return total, {**self.phases, 'app': max(0.0, total - sum(self.phases.values()))}
+
+
+def start_trace(method, path, route):
+    trace = RequestTrace(method, path, route)
+    _current.set(trace)
+    return trace
+
+def current_trace():
+    return _current.get()
+
+def end_trace():
+    _current.set(None)
+
+@contextmanager
+def phase(name):
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    trace.enter(name)
+    try:
+        yield
+    finally:
+        trace.exit()
+
+def trace_methods(obj, name, methods):
+    for method in methods:
+        original = getattr(obj, method, None)
+        if original is None:
+            continue
+        def traced(*args, _original=original, **kwargs):
+            with phase(name):
+                return _original(*args, **kwargs)
+        setattr(obj, method, traced)
+
+
+class SlowRequestLog:
+    # One JSON line per request slower than `threshold` seconds. Slow requests
+    # are rare, so lines are appended straight away; the file is rotated once
+    # to <path>.1 at `max_bytes`.
+    def __init__(self, path, threshold, max_bytes=16 * 1024 * 1024):
+        self.path = path
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+
+    def record(self, trace, total, phases):
+        if total < self.threshold:
+            return
+        line = json.dumps({'t': round(time.time(), 3), 'method': trace.method, 'path': trace.path,
+                           'route': trace.route, 'status': trace.status, 'ms': round(total * 1000, 2),
+                           'phases': {key: round(value * 1000, 2) for key, value in sorted(phases.items())}},
+                          separators=(',', ':'))
+        try:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+                size = f.tell()
+            if size > self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+        except OSError as e:
+            print(f"Failed to write the slow request log: {e}")
+
+
+def frame_label(code):
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)})"
+
+def thread_label(name):
+    # Worker threads differ only by number; merge them into one tower.
+    return re.sub(r'-\d+(_\d+)?', '', name or 'thread').replace(';', ',')
+
+
+class Sampler:
+    # A profile is started in every process at once through the change feed:
+    # each one samples its threads' stacks for the requested time and writes
+    # <directory>/<id>/<role>-<pid>.folded in the collapsed-stack format that
+    # flamegraph.pl and speedscope read ("frame;frame;frame count").
+    def __init__(self, directory, role, interval=0.01, max_seconds=60):
+        self.directory = directory
+        self.role = role
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._running = False
+
+    def on_change(self, op, name, new_name):
+        if op == 'profile':
+            try:
+                self.start(name, float(new_name))
+            except (TypeError, ValueError):
+                pass
+
+    def start(self, profile_id, seconds):
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+        threading.Thread(target=self._run, args=(profile_id, min(seconds, self.max_seconds)),
+                         name="profiler", daemon=True).start()
+        return True
+
+    def _run(self, profile_id, seconds):
+        try:
+            self._write(profile_id, self.sample(seconds))
+        except OSError as e:
+            print(f"Failed to write profile {profile_id}: {e}")
+        finally:
+            with self._lock:
+                self._running = False
+
+    def sample(self, seconds):
+        own = threading.get_ident()
+        counts = {}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                key = ';'.join([self.role, thread_label(names.get(ident))] + stack[::-1])
+                counts[key] = counts.get(key, 0) + 1
+            time.sleep(self.interval)
+        return counts
+
+    def _write(self, profile_id, counts):
+        directory = os.path.join(self.directory, profile_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.role}-{os.getpid()}.folded")
+        with open(f"{path}.tmp", 'w') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in counts.items())
+        os.replace(f"{path}.tmp", path)
+
+    def profile(self, change_feed, seconds, settle=3.0):
+        # Blocks for the whole run; processes pick the event up within a poll
+        # interval of each other, so the results are collected a bit later.
+        seconds = min(seconds, self.max_seconds)
+        profile_id = uuid.uuid4().hex
+        self._clean()
+        change_feed.publish('profile', profile_id, str(seconds))
+        time.sleep(seconds + settle)
+        return self.collect(profile_id)
+
+    def collect(self, profile_id):
+        directory = os.path.join(self.directory, profile_id)
+        counts, processes = {}, 0
+        try:
+            entries = [entry.path for entry in os.scandir(directory) if entry.name.endswith('.folded')]
+        except FileNotFoundError:
+            entries = []
+        for path in entries:
+            processes += 1
+            with open(path, 'r') as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    counts[stack] = counts.get(stack, 0) + int(count)
+        shutil.rmtree(directory, ignore_errors=True)
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(counts.items())), processes
+
+    def _clean(self, max_age=3600):
+        # Left behind by processes that finished after their profile was collected.
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_dir() and time.time() - entry.stat().st_mtime > max_age:
+                shutil.rmtree(entry.path, ignore_errors=True)
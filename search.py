@@ -0,0 +1,164 @@
+import re
+import heapq
+import time
+import threading
+
+
+FLAGS = ('password', 'limited', 'locked', 'near-limit', 'public', 'expiring', 'expired')
+NEAR_LIMIT_RATIO = 0.8
+
+
+def grams(text):
+    text = text.lower()
+    return {text[i:i + n] for n in (2, 3) for i in range(len(text) - n + 1)}
+
+def parse_query(query):
+    flags = set()
+    terms = []
+    for token in query.split():
+        if token.lower().startswith('is:') and token[3:].lower() in FLAGS:
+            flags.add(token[3:].lower())
+        else:
+            terms.append(token.lower())
+    return terms, flags
+
+
+class SearchIndex:
+    def __init__(self, file_index, metadata_store):
+        self.file_index = file_index
+        self.metadata_store = metadata_store
+        self._lock = threading.RLock()
+        self._names = set()
+        self._postings = {}
+        self._password = set()
+        self._limited = set()
+        self._expiring = {}
+        self._built = False
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        with self._lock:
+            if self._built:
+                return
+            metadata = self.metadata_store.all()
+            for name in self.file_index.names():
+                self._add(name, metadata.get(name))
+            self._built = True
+
+    def _add(self, name, file_meta):
+        self._names.add(name)
+        for gram in grams(name):
+            self._postings.setdefault(gram, set()).add(name)
+        file_meta = file_meta or {}
+        if file_meta.get('password'): self._password.add(name)
+        if file_meta.get('visit_limit') is not None: self._limited.add(name)
+        if file_meta.get('expires_at') is not None: self._expiring[name] = file_meta['expires_at']
+
+    def _remove(self, name):
+        if name not in self._names:
+            return
+        self._names.discard(name)
+        for gram in grams(name):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(name)
+                if not postings:
+                    del self._postings[gram]
+        self._password.discard(name)
+        self._limited.discard(name)
+        self._expiring.pop(name, None)
+
+    def on_change(self, op, name, new_name=None):
+        if not self._built:
+            return
+        with self._lock:
+            if op in ('delete', 'rename'):
+                self._remove(name)
+            if op == 'rename' and new_name:
+                self._remove(new_name)
+                self._add(new_name, self.metadata_store.get(new_name))
+            elif op in ('upload', 'update'):
+                self._remove(name)
+                self._add(name, self.metadata_store.get(name))
+
+    def _candidates(self, terms):
+        # Each term's grams are looked up on their own; single characters have
+        # none, so they are only checked as substrings by _matches.
+        if not terms:
+            return set(self._names)
+        postings = sorted((self._postings.get(gram, set()) for term in terms for gram in grams(term)), key=len)
+        if not postings:
+            return set(self._names)
+        if not postings[0]:
+            return set()
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates &= other
+            if not candidates:
+                break
+        return candidates
+
+    def _flag_matches(self, name, flags, counts):
+        if 'password' in flags and name not in self._password: return False
+        if 'limited' in flags and name not in self._limited: return False
+        if 'public' in flags and (name in self._password or name in self._limited): return False
+        if flags & {'expiring', 'expired'}:
+            expires_at = self._expiring.get(name)
+            if expires_at is None: return False
+            if 'expiring' in flags and expires_at <= time.time(): return False
+            if 'expired' in flags and expires_at > time.time(): return False
+        if flags & {'locked', 'near-limit'}:
+            file_meta = counts.get(name)
+            if file_meta is None: return False
+            limit, count = file_meta.get('visit_limit'), file_meta.get('visit_count', 0)
+            if limit is None: return False
+            if 'locked' in flags and count < limit: return False
+            if 'near-limit' in flags and not (NEAR_LIMIT_RATIO * limit <= count < limit): return False
+        return True
+
+    def _score(self, name, terms):
+        # Ranked by how the first term matches; every term is in the name.
+        lowered = name.lower()
+        if not terms: return (3, len(name), lowered)
+        text = terms[0]
+        stem = lowered.rsplit('.', 1)[0]
+        if lowered == text or stem == text: return (0, len(name), lowered)
+        if lowered.startswith(text): return (1, len(name), lowered)
+        if re.search(rf"(^|[\W_]){re.escape(text)}", lowered): return (2, len(name), lowered)
+        return (3, len(name), lowered)
+
+    def _matches(self, terms, flags):
+        with self._lock:
+            if flags & {'password'} and not terms:
+                candidates = set(self._password)
+            elif flags & {'limited', 'locked', 'near-limit'} and not terms:
+                candidates = set(self._limited)
+            elif flags & {'expiring', 'expired'} and not terms:
+                candidates = set(self._expiring)
+            else:
+                candidates = self._candidates(terms)
+        if terms:
+            candidates = {name for name in candidates if all(term in name.lower() for term in terms)}
+        if flags:
+            counts = {}
+            if flags & {'locked', 'near-limit'}:
+                counts = {name: self.metadata_store.get(name) for name in candidates & self._limited}
+            candidates = {name for name in candidates if self._flag_matches(name, flags, counts)}
+        return candidates
+
+    def matching(self, flag):
+        # Every file with the flag, for filtering the sorted file list.
+        self._ensure_built()
+        return self._matches([], {flag})
+
+    def find(self, query, limit=25, offset=0):
+        # One page of names in rank order, and how many matched in all.
+        self._ensure_built()
+        terms, flags = parse_query(query or '')
+        candidates = self._matches(terms, flags)
+        best = heapq.nsmallest(offset + limit, ((self._score(name, terms), name) for name in candidates))
+        return [name for _, name in best[offset:]], len(candidates)
+
+    def search(self, query, limit=25):
+        return self.find(query, limit)[0]
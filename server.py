@@ -2,24 +2,59 @@ import os
 import sys
 import uuid
 import json
+import time
+import hmac
+import atexit
+import shutil
 import datetime
+import mimetypes
 from getpass import getpass
-from flask import Flask, request, send_from_directory, render_template, redirect, url_for, session, flash, abort, jsonify
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask import Flask, Response, request, render_template, redirect, url_for, session, flash, abort, jsonify, g
+from flask import before_render_template, template_rendered
+from werkzeug.security import check_password_hash, generate_password_hash, safe_join
 from werkzeug.utils import secure_filename
+from metadata_store import open_metadata_store
+from delivery import StaticFile
+from compression import CompressedVariants
+from bytecache import ByteCache
+from events import ChangeFeed
+from uploads import ResumableUploads, UploadError
+from listing import FileIndex
+from search import SearchIndex, FLAGS
+from blobstore import BlobStore, CHUNK_SIZE
+from layout import FileLayout, valid_name
+from metrics import Metrics
+from batch import BatchOperations, BatchError
+from maintenance import Maintenance, expiry_time, is_expired
+from images import ImageDerivatives, IMAGE_TYPES
+from video import VideoVariants, VIDEO_TYPES, rewrite_playlist
+from tokens import DownloadTokens, ensure_secret_key
+from accesslog import AccessLog
+from admission import Admission
+from profiler import Sampler, SlowRequestLog, start_trace, current_trace, end_trace, phase, trace_methods
+from edge import NodeClient, EdgeCache, OriginCatalog, OriginTokenCounters, EdgeNotifier, OriginError
 
 
 CONFIG_FILE = 'config.json'
 METADATA_FILE = 'file_metadata.json'
+EVENTS_FILE = 'cdn_events.log'
 UPLOAD_FOLDER = 'cdn_files'
+STATIC_FOLDER = 'static'
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'webm'}
+PAGE_SIZE = 50
+EDGE_ENDPOINTS = {'serve_file', 'hls_playlist', 'hls_media', 'node_invalidate', 'metrics_endpoint'}
+FILE_ENDPOINTS = {'serve_file', 'hls_playlist', 'hls_media'}
 
 
+def load_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return ensure_secret_key(json.load(f), CONFIG_FILE)
+
 def load_or_create_config():
     if os.path.exists(CONFIG_FILE):
         print(f"Loading configuration from {CONFIG_FILE}...")
         with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
+            return ensure_secret_key(json.load(f), CONFIG_FILE)
 
     print("--- CDN First-Time Setup ---")
     config = {}
@@ -35,19 +70,6 @@ def load_or_create_config():
     print(f"Configuration saved to {CONFIG_FILE}. Please do not share this file.")
     return config
 
-def load_metadata():
-    if not os.path.exists(METADATA_FILE):
-        return {}
-    try:
-        with open(METADATA_FILE, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {}
-
-def save_metadata(data):
-    with open(METADATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
-
 
 def run_initial_setup():
     
@@ -62,7 +84,8 @@ def run_initial_setup():
     
     templates = {
         "password.html": """<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>Password Required</title><style>body{font-family:sans-serif;background:#f4f4f9;display:flex;justify-content:center;align-items:center;height:100vh;margin:0;} .card{background:white;padding:40px;border-radius:12px;box-shadow:0 4px 20px rgba(0,0,0,0.1);text-align:center;} input[type=password],input[type=submit]{width:calc(100% - 22px);padding:10px;margin:10px 0;border:1px solid #ccc;border-radius:5px;} input[type=submit]{background:#007bff;color:white;cursor:pointer;}</style></head><body><div class="card"><h2>Password Required for {{ filename }}</h2><form method="post"><input type="password" name="password" placeholder="Enter password" required autofocus><input type="submit" value="Access File"></form></div></body></html>""",
-        "locked.html": """<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>File Locked</title><style>body{font-family:sans-serif;background:#f4f4f9;display:flex;justify-content:center;align-items:center;height:100vh;margin:0;} .card{background:white;padding:40px;border-radius:12px;box-shadow:0 4px 20px rgba(0,0,0,0.1);text-align:center;color:#721c24;background-color:#f8d7da;border:1px solid #f5c6cb;}</style></head><body><div class="card"><h2>File Locked</h2><p>The file <strong>{{ filename }}</strong> has reached its visit limit and can no longer be accessed.</p></div></body></html>"""
+        "locked.html": """<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>File Locked</title><style>body{font-family:sans-serif;background:#f4f4f9;display:flex;justify-content:center;align-items:center;height:100vh;margin:0;} .card{background:white;padding:40px;border-radius:12px;box-shadow:0 4px 20px rgba(0,0,0,0.1);text-align:center;color:#721c24;background-color:#f8d7da;border:1px solid #f5c6cb;}</style></head><body><div class="card"><h2>File Locked</h2><p>The file <strong>{{ filename }}</strong> has reached its visit limit and can no longer be accessed.</p></div></body></html>""",
+        "expired.html": """<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>File Expired</title><style>body{font-family:sans-serif;background:#f4f4f9;display:flex;justify-content:center;align-items:center;height:100vh;margin:0;} .card{background:white;padding:40px;border-radius:12px;box-shadow:0 4px 20px rgba(0,0,0,0.1);text-align:center;color:#721c24;background-color:#f8d7da;border:1px solid #f5c6cb;}</style></head><body><div class="card"><h2>File Expired</h2><p>The file <strong>{{ filename }}</strong> has expired and can no longer be accessed.</p></div></body></html>"""
     }
     for name, content in templates.items():
         template_path = os.path.join(templates_dir, name)
@@ -72,38 +95,444 @@ def run_initial_setup():
             print(f"Created template: {name}")
 
 
-config = load_or_create_config()
+def server_settings():
+    settings = {
+        'mode': 'development', 'host': '0.0.0.0', 'port': 5000,
+        'workers': 4, 'threads': 8, 'keepalive': 5, 'timeout': 120, 'graceful_timeout': 30,
+        'pidfile': 'server.pid',
+    }
+    settings.update(config.get('server', {}))
+    return settings
+
+def run_production_server(settings):
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.util import import_app
+
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{settings['host']}:{settings['port']}")
+            self.cfg.set('worker_class', 'gthread')
+            for key in ('workers', 'threads', 'keepalive', 'timeout', 'graceful_timeout', 'pidfile'):
+                self.cfg.set(key, settings[key])
+
+        def load(self):
+            return import_app('server:app')
+
+    ProductionServer().run()
+
+
+# Only the launching process may prompt for first-time setup; production
+# workers import this module after the config file already exists.
+config = load_or_create_config() if __name__ == '__main__' else load_config()
 ADMIN_ROUTE_PATH = config['admin_path']
-app = Flask(__name__)
+
+# In production the launcher stops here: gunicorn's workers import this
+# module after the fork and each builds its own stores, caches and
+# background threads, so the master holds none of them.
+if __name__ == '__main__':
+    run_initial_setup()
+    settings = server_settings()
+    print("\nStarting server...")
+    print(f"Your permanent admin panel is available at: http://127.0.0.1:{settings['port']}/{ADMIN_ROUTE_PATH}")
+    if settings['mode'] == 'production':
+        run_production_server(settings)
+        sys.exit(0)
+
+app = Flask(__name__, static_folder=None)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024
 app.secret_key = config['secret_key']
-
-
-def get_file_info():
+# An edge node keeps no catalog or uploads of its own: it reads both from
+# the origin and holds a bounded copy of the files it has served.
+node_config = config.get('node', {})
+edge_cache = None
+if node_config.get('role', 'origin') == 'edge':
+    origin = NodeClient(node_config['origin_url'], node_config.get('secret', ''))
+    metadata_store = OriginCatalog(origin, ttl=node_config.get('revalidate', 60))
+    edge_cache = EdgeCache(
+        node_config.get('cache_dir', 'cdn_edge_cache'), origin,
+        max_bytes=node_config.get('max_bytes', 10 * 1024 * 1024 * 1024),
+        revalidate=node_config.get('revalidate', 60),
+    )
+else:
+    metadata_store = open_metadata_store(config, METADATA_FILE, UPLOAD_FOLDER)
+atexit.register(metadata_store.close)
+compression_config = config.get('compression', {})
+compressed_variants = CompressedVariants(
+    compression_config.get('cache_dir', 'cdn_cache/compressed'),
+    max_bytes=compression_config.get('max_bytes', 256 * 1024 * 1024),
+    min_size=compression_config.get('min_size', 256),
+)
+tokens_config = config.get('tokens', {})
+download_tokens = DownloadTokens(
+    config['secret_key'],
+    default_ttl=tokens_config.get('default_ttl_hours', 24) * 3600,
+    max_ttl=tokens_config.get('max_ttl_hours', 720) * 3600,
+    counters=OriginTokenCounters(origin) if edge_cache is not None else None,
+)
+images_config = config.get('images', {})
+image_derivatives = ImageDerivatives(
+    images_config.get('cache_dir', 'cdn_cache/images'),
+    max_bytes=images_config.get('max_bytes', 256 * 1024 * 1024),
+    workers=images_config.get('workers', 2),
+    max_width=images_config.get('max_width', 2048),
+)
+atexit.register(image_derivatives.close)
+video_config = config.get('video', {})
+video_variants = VideoVariants(
+    video_config.get('cache_dir', 'cdn_cache/video'),
+    max_bytes=video_config.get('max_bytes', 4 * 1024 * 1024 * 1024),
+    workers=video_config.get('workers', 1),
+    faststart=video_config.get('faststart', True),
+    hls=video_config.get('hls', True),
+    segment_seconds=video_config.get('segment_seconds', 6),
+)
+atexit.register(video_variants.close)
+byte_cache_config = config.get('byte_cache', {})
+byte_cache = None
+if byte_cache_config.get('enabled', True):
+    byte_cache = ByteCache(
+        max_bytes=byte_cache_config.get('max_bytes', 64 * 1024 * 1024),
+        max_item_bytes=byte_cache_config.get('max_item_bytes', 1024 * 1024),
+        policy=byte_cache_config.get('policy', 'tinylfu'),
+    )
+change_feed = ChangeFeed(EVENTS_FILE)
+atexit.register(change_feed.close)
+resumable_uploads = ResumableUploads(UPLOAD_FOLDER, app.config['MAX_CONTENT_LENGTH'])
+blob_store = BlobStore(UPLOAD_FOLDER)
+layout = FileLayout(UPLOAD_FOLDER)
+batch_operations = BatchOperations(layout, metadata_store, blob_store, compressed_variants, change_feed)
+
+file_index = FileIndex(layout, rescan_interval=config.get('listing_rescan_interval', 300), metadata_store=metadata_store)
+search_index = SearchIndex(file_index, metadata_store)
+
+admission = Admission(config.get('admission', {}))
+
+access_log_config = config.get('access_log', {})
+access_log = None
+if access_log_config.get('enabled', True):
+    access_log = AccessLog(
+        access_log_config.get('dir', 'cdn_access'), config['secret_key'],
+        interval=access_log_config.get('interval', 2),
+        max_bytes=access_log_config.get('max_bytes', 16 * 1024 * 1024),
+        keep=access_log_config.get('keep', 5),
+        buffer_size=access_log_config.get('buffer_size', 65536),
+    )
+    access_log.start()
+    atexit.register(access_log.close)
+
+def on_file_changed(op, name, new_name):
+    if op == 'profile':
+        return
+    file_index.on_change(op, name, new_name)
+    search_index.on_change(op, name, new_name)
+    if op in ('upload', 'rename', 'delete'):
+        image_derivatives.invalidate(name)
+        video_variants.invalidate(name)
+    if edge_cache is not None:
+        for changed in filter(None, (name, new_name)):
+            edge_cache.invalidate(changed)
+            metadata_store.invalidate(changed)
+    if access_log is not None and op == 'rename':
+        access_log.rename(name, new_name)
+    elif access_log is not None and op == 'delete':
+        access_log.forget(name)
+    if byte_cache is not None:
+        byte_cache.invalidate(name)
+        if new_name: byte_cache.invalidate(new_name)
+
+change_feed.subscribe(on_file_changed)
+if edge_cache is None and node_config.get('edges'):
+    change_feed.subscribe(EdgeNotifier(node_config['edges'], node_config.get('secret', '')).on_change)
+
+metrics_config = config.get('metrics', {})
+metrics = Metrics(metrics_config.get('dir', 'cdn_metrics'), 'server', interval=metrics_config.get('interval', 5))
+metrics.time_methods(metadata_store, 'cdn_metadata_operation_seconds',
+                     ('get', 'all', 'put', 'update', 'rename', 'delete', 'record_visit', 'flush', '_reload'))
+
+profiling_config = config.get('profiling', {})
+sampler = Sampler(profiling_config.get('dir', 'cdn_profiles'), 'server',
+                  interval=1 / profiling_config.get('sample_hz', 100),
+                  max_seconds=profiling_config.get('max_seconds', 60))
+change_feed.subscribe(sampler.on_change)
+slow_requests = None
+if profiling_config.get('slow_request_ms'):
+    slow_requests = SlowRequestLog(profiling_config.get('slow_log', 'cdn_slow_requests.log'),
+                                   profiling_config['slow_request_ms'] / 1000)
+trace_methods(metadata_store, 'metadata', ('get', 'all', 'put', 'update', 'rename', 'delete', 'record_visit'))
+trace_methods(download_tokens, 'auth', ('verify', 'issue', 'record_visit'))
+
+@before_render_template.connect_via(app)
+def start_render(sender, **extra):
+    if (trace := current_trace()) is not None:
+        trace.enter('render')
+
+@template_rendered.connect_via(app)
+def end_render(sender, **extra):
+    if (trace := current_trace()) is not None:
+        trace.exit()
+
+def finish_trace(trace):
+    total, phases = trace.finish()
+    for name, seconds in phases.items():
+        metrics.observe('cdn_request_phase_seconds', seconds, route=trace.route, phase=name)
+    if slow_requests is not None:
+        slow_requests.record(trace, total, phases)
+
+def cache_metrics():
+    samples = []
+    byte_stats = byte_cache.stats() if byte_cache else None
+    for cache, stats in (('compression', compressed_variants.stats()), ('images', image_derivatives.stats()),
+                         ('video', video_variants.stats()), ('bytes', byte_stats)):
+        if stats is not None:
+            samples += [('cdn_cache_hits_total', {'cache': cache}, stats['hits']),
+                        ('cdn_cache_misses_total', {'cache': cache}, stats['misses'])]
+    # The byte cache is in each worker's memory, so its size adds up.
+    if byte_stats is not None:
+        samples.append(('cdn_cache_bytes', {'cache': 'bytes'}, byte_stats['bytes']))
+    return samples
+
+# The disk caches are shared by all workers; their size is read from the
+# directory when /metrics is rendered.
+def disk_cache_metrics():
+    return [('cdn_cache_bytes', {'cache': cache}, variants.size())
+            for cache, variants in (('compression', compressed_variants), ('images', image_derivatives),
+                                    ('video', video_variants))]
+
+metrics.collect(cache_metrics)
+metrics.collect(disk_cache_metrics, shared=True)
+
+if access_log is not None:
+    metrics.collect(lambda: [('cdn_access_log_dropped_total', {}, access_log.dropped)])
+metrics.collect(lambda: [('cdn_large_transfers', {'state': 'active'}, admission.transfers.active),
+                         ('cdn_large_transfers', {'state': 'waiting'}, admission.transfers.waiting)])
+metrics.start()
+atexit.register(metrics.close)
+
+maintenance_config = config.get('maintenance', {})
+maintenance = Maintenance(
+    layout, metadata_store, blob_store, compressed_variants, change_feed,
+    interval=maintenance_config.get('interval', 600),
+    grace_period=maintenance_config.get('grace_period_hours', 168) * 3600,
+    batch_size=maintenance_config.get('batch_size', 100),
+    full_interval=maintenance_config.get('full_scan_hours', 24) * 3600,
+)
+if maintenance_config.get('enabled', True) and edge_cache is None:
+    maintenance.start()
+    atexit.register(maintenance.close)
+
+
+def describe_files(items):
     files = []
-    metadata = load_metadata()
-    if not os.path.exists(UPLOAD_FOLDER): return files
-    for filename in sorted(os.listdir(UPLOAD_FOLDER), reverse=True):
-        path = os.path.join(UPLOAD_FOLDER, filename)
-        if os.path.isfile(path):
-            size_in_bytes = os.path.getsize(path)
-            size = f"{size_in_bytes / 1024:.1f} KB" if size_in_bytes < 1024*1024 else f"{size_in_bytes / (1024*1024):.1f} MB"
-            mtime = os.path.getmtime(path)
-            file_meta = metadata.get(filename, {})
-            files.append({
-                'name': filename, 'size': size, 'modified_raw': mtime,
-                'modified': datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M'),
-                'password': file_meta.get('password'),
-                'visit_limit': file_meta.get('visit_limit'),
-                'visit_count': file_meta.get('visit_count', 0)
-            })
-    files.sort(key=lambda x: x['modified_raw'], reverse=True)
+    for item in items:
+        size_in_bytes, mtime = item['size'], item['mtime']
+        size = f"{size_in_bytes / 1024:.1f} KB" if size_in_bytes < 1024*1024 else f"{size_in_bytes / (1024*1024):.1f} MB"
+        file_meta = metadata_store.get(item['name']) or {}
+        expires_at = file_meta.get('expires_at')
+        files.append({
+            'name': item['name'], 'size': size, 'size_raw': size_in_bytes, 'modified_raw': mtime,
+            'modified': datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M'),
+            'password': file_meta.get('password'),
+            'visit_limit': file_meta.get('visit_limit'),
+            'visit_count': file_meta.get('visit_count', 0),
+            'expires_at': expires_at,
+            'expires': datetime.datetime.fromtimestamp(expires_at).strftime('%Y-%m-%d %H:%M') if expires_at else None,
+            'expired': is_expired(file_meta),
+            'thumbnail': image_derivatives.available and mimetypes.guess_type(item['name'])[0] in IMAGE_TYPES
+        })
     return files
 
+def get_file_info(sort='modified', descending=True, cursor=None, limit=PAGE_SIZE, query=None, status=None):
+    # Text queries are ranked by the search index instead of paged in sort order.
+    if query:
+        # Ranked results page by offset; the cursor is the offset of the next page.
+        offset = int(cursor) if cursor and cursor.isdigit() else 0
+        names, total = search_index.find(f"{query} is:{status}" if status else query, limit=limit, offset=offset)
+        items = [item for item in map(file_index.get, names) if item is not None]
+        next_cursor = str(offset + limit) if offset + limit < total else None
+        return describe_files(items), next_cursor, total
+    # The matching names come from the search index's flag sets, worked out
+    # before the file index is locked, so paging never reads the catalog.
+    predicate = search_index.matching(status).__contains__ if status in FLAGS else None
+    page = file_index.page(sort=sort, descending=descending, cursor=cursor, limit=limit, predicate=predicate)
+    return describe_files(page['items']), page['next_cursor'], page['total']
+
+def send_static_file(static_file, name, cache_control='no-cache'):
+    if byte_cache is not None and request.method == 'GET' and not static_file.not_modified(request):
+        byte_cache.load(static_file, name)
+    release = None
+    if admission.enabled and request.method == 'GET' and \
+            static_file.transfer_size(request) >= admission.large_transfer_bytes:
+        slot = admission.transfers.acquire(timeout=admission.queue_timeout)
+        if slot is None:
+            metrics.inc('cdn_admission_rejections_total', reason='transfers')
+            abort(503, description='Too many large downloads right now, try again shortly.',
+                  retry_after=admission.retry_after)
+        release = lambda: admission.transfers.release(slot)
+    # The send phase lasts until the server has written the whole body.
+    trace = g.get('trace')
+    def sent():
+        if release: release()
+        if trace is not None: finish_trace(trace)
+    if trace is not None:
+        trace.enter('send')
+        g.streaming = True
+    try:
+        return static_file.response(request, cache_control=cache_control, on_close=sent)
+    except OSError:
+        sent()
+        raise
+
+@phase('filesystem')
+def file_path(name):
+    if edge_cache is not None:
+        return edge_cache.get(name) if valid_name(name) else None
+    return layout.locate(name)
+
+@phase('filesystem')
+def open_file(name, path, file_meta=None):
+    if edge_cache is not None:
+        return edge_cache.open(name, path)
+    return StaticFile(path, digest=blob_store.verified(path, (file_meta or {}).get('sha256')))
+
+@phase('filesystem')
+def select_variant(static_file, name, derivative=None):
+    if derivative is not None:
+        return image_derivatives.select(static_file, name, *derivative)
+    if static_file.mimetype in VIDEO_TYPES:
+        return video_variants.select(static_file, name)
+    return compressed_variants.select(static_file, name, request)
+
+@phase('auth')
+def access_denied(name, file_meta):
+    if is_expired(file_meta):
+        return render_template('expired.html', filename=name), 410
+    limit = file_meta.get('visit_limit')
+    if limit is not None and file_meta.get('visit_count', 0) >= limit:
+        metrics.inc('cdn_visit_lockouts_total', file=name)
+        return render_template('locked.html', filename=name), 403
+    password = file_meta.get('password')
+    submitted = request.form.get('password') or request.args.get('password')
+    if password and submitted != password:
+        if submitted:
+            admission.password_failures.take(admission.client(request))
+        return render_template('password.html', filename=name)
+    return None
+
+def record_token_visit(name, grant):
+    # Links to visit-limited files always carry a quota, and their visits
+    # count against the file too, so no number of links outlasts its limit.
+    if grant['visits'] is None:
+        return True
+    # The file's limit is checked before the link's quota is spent, so a
+    # locked file doesn't use up the link. If another download takes the last
+    # visit in between, the file is locked anyway.
+    file_meta = metadata_store.get(name) or {}
+    limit = file_meta.get('visit_limit')
+    if limit is not None and file_meta.get('visit_count', 0) >= limit:
+        metrics.inc('cdn_visit_lockouts_total', file=name)
+        return False
+    if not download_tokens.record_visit(grant):
+        return False
+    if limit is not None and not metadata_store.record_visit(name, limit):
+        metrics.inc('cdn_visit_lockouts_total', file=name)
+        return False
+    return True
+
+def bearer_matches(secret):
+    # Header values can hold any character, which compare_digest refuses on str.
+    expected = f"Bearer {secret}".encode('utf-8')
+    return hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8', 'surrogateescape'), expected)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def upload_filename(original_filename, custom_name):
+    file_ext = os.path.splitext(original_filename)[1]
+    return f"{secure_filename(custom_name or '') or uuid.uuid4().hex}{file_ext}"
+
+@phase('filesystem')
+def store_upload(tmp_path, new_filename, digest=None):
+    previous = (metadata_store.get(new_filename) or {}).get('sha256')
+    with layout.writing():
+        digest = blob_store.store(tmp_path, layout.target(new_filename), digest)
+    if previous != digest:
+        blob_store.release(previous)
+    return digest
+
+def register_upload(new_filename, password, limit, digest, expires_in=None):
+    path = layout.locate(new_filename)
+    # A deduplicated upload shares the older blob's inode, and so its mtime.
+    file_meta = {'visit_count': 0, 'size': os.path.getsize(path), 'mtime': time.time(), 'sha256': digest}
+    if password:
+        file_meta['password'] = password
+    if limit and str(limit).isdigit() and int(limit) > 0:
+        file_meta['visit_limit'] = int(limit)
+    if expires_at := expiry_time(expires_in):
+        file_meta['expires_at'] = expires_at
+    metadata_store.put(new_filename, file_meta)
+    change_feed.publish('upload', new_filename)
+    video_variants.process(open_file(new_filename, path, file_meta), new_filename)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.trace = start_trace(request.method, request.path, request.endpoint or 'unmatched')
+
+@app.before_request
+def edge_routes_only():
+    if edge_cache is not None and request.endpoint not in EDGE_ENDPOINTS:
+        abort(404)
+
+def reject(reason, retry_after):
+    metrics.inc('cdn_admission_rejections_total', reason=reason)
+    abort(429, description='Too many requests, slow down.', retry_after=retry_after)
+
+# Runs before any catalog or disk work; failed passwords are only counted
+# further in, but a client that has used up its attempts is turned away here.
+@app.before_request
+def admit_request():
+    endpoint = request.endpoint
+    if not admission.enabled or endpoint is None or endpoint == 'static' or endpoint.startswith('node_'):
+        return
+    client = admission.client(request)
+    if endpoint in FILE_ENDPOINTS:
+        if wait := admission.clients.take(client):
+            reject('client', wait)
+        if wait := admission.files.take(request.view_args['name']):
+            reject('file', wait)
+        if request.method == 'POST' or 'password' in request.args:
+            if wait := admission.password_failures.peek(client):
+                reject('password', wait)
+        return
+    if wait := admission.admin.take(client):
+        reject('admin', wait)
+    if endpoint == 'index' and request.method == 'POST':
+        if wait := admission.login_failures.peek(client):
+            reject('login', wait)
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.endpoint or 'unmatched'
+    metrics.inc('cdn_http_requests_total', route=route, method=request.method, status=response.status_code)
+    if 'request_started' in g:
+        metrics.observe('cdn_http_request_duration_seconds', time.perf_counter() - g.request_started, route=route)
+    if route == 'serve_file' and request.method == 'GET' and response.content_length and response.status_code in (200, 206):
+        metrics.inc('cdn_bytes_served_total', response.content_length, file=request.view_args['name'])
+    if access_log is not None and route in ('serve_file', 'hls_playlist', 'hls_media'):
+        access_log.record(request.view_args['name'], response.status_code, response.content_length, admission.client(request),
+                          request.method, time.perf_counter() - g.request_started if 'request_started' in g else None)
+    if 'trace' in g:
+        g.trace.status = response.status_code
+        if not g.get('streaming'):
+            finish_trace(g.trace)
+    return response
+
+@app.teardown_request
+def stop_request_trace(error):
+    end_trace()
+
 
 @app.route('/')
 def root(): abort(404)
@@ -112,19 +541,87 @@ def root(): abort(404)
 def index():
     if request.method == 'POST':
         password = request.form.get('password')
-        if password and check_password_hash(config['password_hash'], password):
+        with phase('auth'):
+            valid = bool(password) and check_password_hash(config['password_hash'], password)
+        if valid:
             session['logged_in'] = True
             flash('Login successful!', 'success')
             return redirect(url_for('index'))
         else:
+            admission.login_failures.take(admission.client(request))
             flash('Invalid password, please try again.', 'error')
     
     if not session.get('logged_in'):
         return render_template('index.html', logged_in=False)
 
     active_tab = request.args.get('active_tab', 'upload')
-    file_list = get_file_info()
-    return render_template('index.html', logged_in=True, files=file_list, active_tab=active_tab)
+    file_list, next_cursor, total_files = get_file_info()
+    return render_template('index.html', logged_in=True, files=file_list, active_tab=active_tab,
+                           next_cursor=next_cursor, total_files=total_files)
+
+@app.route('/api/files')
+def list_files():
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    sort = request.args.get('sort', 'modified')
+    if sort not in ('modified', 'name', 'size'):
+        return jsonify({'error': f"Unknown sort '{sort}'."}), 400
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    if limit < 1:
+        return jsonify({'error': 'limit must be a positive number.'}), 400
+    files, next_cursor, total = get_file_info(
+        sort=sort,
+        descending=request.args.get('order', 'desc') == 'desc',
+        cursor=request.args.get('cursor') or None,
+        limit=min(limit, 500),
+        query=request.args.get('q') or None,
+        status=request.args.get('status') or None,
+    )
+    return jsonify({'files': files, 'next_cursor': next_cursor, 'total': total,
+                    'html': render_template('_file_rows.html', files=files)})
+
+@app.route('/api/stats')
+def file_stats():
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    if access_log is None:
+        return jsonify({'error': 'The access log is disabled.'}), 404
+    name = request.args.get('name')
+    if name:
+        return jsonify({'file': access_log.stats(name)})
+    try:
+        files = access_log.top(request.args.get('sort', 'hits'), min(request.args.get('limit', 25, type=int), 100))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'files': files, 'totals': access_log.totals()})
+
+@app.route('/api/search')
+def search_files():
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query.'}), 400
+    limit = request.args.get('limit', 25, type=int)
+    if limit < 1:
+        return jsonify({'error': 'limit must be a positive number.'}), 400
+    files, _, total = get_file_info(query=query, limit=min(limit, 500))
+    return jsonify({'query': query, 'files': files, 'total': total})
+
+@app.route(f'/{ADMIN_ROUTE_PATH}/metrics')
+def metrics_endpoint():
+    token = metrics_config.get('token')
+    if not session.get('logged_in') and not (token and bearer_matches(token)):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8', 'Cache-Control': 'no-store'}
+
+@app.route('/api/profile', methods=['POST'])
+def profile():
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    seconds = request.args.get('seconds', 10, type=float)
+    if not 0 < seconds <= sampler.max_seconds:
+        return jsonify({'error': f"seconds must be between 0 and {sampler.max_seconds}."}), 400
+    stacks, processes = sampler.profile(change_feed, seconds)
+    return stacks, 200, {'Content-Type': 'text/plain; charset=utf-8', 'Cache-Control': 'no-store',
+                         'X-Profiled-Processes': str(processes),
+                         'Content-Disposition': f'attachment; filename="profile-{int(time.time())}.folded"'}
 
 @app.route('/logout')
 def logout():
@@ -132,36 +629,129 @@ def logout():
     flash('You have been logged out.', 'success')
     return redirect(url_for('index'))
 
+@app.route('/static/<path:filename>')
+def static(filename):
+    path = safe_join(STATIC_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    static_file = compressed_variants.select(StaticFile(path), f"static/{filename}", request)
+    return send_static_file(static_file, f"static/{filename}")
+
 @app.route('/files/<path:name>', methods=['GET', 'POST'])
 def serve_file(name):
-    if not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], name)):
+    path = file_path(name)
+    if path is None:
         abort(404)
-        
-    metadata = load_metadata()
-    file_meta = metadata.get(name)
+    derivative = None
+    if image_derivatives.wants(request.args):
+        try:
+            derivative = image_derivatives.parse(request.args)
+        except ValueError as e:
+            abort(400, description=str(e))
+
+    # Signed links are checked without touching the catalog and, unless they
+    # carry a visit quota, may be cached downstream until they expire.
+    token = request.args.get('token')
+    if token is not None:
+        grant = download_tokens.verify(name, token)
+        if grant is None:
+            abort(403, description='This link is invalid or has expired.')
+        static_file = select_variant(open_file(name, path), name, derivative)
+        if static_file.is_new_visit(request) and not record_token_visit(name, grant):
+            abort(403, description='This link has no visits left.')
+        cache_control = 'private, no-cache' if grant['visits'] is not None else \
+            f"public, max-age={max(0, min(grant['expires'] - int(time.time()), 86400))}"
+        return send_static_file(static_file, name, cache_control=cache_control)
+
+    file_meta = metadata_store.get(name)
+    static_file = open_file(name, path, file_meta)
 
     if not file_meta:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], name)
+        return send_static_file(select_variant(static_file, name, derivative), name)
 
-    limit = file_meta.get('visit_limit')
-    if limit is not None and file_meta.get('visit_count', 0) >= limit:
-        return render_template('locked.html', filename=name), 403
+    denied = access_denied(name, file_meta)
+    if denied is not None:
+        return denied
 
-    password = file_meta.get('password')
+    limit, password = file_meta.get('visit_limit'), file_meta.get('password')
     if password:
-        submitted_password = request.form.get('password') or request.args.get('password')
-        if submitted_password == password:
-            if limit is not None:
-                file_meta['visit_count'] = file_meta.get('visit_count', 0) + 1
-                save_metadata(metadata)
-            return send_from_directory(app.config['UPLOAD_FOLDER'], name)
-        return render_template('password.html', filename=name)
+        # After the form is posted, hand the browser a short-lived signed link
+        # so reloads and range requests don't need the password again.
+        if request.method == 'POST' and limit is None:
+            token, _ = download_tokens.issue(name, ttl=tokens_config.get('password_ttl_hours', 1) * 3600,
+                                             not_after=file_meta.get('expires_at'))
+            args = {key: value for key, value in request.args.items() if key != 'password'}
+            return redirect(url_for('serve_file', name=name, **args, token=token), 303)
+
+    static_file = select_variant(static_file, name, derivative)
+    if limit is not None and static_file.is_new_visit(request) and not metadata_store.record_visit(name, limit):
+        metrics.inc('cdn_visit_lockouts_total', file=name)
+        return render_template('locked.html', filename=name), 403
 
-    if limit is not None:
-        file_meta['visit_count'] = file_meta.get('visit_count', 0) + 1
-        save_metadata(metadata)
-        
-    return send_from_directory(app.config['UPLOAD_FOLDER'], name)
+    cache_control = 'private, no-cache' if password or limit is not None else 'no-cache'
+    return send_static_file(static_file, name, cache_control=cache_control)
+
+# A playlist request is one playback session: access is checked and a visit
+# counted here, and the segments are fetched with a session token instead.
+@app.route('/files/<path:name>/hls/index.m3u8', methods=['GET', 'POST'])
+def hls_playlist(name):
+    path = file_path(name)
+    if path is None:
+        abort(404)
+    token, file_meta = request.args.get('token'), None
+    if token is not None:
+        grant = download_tokens.verify(name, token)
+        if grant is None:
+            abort(403, description='This link is invalid or has expired.')
+    else:
+        file_meta = metadata_store.get(name) or {}
+        denied = access_denied(name, file_meta)
+        if denied is not None:
+            return denied
+    static_file = open_file(name, path, file_meta)
+    if not video_variants.streamable(static_file):
+        abort(404)
+    playlist = video_variants.playlist(static_file, name)
+    if playlist is None:
+        return jsonify({'error': 'This video is still being prepared.'}), 503, {'Retry-After': '15'}
+
+    if token is not None:
+        if not record_token_visit(name, grant):
+            abort(403, description='This link has no visits left.')
+        not_after = grant['expires']
+    else:
+        limit = file_meta.get('visit_limit')
+        if limit is not None and not metadata_store.record_visit(name, limit):
+            metrics.inc('cdn_visit_lockouts_total', file=name)
+            return render_template('locked.html', filename=name), 403
+        not_after = file_meta.get('expires_at')
+    session_token, _ = download_tokens.issue(f"{name}/hls", ttl=video_config.get('session_ttl_hours', 6) * 3600,
+                                             not_after=not_after)
+    return Response(rewrite_playlist(playlist, f"media?token={session_token}"),
+                    mimetype='application/vnd.apple.mpegurl', headers={'Cache-Control': 'private, no-store'})
+
+@app.route('/files/<path:name>/hls/media')
+def hls_media(name):
+    path = file_path(name)
+    if path is None:
+        abort(404)
+    if download_tokens.verify(f"{name}/hls", request.args.get('token', '')) is None:
+        abort(403, description='This playback session is invalid or has expired.')
+    static_file = open_file(name, path)
+    media = video_variants.media(static_file, name)
+    if media is None:
+        abort(404)
+    return send_static_file(static_file.derived(media, 'video/mp4', 'hls'), name, cache_control='private, no-cache')
+
+
+@app.route('/api/thumbnail/<path:name>')
+def thumbnail(name):
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    path = file_path(name)
+    if path is None or not image_derivatives.available:
+        abort(404)
+    static_file = open_file(name, path, metadata_store.get(name))
+    return send_static_file(image_derivatives.thumbnail(static_file, name), name, cache_control='private, no-cache')
 
 
 @app.route('/upload', methods=['POST'])
@@ -177,36 +767,28 @@ def upload():
     custom_names = request.form.getlist('custom_name')
     passwords = request.form.getlist('password')
     visit_limits = request.form.getlist('visit_limit')
+    expiries = request.form.getlist('expires_in')
     
     uploaded_filenames = []
     error_filenames = []
-    
-    metadata = load_metadata()
 
     for i, file in enumerate(files):
         if not (file and allowed_file(file.filename)):
             error_filenames.append(secure_filename(file.filename) or f"file_{i}")
             continue
 
-        original_filename = secure_filename(file.filename)
         custom_name = custom_names[i] if i < len(custom_names) else ''
-        file_ext = os.path.splitext(original_filename)[1]
-        new_filename = f"{secure_filename(custom_name) or uuid.uuid4().hex}{file_ext}"
+        new_filename = upload_filename(secure_filename(file.filename), custom_name)
 
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], new_filename))
+        with blob_store.writer() as writer:
+            shutil.copyfileobj(file.stream, writer, CHUNK_SIZE)
+        digest = store_upload(writer.path, new_filename, writer.hexdigest())
         uploaded_filenames.append(new_filename)
 
-        metadata[new_filename] = {'visit_count': 0}
-        
         password = passwords[i] if i < len(passwords) else ''
-        if password:
-            metadata[new_filename]['password'] = password
-            
         limit = visit_limits[i] if i < len(visit_limits) else ''
-        if limit and limit.isdigit() and int(limit) > 0:
-            metadata[new_filename]['visit_limit'] = int(limit)
-    
-    save_metadata(metadata)
+        expires_in = expiries[i] if i < len(expiries) else ''
+        register_upload(new_filename, password, limit, digest, expires_in)
     
     if uploaded_filenames:
         flash(f'{len(uploaded_filenames)} file(s) uploaded successfully.', 'success')
@@ -215,12 +797,58 @@ def upload():
         
     return redirect(url_for('index', active_tab=active_tab))
 
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    data = request.json or {}
+    filename = secure_filename(data.get('filename') or '')
+    length = data.get('length')
+    if not allowed_file(filename):
+        return jsonify({'error': 'File type is not allowed.'}), 400
+    # bool is an int subclass, so JSON true/false must be ruled out explicitly.
+    if type(length) is not int or length < 0:
+        return jsonify({'error': 'Upload length must be a whole number of bytes.'}), 400
+    options = {key: data.get(key) for key in ('custom_name', 'password', 'visit_limit', 'expires_in')}
+    upload = resumable_uploads.create(filename, length, options)
+    location = url_for('upload_session', upload_id=upload['id'])
+    return jsonify({'id': upload['id'], 'offset': 0, 'length': length}), 201, {'Location': location, 'Upload-Offset': '0'}
+
+@app.route('/api/uploads/<upload_id>', methods=['HEAD', 'PATCH', 'DELETE'])
+def upload_session(upload_id):
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    if request.method == 'DELETE':
+        resumable_uploads.abort(upload_id)
+        return '', 204
+    if request.method == 'HEAD':
+        upload = resumable_uploads.get(upload_id)
+        return '', 200, {'Upload-Offset': str(upload['offset']), 'Upload-Length': str(upload['length']), 'Cache-Control': 'no-store'}
+
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Upload-Offset header is required.'}), 400
+    upload = resumable_uploads.get(upload_id)
+    if (request.content_length or 0) > upload['length'] - offset:
+        raise UploadError('Chunk runs past the declared upload length.', 413, upload['offset'])
+    upload = resumable_uploads.append(upload_id, offset, request.stream)
+    if upload['offset'] < upload['length']:
+        return '', 204, {'Upload-Offset': str(upload['offset'])}
+
+    options = upload['options']
+    new_filename = upload_filename(upload['filename'], options.get('custom_name'))
+    digest = resumable_uploads.commit(upload, lambda part_path: store_upload(part_path, new_filename))
+    register_upload(new_filename, options.get('password'), options.get('visit_limit'), digest, options.get('expires_in'))
+    return jsonify({'success': True, 'filename': new_filename, 'url': url_for('serve_file', name=new_filename)}), 200, {'Upload-Offset': str(upload['offset'])}
+
+@app.errorhandler(UploadError)
+def upload_error(error):
+    headers = {'Upload-Offset': str(error.offset)} if error.offset is not None else {}
+    return jsonify({'error': str(error)}), error.status, headers
+
 @app.route('/rename/<path:filename>', methods=['POST'])
 def rename_file(filename):
     if not session.get('logged_in'): abort(401)
     active_tab = request.form.get('active_tab', 'manage')
-    old_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    if not os.path.exists(old_path):
+    if not layout.exists(filename):
         flash(f'Error: Original file "{filename}" not found.', 'error')
     else:
         new_name_base = secure_filename(request.form.get('new_name'))
@@ -228,28 +856,28 @@ def rename_file(filename):
             flash('Error: New name is invalid.', 'error')
         else:
             new_filename = f"{new_name_base}{os.path.splitext(filename)[1]}"
-            new_path = os.path.join(app.config['UPLOAD_FOLDER'], new_filename)
-            if os.path.exists(new_path):
+            if layout.exists(new_filename):
                 flash(f'Error: A file named "{new_filename}" already exists.', 'error')
             else:
-                os.rename(old_path, new_path)
-                metadata = load_metadata()
-                if filename in metadata:
-                    metadata[new_filename] = metadata.pop(filename)
-                    save_metadata(metadata)
+                with layout.writing():
+                    layout.rename(filename, new_filename)
+                metadata_store.rename(filename, new_filename)
+                compressed_variants.invalidate(filename)
+                change_feed.publish('rename', filename, new_filename)
                 flash(f'Renamed "{filename}" to "{new_filename}".', 'success')
     return redirect(url_for('index', active_tab=active_tab))
 
 @app.route('/delete/<path:filename>', methods=['POST'])
 def delete_file(filename):
     if not session.get('logged_in'): abort(401)
-    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    if os.path.exists(path):
-        os.remove(path)
-        metadata = load_metadata()
-        if filename in metadata:
-            del metadata[filename]
-            save_metadata(metadata)
+    with layout.writing():
+        path = layout.locate(filename)
+        if path is not None:
+            blob_store.remove(path, (metadata_store.get(filename) or {}).get('sha256'))
+    if path is not None:
+        metadata_store.delete(filename)
+        compressed_variants.invalidate(filename)
+        change_feed.publish('delete', filename)
         flash(f'File "{filename}" has been deleted.', 'success')
     else:
         flash('File not found.', 'error')
@@ -259,38 +887,112 @@ def delete_file(filename):
 @app.route('/api/file/<path:filename>/password', methods=['POST'])
 def update_password(filename):
     if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
-    metadata = load_metadata()
-    if filename not in metadata: metadata[filename] = {}
-    
-    new_password = request.json.get('password')
-    if new_password:
-        metadata[filename]['password'] = new_password
-    elif 'password' in metadata[filename]:
-        del metadata[filename]['password']
-        
-    save_metadata(metadata)
+    metadata_store.set_password(filename, request.json.get('password'))
+    change_feed.publish('update', filename)
     return jsonify({'success': True, 'message': 'Password updated.'})
 
 @app.route('/api/file/<path:filename>/lock', methods=['POST'])
 def update_lock(filename):
     if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
-    metadata = load_metadata()
-    if filename not in metadata: metadata[filename] = {}
-
     limit = request.json.get('limit')
-    if limit and str(limit).isdigit() and int(limit) > 0:
-        metadata[filename]['visit_limit'] = int(limit)
-        if 'visit_count' not in metadata[filename]: metadata[filename]['visit_count'] = 0
-    else:
-        if 'visit_limit' in metadata[filename]: del metadata[filename]['visit_limit']
-        if 'visit_count' in metadata[filename]: del metadata[filename]['visit_count']
-        
-    save_metadata(metadata)
+    valid = limit and str(limit).isdigit() and int(limit) > 0
+    metadata_store.set_visit_limit(filename, int(limit) if valid else None)
+    change_feed.publish('update', filename)
     return jsonify({'success': True, 'message': 'Lock settings updated.'})
 
+@app.route('/api/file/<path:filename>/expiry', methods=['POST'])
+def update_expiry(filename):
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    metadata_store.set_expiry(filename, expiry_time(request.json.get('hours')))
+    change_feed.publish('update', filename)
+    return jsonify({'success': True, 'message': 'Expiry updated.'})
+
+@app.route('/api/file/<path:filename>/link', methods=['POST'])
+def create_link(filename):
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    if not layout.exists(filename):
+        return jsonify({'error': 'File not found.'}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        ttl = float(data['hours']) * 3600 if data.get('hours') else None
+        visits = int(data['visits']) if data.get('visits') else None
+    except (TypeError, ValueError):
+        ttl = visits = -1
+    if (ttl is not None and not 0 < ttl < float('inf')) or (visits is not None and visits < 1):
+        return jsonify({'error': 'Hours and visits must be positive numbers.'}), 400
+    file_meta = metadata_store.get(filename) or {}
+    limit = file_meta.get('visit_limit')
+    if limit is not None:
+        remaining = limit - file_meta.get('visit_count', 0)
+        if remaining <= 0:
+            return jsonify({'error': 'This file has no visits left.'}), 409
+        visits = min(visits or remaining, remaining)
+    token, expires = download_tokens.issue(filename, ttl=ttl, visits=visits, not_after=file_meta.get('expires_at'))
+    return jsonify({'url': url_for('serve_file', name=filename, token=token, _external=True), 'expires_at': expires})
+
+@app.route('/api/batch', methods=['POST'])
+def batch_update():
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    data = request.get_json(silent=True) or {}
+    try:
+        results = batch_operations.apply(data.get('operations'))
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    succeeded = sum(result['ok'] for result in results)
+    return jsonify({'results': results, 'succeeded': succeeded, 'failed': len(results) - succeeded})
+
+def node_authorized():
+    secret = node_config.get('secret')
+    return bool(secret) and bearer_matches(secret)
+
+@app.route('/_node/files/<path:name>')
+def node_file(name):
+    if not node_authorized(): return jsonify({'error': 'Unauthorized'}), 401
+    path = file_path(name)
+    if path is None:
+        abort(404)
+    return open_file(name, path, metadata_store.get(name)).response(request, cache_control='no-store')
+
+@app.route('/_node/meta/<path:name>')
+def node_meta(name):
+    if not node_authorized(): return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({'meta': metadata_store.get(name)})
+
+@app.route('/_node/visit/<path:name>', methods=['POST'])
+def node_visit(name):
+    if not node_authorized(): return jsonify({'error': 'Unauthorized'}), 401
+    limit = (metadata_store.get(name) or {}).get('visit_limit')
+    allowed = limit is None or metadata_store.record_visit(name, limit)
+    return jsonify({'allowed': allowed})
+
+@app.route('/_node/token-visit', methods=['POST'])
+def node_token_visit():
+    if not node_authorized() or edge_cache is not None: return jsonify({'error': 'Unauthorized'}), 401
+    data = request.get_json(silent=True) or {}
+    token_id, visits = data.get('id'), data.get('visits')
+    if not isinstance(token_id, str) or not token_id or not isinstance(visits, int) or isinstance(visits, bool):
+        return jsonify({'error': 'A token id and visit quota are required.'}), 400
+    return jsonify({'allowed': download_tokens.record_visit({'id': token_id, 'visits': visits})})
+
+@app.route('/_node/invalidate', methods=['POST'])
+def node_invalidate():
+    if not node_authorized() or edge_cache is None: return jsonify({'error': 'Unauthorized'}), 401
+    events = (request.get_json(silent=True) or {}).get('events') or []
+    change_feed.publish_many([(op, name, new_name) for op, name, new_name in events
+                              if op in ('upload', 'rename', 'delete', 'update') and name])
+    return jsonify({'success': True, 'count': len(events)})
+
+@app.errorhandler(OriginError)
+def origin_error(error):
+    print(f"Edge could not reach the origin: {error}")
+    return jsonify({'error': 'The origin server is unavailable.'}), 502
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    if not session.get('logged_in'): return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({'pid': os.getpid(), 'byte_cache': byte_cache.stats() if byte_cache else None})
+
 
-   
-run_initial_setup()
-print("\nStarting server...")
-print(f"Your permanent admin panel is available at: http://127.0.0.1:5000/{ADMIN_ROUTE_PATH}")
-app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+if __name__ == '__main__':
+    settings = server_settings()
+    app.run(host=settings['host'], port=settings['port'], debug=False, threaded=True)
@@ -2,7 +2,7 @@
 
 set -e
 
-echo "Starting Flask server..."
+echo "Starting web server (mode from config.json)..."
 python server.py &
 
 echo "Starting Discord bot..."
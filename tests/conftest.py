@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    # server.py reads config.json and keeps its files relative to the working
+    # directory, so it is imported once from a scratch directory.
+    root = tmp_path_factory.mktemp('node')
+    config = {
+        'password_hash': generate_password_hash('pw'),
+        'secret_key': 'test-secret',
+        'admin_path': 'adm',
+        'maintenance': {'enabled': False},
+        'access_log': {'enabled': False},
+        'admission': {'enabled': False},
+    }
+    (root / 'config.json').write_text(json.dumps(config))
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        import server
+        yield server
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def admin(server):
+    client = server.app.test_client()
+    client.post('/adm', data={'password': 'pw'})
+    return client
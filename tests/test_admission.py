@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+import multiprocessing
+
+from flask import Flask, request
+
+from admission import RateLimiter, SharedRateLimiter, TransferSlots, Admission
+
+
+def test_rate_limiter_burst_and_refill(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter.take('a') for _ in range(4)] == [0, 0, 0, 1]
+    assert limiter.peek('b') == 0
+    now[0] += 0.5
+    assert limiter.take('a') == 0
+    assert limiter.peek('a') == 1
+
+
+def test_rate_limiter_drops_full_buckets():
+    limiter = RateLimiter(rate=1000, burst=1, max_keys=10)
+    for i in range(50):
+        limiter.take(f"client-{i}")
+    assert len(limiter._buckets) <= 10
+
+
+def test_shared_failures_are_spent_by_every_process(tmp_path):
+    path = str(tmp_path / 'failures.db')
+    first = SharedRateLimiter(path, 'failures', rate=0.01, burst=2, refresh=0)
+    second = SharedRateLimiter(path, 'failures', rate=0.01, burst=2, refresh=0)
+    other = SharedRateLimiter(path, 'other', rate=0.01, burst=2, refresh=0)
+    assert first.take('client') == 0
+    assert second.take('client') == 0
+    assert first.take('client') > 0
+    assert second.peek('client') > 0
+    assert other.peek('client') == 0
+    assert second.peek('someone-else') == 0
+
+
+def test_peek_only_queries_for_known_failures(tmp_path):
+    path = str(tmp_path / 'failures.db')
+    limiter = SharedRateLimiter(path, 'failures', rate=0.01, burst=1, refresh=3600)
+    other = SharedRateLimiter(path, 'failures', rate=0.01, burst=1, refresh=3600)
+    queries = []
+    limiter._conn().set_trace_callback(queries.append)
+    for _ in range(100):
+        assert limiter.peek('client') == 0
+    assert queries == []
+    # This process's own failures are seen at once, another's after `refresh`.
+    limiter.take('client')
+    assert limiter.peek('client') > 0
+    other.take('elsewhere')
+    assert limiter.peek('elsewhere') == 0
+    limiter._loaded_at = float('-inf')
+    assert limiter.peek('elsewhere') > 0
+
+
+def hold_slot(directory, held, release):
+    slots = TransferSlots(directory, 1)
+    assert slots.acquire() is not None
+    held.set()
+    release.wait(30)
+
+
+def test_slots_are_shared_across_processes(tmp_path):
+    directory = str(tmp_path / 'slots')
+    context = multiprocessing.get_context('fork')
+    held, release = context.Event(), context.Event()
+    process = context.Process(target=hold_slot, args=(directory, held, release))
+    process.start()
+    try:
+        assert held.wait(30)
+        slots = TransferSlots(directory, 1)
+        assert slots.acquire() is None
+    finally:
+        release.set()
+        process.join(30)
+    # The kernel dropped the child's lock when it exited.
+    assert slots.acquire() == 0
+
+
+def test_slots_within_one_process(tmp_path):
+    slots = TransferSlots(str(tmp_path), 2)
+    first, second = slots.acquire(), slots.acquire()
+    assert {first, second} == {0, 1}
+    assert slots.acquire() is None
+    assert slots.active == 2
+    slots.release(first)
+    assert slots.acquire() == first
+
+
+def test_waiting_for_a_slot(tmp_path):
+    slots = TransferSlots(str(tmp_path), 1, max_waiting=1, poll_interval=0.01)
+    held = slots.acquire()
+    threading.Timer(0.1, slots.release, args=(held,)).start()
+    started = time.monotonic()
+    assert slots.acquire(timeout=5) == held
+    assert time.monotonic() - started < 2
+    assert slots.waiting == 0
+    started = time.monotonic()
+    assert slots.acquire(timeout=0.1) is None
+    assert time.monotonic() - started >= 0.1
+
+
+def test_waiters_are_bounded(tmp_path):
+    slots = TransferSlots(str(tmp_path), 1, max_waiting=1, poll_interval=0.01)
+    slots.acquire()
+    waiter = threading.Thread(target=slots.acquire, kwargs={'timeout': 1})
+    waiter.start()
+    while slots.waiting == 0:
+        time.sleep(0.005)
+    started = time.monotonic()
+    assert slots.acquire(timeout=1) is None
+    assert time.monotonic() - started < 0.5
+    waiter.join()
+
+
+def test_client_address(tmp_path):
+    app = Flask(__name__)
+    direct = Admission({'state_dir': str(tmp_path)})
+    proxied = Admission({'state_dir': str(tmp_path), 'client_header': 'X-Forwarded-For'})
+    headers = {'X-Forwarded-For': '203.0.113.7, 10.0.0.1'}
+    with app.test_request_context('/', headers=headers, environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        assert direct.client(request) == '10.0.0.1'
+        assert proxied.client(request) == '203.0.113.7'
+    with app.test_request_context('/', environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        assert proxied.client(request) == '10.0.0.1'
+    assert os.path.exists(os.path.join(str(tmp_path), 'failures.db'))
@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+from batch import BatchOperations, BatchError
+from blobstore import BlobStore
+from layout import FileLayout
+from metadata_store import SqliteMetadataStore
+
+
+class Variants:
+    def __init__(self):
+        self.invalidated = []
+
+    def invalidate(self, name):
+        self.invalidated.append(name)
+
+
+class Feed:
+    def __init__(self):
+        self.events = []
+
+    def publish_many(self, events):
+        self.events += events
+
+
+@pytest.fixture
+def batch(tmp_path):
+    layout = FileLayout(str(tmp_path / 'files'))
+    store = SqliteMetadataStore(str(tmp_path / 'catalog.db'), counters_path=str(tmp_path / 'counts.log'))
+    blobs = BlobStore(layout.root)
+    for name in ['a.txt', 'b.txt', 'c.txt']:
+        tmp = blobs.temp_path()
+        with open(tmp, 'wb') as f:
+            f.write(name.encode())
+        store.put(name, {'sha256': blobs.store(tmp, layout.target(name))})
+    return BatchOperations(layout, store, blobs, Variants(), Feed())
+
+
+def test_operations_are_applied(batch):
+    results = batch.apply([
+        {'op': 'delete', 'name': 'a.txt'},
+        {'op': 'rename', 'name': 'b.txt', 'new_name': 'd'},
+        {'op': 'password', 'name': 'c.txt', 'password': 'secret'},
+        {'op': 'lock', 'name': 'missing.txt', 'limit': 5},
+    ])
+    assert [r['ok'] for r in results] == [True, True, True, False]
+    assert results[1]['new_name'] == 'd.txt'
+    assert sorted(name for name, _ in batch.layout.files()) == ['c.txt', 'd.txt']
+    assert sorted(batch.metadata_store.all()) == ['c.txt', 'd.txt']
+    assert batch.metadata_store.get('c.txt')['password'] == 'secret'
+    assert batch.compressed_variants.invalidated == ['a.txt', 'b.txt']
+    assert batch.change_feed.events == [('delete', 'a.txt', None), ('rename', 'b.txt', 'd.txt'), ('update', 'c.txt', None)]
+
+
+def test_later_operations_see_earlier_ones(batch):
+    results = batch.apply([
+        {'op': 'rename', 'name': 'a.txt', 'new_name': 'e'},
+        {'op': 'rename', 'name': 'b.txt', 'new_name': 'e'},
+        {'op': 'lock', 'name': 'a.txt', 'limit': 1},
+        {'op': 'rename', 'name': 'e.txt', 'new_name': 'a'},
+        {'op': 'delete', 'name': 'a.txt'},
+    ])
+    assert [r['ok'] for r in results] == [True, False, False, True, True]
+    assert sorted(name for name, _ in batch.layout.files()) == ['b.txt', 'c.txt']
+    assert sorted(batch.metadata_store.all()) == ['b.txt', 'c.txt']
+
+
+def test_one_transaction_per_batch(batch):
+    commits = []
+    batch.metadata_store._conn().set_trace_callback(lambda sql: sql == 'COMMIT' and commits.append(sql))
+    batch.apply([{'op': 'password', 'name': f"{name}.txt", 'password': 'x'} for name in 'abc' * 100])
+    assert len(commits) == 1
+
+
+def test_rollback_leaves_files_alone(batch, monkeypatch):
+    def fail(name, password):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(batch.metadata_store, 'set_password', fail)
+    with pytest.raises(sqlite3.OperationalError):
+        batch.apply([{'op': 'delete', 'name': 'a.txt'},
+                     {'op': 'rename', 'name': 'b.txt', 'new_name': 'd'},
+                     {'op': 'password', 'name': 'c.txt', 'password': 'x'}])
+    assert sorted(name for name, _ in batch.layout.files()) == ['a.txt', 'b.txt', 'c.txt']
+    assert sorted(batch.metadata_store.all()) == ['a.txt', 'b.txt', 'c.txt']
+    assert batch.change_feed.events == []
+
+
+def test_batch_is_checked(batch):
+    with pytest.raises(BatchError):
+        batch.apply([])
+    with pytest.raises(BatchError):
+        batch.apply({'op': 'delete'})
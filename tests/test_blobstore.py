@@ -0,0 +1,44 @@
+import io
+import os
+
+from blobstore import BlobStore
+
+
+def upload(client, name, data):
+    return client.post('/upload', data={'file': (io.BytesIO(data), name), 'custom_name': name.rsplit('.', 1)[0]},
+                       content_type='multipart/form-data')
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    blob_store = BlobStore(str(tmp_path))
+    paths = []
+    for name in ('a.txt', 'b.txt'):
+        with blob_store.writer() as writer:
+            writer.write(b'same bytes')
+        paths.append(str(tmp_path / name))
+        assert blob_store.store(writer.path, paths[-1], writer.hexdigest()) == writer.hexdigest()
+    blob = blob_store.blob_path(writer.hexdigest())
+    assert os.path.samestat(os.stat(paths[0]), os.stat(paths[1]))
+    assert os.stat(blob).st_nlink == 3
+    blob_store.remove(paths[0], writer.hexdigest())
+    assert os.path.exists(blob)
+    blob_store.remove(paths[1], writer.hexdigest())
+    assert not os.path.exists(blob)
+
+
+def test_duplicate_upload_is_dated_by_its_own_upload(server, admin):
+    upload(admin, 'dup-old.txt', b'duplicate content')
+    # Make the first upload look a day old, file and catalog alike.
+    day_ago = os.path.getmtime(server.layout.locate('dup-old.txt')) - 86400
+    os.utime(server.layout.locate('dup-old.txt'), (day_ago, day_ago))
+    server.metadata_store.update('dup-old.txt', mtime=day_ago)
+    server.file_index.refresh('dup-old.txt')
+
+    upload(admin, 'dup-new.txt', b'duplicate content')
+    old, new = server.layout.locate('dup-old.txt'), server.layout.locate('dup-new.txt')
+    assert os.path.samestat(os.stat(old), os.stat(new))
+    files = admin.get('/api/files?q=dup').get_json()['files']
+    modified = {item['name']: item['modified_raw'] for item in files}
+    assert modified['dup-new.txt'] > modified['dup-old.txt'] + 3600
+    names = [item['name'] for item in admin.get('/api/files?sort=modified&order=desc').get_json()['files']]
+    assert names.index('dup-new.txt') < names.index('dup-old.txt')
@@ -0,0 +1,55 @@
+import multiprocessing
+
+from counters import VisitCounters
+
+
+def test_hit_respects_limit(tmp_path):
+    counters = VisitCounters(str(tmp_path / 'visits.log'))
+    assert [counters.hit('a', 3) for _ in range(5)] == [True, True, True, False, False]
+    assert counters.get('a') == 3
+    assert counters.hit('b') and counters.get('b') == 1
+
+
+def test_set_rename_discard(tmp_path):
+    path = str(tmp_path / 'visits.log')
+    counters = VisitCounters(path)
+    counters.set('a', 7)
+    counters.rename('a', 'b')
+    counters.hit('c')
+    counters.discard('c')
+    assert counters.snapshot() == {'b': 7}
+    assert VisitCounters(path).snapshot() == {'b': 7}
+
+
+def test_compaction_keeps_counts(tmp_path):
+    path = str(tmp_path / 'visits.log')
+    counters = VisitCounters(path, compact_bytes=64)
+    for i in range(100):
+        counters.hit(f"file-{i % 5}")
+    assert counters.snapshot() == {f"file-{i}": 20 for i in range(5)}
+    assert VisitCounters(path).snapshot() == counters.snapshot()
+
+
+def hammer(path, hits, results):
+    # Small compaction threshold so the log is replaced under the other
+    # processes' feet as well.
+    counters = VisitCounters(path, compact_bytes=256)
+    allowed = sum(counters.hit('limited', 150) for _ in range(hits))
+    for _ in range(hits):
+        counters.hit('open')
+    results.put(allowed)
+
+
+def test_counts_are_exact_across_processes(tmp_path):
+    path = str(tmp_path / 'visits.log')
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=hammer, args=(path, 60, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    allowed = sum(results.get(timeout=60) for _ in processes)
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    assert allowed == 150
+    assert VisitCounters(path).snapshot() == {'limited': 150, 'open': 240}
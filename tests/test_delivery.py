@@ -0,0 +1,195 @@
+from datetime import timedelta
+
+import pytest
+from flask import Flask, request
+from werkzeug.http import http_date
+
+from delivery import StaticFile, MAX_RANGES
+
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(DATA)
+    return str(path)
+
+
+@pytest.fixture
+def client(path):
+    app = Flask(__name__)
+
+    @app.route('/file', methods=['GET', 'HEAD'])
+    def serve():
+        return StaticFile(path).response(request)
+
+    return app.test_client()
+
+
+def get(client, method='GET', **headers):
+    return client.open('/file', method=method, headers=headers)
+
+
+def test_whole_file(client):
+    response = get(client)
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_single_range(client):
+    response = get(client, Range='bytes=10-19')
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 10-19/1024'
+    assert response.data == DATA[10:20]
+
+
+def test_suffix_range(client):
+    response = get(client, Range='bytes=-100')
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 924-1023/1024'
+    assert response.data == DATA[-100:]
+
+
+def test_range_past_end_is_clamped(client):
+    response = get(client, Range='bytes=1000-5000')
+    assert response.headers['Content-Range'] == 'bytes 1000-1023/1024'
+    assert response.data == DATA[1000:]
+
+
+def test_range_covering_file_is_not_partial(client):
+    response = get(client, Range='bytes=0-')
+    assert response.status_code == 200
+    assert 'Content-Range' not in response.headers
+
+
+@pytest.mark.parametrize('header', ['bytes=0-9,10-19', 'bytes=0-4,5-9,10-19'])
+def test_adjacent_ranges_merge(client, header):
+    response = get(client, Range=header)
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 0-19/1024'
+    assert response.data == DATA[:20]
+
+
+@pytest.mark.parametrize('header', ['bytes=0-9,5-19', 'bytes=100-109,0-9'])
+def test_overlapping_or_unordered_ranges_send_whole_file(client, header):
+    # Werkzeug drops such a Range header, which the RFC allows.
+    response = get(client, Range=header)
+    assert response.status_code == 200
+    assert response.data == DATA
+
+
+def test_multipart_ranges(client):
+    response = get(client, Range='bytes=0-9,100-109')
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert int(response.headers['Content-Length']) == len(response.data)
+    boundary = response.mimetype_params['boundary'].encode('ascii')
+    parts = response.data.split(b'--' + boundary)
+    assert parts[-1] == b'--\r\n'
+    assert parts[1].endswith(b'Content-Range: bytes 0-9/1024\r\n\r\n' + DATA[:10] + b'\r\n')
+    assert parts[2].endswith(b'Content-Range: bytes 100-109/1024\r\n\r\n' + DATA[100:110] + b'\r\n')
+
+
+def test_unsatisfiable_range(client):
+    response = get(client, Range='bytes=2000-3000')
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */1024'
+    assert response.data == b''
+
+
+def test_too_many_ranges_sends_whole_file(client):
+    ranges = ','.join(f"{i * 10}-{i * 10 + 4}" for i in range(MAX_RANGES + 1))
+    response = get(client, Range=f'bytes={ranges}')
+    assert response.status_code == 200
+    assert response.data == DATA
+
+
+def test_head_range_has_no_body(client):
+    response = get(client, method='HEAD', Range='bytes=10-19')
+    assert response.status_code == 206
+    assert response.headers['Content-Length'] == '10'
+    assert response.data == b''
+
+
+def test_if_range_matching_etag(client, path):
+    etag = StaticFile(path).etag
+    response = get(client, Range='bytes=10-19', **{'If-Range': f'"{etag}"'})
+    assert response.status_code == 206
+
+
+def test_if_range_stale_etag_sends_whole_file(client):
+    response = get(client, Range='bytes=10-19', **{'If-Range': '"old"'})
+    assert response.status_code == 200
+    assert response.data == DATA
+
+
+def test_if_range_dates(client, path):
+    last_modified = StaticFile(path).last_modified
+    response = get(client, Range='bytes=10-19', **{'If-Range': http_date(last_modified)})
+    assert response.status_code == 206
+    response = get(client, Range='bytes=10-19', **{'If-Range': http_date(last_modified - timedelta(seconds=10))})
+    assert response.status_code == 200
+
+
+def test_not_modified_wins_over_range(client, path):
+    etag = StaticFile(path).etag
+    response = get(client, Range='bytes=10-19', **{'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since(client, path):
+    last_modified = StaticFile(path).last_modified
+    response = get(client, **{'If-None-Match': '"old"', 'If-Modified-Since': http_date(last_modified)})
+    assert response.status_code == 200
+    response = get(client, **{'If-Modified-Since': http_date(last_modified)})
+    assert response.status_code == 304
+    response = get(client, **{'If-Modified-Since': http_date(last_modified - timedelta(seconds=10))})
+    assert response.status_code == 200
+
+
+def test_new_visit_and_transfer_size(path):
+    app = Flask(__name__)
+    static_file = StaticFile(path)
+    cases = [
+        ({}, True, len(DATA)),
+        ({'Range': 'bytes=0-'}, True, len(DATA)),
+        ({'Range': 'bytes=0-1'}, False, 2),
+        ({'Range': 'bytes=0-99'}, False, 100),
+        ({'Range': 'bytes=100-'}, False, len(DATA) - 100),
+        ({'Range': 'bytes=0-9,100-109'}, False, 20),
+        ({'If-None-Match': f'"{static_file.etag}"'}, False, 0),
+    ]
+    for headers, new_visit, size in cases:
+        with app.test_request_context('/file', headers=headers):
+            assert static_file.is_new_visit(request) is new_visit
+            assert static_file.transfer_size(request) == size
+
+
+def test_on_close_runs_once_body_is_sent(path):
+    app = Flask(__name__)
+    closed = []
+
+    @app.route('/file')
+    def serve():
+        return StaticFile(path).response(request, on_close=lambda: closed.append(True))
+
+    client = app.test_client()
+    for headers in ({}, {'Range': 'bytes=0-9,100-109'}, {'Range': 'bytes=2000-'}):
+        closed.clear()
+        client.get('/file', headers=headers).close()
+        assert closed == [True]
+
+
+def test_probe_is_not_a_visit(path):
+    # A player's bytes=0-1 probe followed by the real download is one visit.
+    app = Flask(__name__)
+    static_file = StaticFile(path)
+    visits = 0
+    for header in ('bytes=0-1', 'bytes=0-1', 'bytes=0-', 'bytes=512-'):
+        with app.test_request_context('/file', headers={'Range': header}):
+            visits += static_file.is_new_visit(request)
+    assert visits == 1
@@ -0,0 +1,117 @@
+import io
+import os
+import time
+
+import pytest
+
+from edge import NodeClient, EdgeCache, OriginCatalog
+
+
+class OriginResponse:
+    def __init__(self, response):
+        self.status = response.status_code
+        self.headers = response.headers
+        self.body = io.BytesIO(response.data)
+
+    def getcode(self):
+        return self.status
+
+    def read(self, *args):
+        return self.body.read(*args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class OriginClient:
+    # Speaks to the origin's test client in place of urllib, so the edge
+    # classes are exercised against the real /_node/ routes.
+    base_url = 'http://origin'
+    json = NodeClient.json
+
+    def __init__(self, client):
+        self.client = client
+        self.requests = []
+
+    def request(self, method, path, data=None, headers=None):
+        self.requests.append((method, path, dict(headers or {})))
+        headers = {'Authorization': 'Bearer node-secret', **(headers or {})}
+        return OriginResponse(self.client.open(path, method=method, json=data, headers=headers))
+
+
+@pytest.fixture
+def origin(server, monkeypatch):
+    monkeypatch.setitem(server.node_config, 'secret', 'node-secret')
+    return OriginClient(server.app.test_client())
+
+
+def upload(admin, name, data):
+    response = admin.post('/upload', data={'file': (io.BytesIO(data), name), 'custom_name': name.rsplit('.', 1)[0]},
+                          content_type='multipart/form-data')
+    assert response.status_code in (200, 302)
+
+
+def test_node_api_needs_the_secret(server, admin, origin):
+    upload(admin, 'node-secret.txt', b'origin copy')
+    client = server.app.test_client()
+    assert client.get('/_node/files/node-secret.txt').status_code == 401
+    assert client.get('/_node/files/node-secret.txt', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    with origin.request('GET', '/_node/files/node-secret.txt') as response:
+        assert response.getcode() == 200 and response.read() == b'origin copy'
+        etag = response.headers['ETag']
+    with origin.request('GET', '/_node/files/node-secret.txt', headers={'If-None-Match': etag}) as response:
+        assert response.getcode() == 304
+
+
+def test_edge_revalidates_its_copy(admin, origin, tmp_path, monkeypatch):
+    upload(admin, 'edge-copy.txt', b'first version')
+    cache = EdgeCache(str(tmp_path / 'edge'), origin, revalidate=60)
+    path = cache.get('edge-copy.txt')
+    with open(path, 'rb') as f:
+        assert f.read() == b'first version'
+    assert cache.get('edge-copy.txt') == path
+    assert len(origin.requests) == 1 and cache.hits == 1
+
+    # Once `revalidate` has passed the copy is checked with If-None-Match.
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 61)
+    assert cache.get('edge-copy.txt') == path
+    assert origin.requests[-1][2]['If-None-Match'] == f'"{os.path.basename(path).split(".")[0]}"'
+    assert len(origin.requests) == 2
+
+    # A changed file on the origin replaces the copy on the next check.
+    admin.post('/delete/edge-copy.txt')
+    upload(admin, 'edge-copy.txt', b'second version')
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 122)
+    new_path = cache.get('edge-copy.txt')
+    assert new_path != path and not os.path.exists(path)
+    with open(new_path, 'rb') as f:
+        assert f.read() == b'second version'
+    assert cache.open('edge-copy.txt', new_path).etag == os.path.basename(new_path).split('.')[0]
+
+
+def test_edge_drops_files_deleted_on_the_origin(admin, origin, tmp_path):
+    upload(admin, 'edge-gone.txt', b'short lived')
+    cache = EdgeCache(str(tmp_path / 'edge'), origin, revalidate=0)
+    assert cache.get('edge-gone.txt') is not None
+    admin.post('/delete/edge-gone.txt')
+    assert cache.get('edge-gone.txt') is None
+    assert cache._local('edge-gone.txt') is None
+
+
+def test_origin_catalog_caches_until_invalidated(server, admin, origin):
+    upload(admin, 'edge-meta.txt', b'counted')
+    server.metadata_store.set_visit_limit('edge-meta.txt', 1)
+    catalog = OriginCatalog(origin, ttl=60)
+    assert catalog.get('edge-meta.txt')['visit_limit'] == 1
+    server.metadata_store.set_password('edge-meta.txt', 'secret')
+    assert 'password' not in catalog.get('edge-meta.txt')
+    catalog.invalidate('edge-meta.txt')
+    assert catalog.get('edge-meta.txt')['password'] == 'secret'
+    # Visits are counted on the origin, so the limit holds across edges.
+    assert catalog.record_visit('edge-meta.txt', 1)
+    assert not OriginCatalog(origin).record_visit('edge-meta.txt', 1)
+    assert catalog.get('edge-meta.txt')['visit_count'] == 1
@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip('PIL')
+from PIL import Image
+
+from delivery import StaticFile
+from images import ImageDerivatives
+
+
+@pytest.fixture
+def images(tmp_path):
+    images = ImageDerivatives(str(tmp_path / 'cache'), workers=1)
+    yield images
+    images.close()
+
+
+def png(path, width=64, height=32):
+    Image.new('RGB', (width, height), 'red').save(path, 'PNG')
+    return StaticFile(str(path), mimetype='image/png')
+
+
+def count_renders(images, monkeypatch):
+    renders = []
+    render = images._render
+    monkeypatch.setattr(images, '_render', lambda *args: renders.append(args) or render(*args))
+    return renders
+
+
+def test_resized_variant_is_built_once(images, tmp_path, monkeypatch):
+    source = png(tmp_path / 'a.png')
+    renders = count_renders(images, monkeypatch)
+    first = images.select(source, 'a.png', width=32, fmt='jpeg')
+    second = images.select(source, 'a.png', width=32, fmt='jpeg')
+    assert first.mimetype == 'image/jpeg' and first.path == second.path
+    with Image.open(first.path) as image:
+        assert image.size == (32, 16)
+    assert len(renders) == 1
+
+
+def test_unchanged_results_are_remembered(images, tmp_path, monkeypatch):
+    source = png(tmp_path / 'a.png')
+    renders = count_renders(images, monkeypatch)
+    for _ in range(3):
+        assert images.select(source, 'a.png', width=128) is source
+    assert len(renders) == 1
+    # A new version of the file is looked at again.
+    changed = png(tmp_path / 'a.png', width=256)
+    assert changed.etag != source.etag
+    assert images.select(changed, 'a.png', width=128) is not changed
+    assert len(renders) == 2
@@ -0,0 +1,71 @@
+import os
+import threading
+
+from layout import FileLayout, valid_name
+
+
+def write(path, data=b'x'):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_sharded_path_round_trip(tmp_path):
+    layout = FileLayout(str(tmp_path))
+    path = layout.target('report.pdf')
+    assert os.path.relpath(path, tmp_path).split(os.sep)[2:] == ['report.pdf']
+    assert all(len(part) == 2 for part in os.path.relpath(path, tmp_path).split(os.sep)[:2])
+    write(path)
+    assert layout.locate('report.pdf') == path == layout.path('report.pdf')
+    assert layout.target('report.pdf') == path
+    layout.rename('report.pdf', 'final.pdf')
+    assert layout.locate('report.pdf') is None
+    assert layout.locate('final.pdf') == layout.path('final.pdf')
+    assert list(layout.files()) == [('final.pdf', layout.path('final.pdf'))]
+
+
+def test_names_outside_the_root_are_refused(tmp_path):
+    layout = FileLayout(str(tmp_path))
+    write(tmp_path / '.layout.lock')
+    for name in ['', '../config.json', 'a/b.txt', '.layout.lock', None]:
+        assert not valid_name(name)
+        assert layout.locate(name) is None
+
+
+def test_flat_files_are_served_until_moved(tmp_path):
+    layout = FileLayout(str(tmp_path))
+    for name in ['a.txt', 'b.txt']:
+        write(tmp_path / name, name.encode())
+    write(layout.target('c.txt'))
+    assert layout.locate('a.txt') == str(tmp_path / 'a.txt')
+    assert layout.target('a.txt') == str(tmp_path / 'a.txt')
+    assert sorted(name for name, _ in layout.files()) == ['a.txt', 'b.txt', 'c.txt']
+
+    assert layout.migrate(batch_size=1, pause=0) == (2, [])
+    assert layout.flat_files() == []
+    for name in ['a.txt', 'b.txt']:
+        assert layout.locate(name) == layout.path(name)
+        with open(layout.locate(name), 'rb') as f:
+            assert f.read() == name.encode()
+    assert sorted(name for name, _ in layout.files()) == ['a.txt', 'b.txt', 'c.txt']
+
+
+def test_migration_skips_names_already_sharded(tmp_path):
+    layout = FileLayout(str(tmp_path))
+    write(tmp_path / 'a.txt', b'flat')
+    os.makedirs(layout.shard('a.txt'))
+    write(layout.path('a.txt'), b'sharded')
+    assert layout.migrate(pause=0) == (0, ['a.txt'])
+    assert (tmp_path / 'a.txt').read_bytes() == b'flat'
+
+
+def test_migration_waits_for_writers(tmp_path):
+    layout = FileLayout(str(tmp_path))
+    write(tmp_path / 'a.txt')
+    moved = []
+    with layout.writing():
+        mover = threading.Thread(target=lambda: moved.append(layout.migrate(pause=0)))
+        mover.start()
+        mover.join(0.2)
+        assert mover.is_alive() and layout.locate('a.txt') == str(tmp_path / 'a.txt')
+    mover.join(5)
+    assert moved == [(1, [])]
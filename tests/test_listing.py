@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from layout import FileLayout
+from listing import FileIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    layout = FileLayout(str(tmp_path / 'files'))
+    for i, name in enumerate(['a.txt', 'b.txt', 'c.txt', 'd.txt', 'e.txt']):
+        path = layout.target(name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * (i + 1))
+        os.utime(path, (1000 + i, 1000 + i))
+    return FileIndex(layout, rescan_interval=0)
+
+
+def walk(index, **kwargs):
+    names, cursor = [], None
+    while True:
+        page = index.page(cursor=cursor, **kwargs)
+        names += [item['name'] for item in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            return names, page['total']
+
+
+def test_pages_in_sort_order(index):
+    assert walk(index, limit=2) == (['e.txt', 'd.txt', 'c.txt', 'b.txt', 'a.txt'], 5)
+    assert walk(index, sort='size', descending=False, limit=2) == (['a.txt', 'b.txt', 'c.txt', 'd.txt', 'e.txt'], 5)
+
+
+def test_filtered_page_counts_only_matches(index):
+    matching = {'b.txt', 'd.txt'}
+    page = index.page(limit=1, predicate=matching.__contains__)
+    assert [item['name'] for item in page['items']] == ['d.txt']
+    assert page['total'] == 2
+    assert walk(index, limit=1, predicate=matching.__contains__) == (['d.txt', 'b.txt'], 2)
+    assert index.page(predicate=set().__contains__) == {'items': [], 'next_cursor': None, 'total': 0}
+
+
+def test_changes_are_applied_without_rescan(index):
+    index.page()
+    os.remove(index.layout.locate('c.txt'))
+    index.on_change('delete', 'c.txt')
+    with open(index.layout.target('f.txt'), 'wb') as f:
+        f.write(b'new')
+    index.on_change('upload', 'f.txt')
+    names, total = walk(index, sort='name', descending=False, limit=10)
+    assert names == ['a.txt', 'b.txt', 'd.txt', 'e.txt', 'f.txt'] and total == 5
+
+
+def test_limit_and_sort_are_checked(index):
+    with pytest.raises(ValueError):
+        index.page(limit=0)
+    with pytest.raises(ValueError):
+        index.page(sort='colour')
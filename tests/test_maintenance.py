@@ -0,0 +1,89 @@
+import os
+import time
+
+import pytest
+
+from blobstore import BlobStore
+from events import ChangeFeed
+from layout import FileLayout
+from maintenance import Maintenance
+from metadata_store import SqliteMetadataStore
+
+
+class Variants:
+    def invalidate(self, name):
+        pass
+
+
+@pytest.fixture
+def maintenance(tmp_path):
+    layout = FileLayout(str(tmp_path / 'files'))
+    store = SqliteMetadataStore(str(tmp_path / 'catalog.db'), counters_path=str(tmp_path / 'counts.log'))
+    blobs = BlobStore(layout.root)
+    for name in ['a.txt', 'b.txt', 'c.txt']:
+        tmp = blobs.temp_path()
+        with open(tmp, 'wb') as f:
+            f.write(name.encode())
+        store.put(name, {'sha256': blobs.store(tmp, layout.target(name))})
+    maintenance = Maintenance(layout, store, blobs, Variants(), ChangeFeed(str(tmp_path / 'events.log')),
+                              state_path=str(tmp_path / 'maintenance.json'), interval=0, grace_period=60, pause=0)
+    assert maintenance._is_leader()
+    maintenance.change_feed.subscribe(maintenance.on_change)
+    yield maintenance
+    maintenance.change_feed.close()
+
+
+def count_calls(monkeypatch, obj, method):
+    calls = []
+    original = getattr(obj, method)
+    monkeypatch.setattr(obj, method, lambda *args: calls.append(args) or original(*args))
+    return calls
+
+
+def test_later_sweeps_skip_the_full_scan(maintenance, monkeypatch):
+    maintenance.run()
+    scans = count_calls(monkeypatch, maintenance.metadata_store, 'all')
+    walks = count_calls(monkeypatch, maintenance.layout, 'files')
+    gets = count_calls(monkeypatch, maintenance.metadata_store, 'get')
+    maintenance.metadata_store.set_expiry('b.txt', time.time() - 120)
+    maintenance.change_feed.publish('update', 'b.txt')
+    assert maintenance.run()['reclaimed'] == 1
+    assert maintenance.layout.locate('b.txt') is None
+    # b.txt is looked up while the change is checked and again before deleting it.
+    maintenance.run()
+    assert scans == [] and walks == []
+    assert {name for name, in gets} == {'b.txt'}
+
+
+def test_watched_files_are_reclaimed_without_events(maintenance):
+    maintenance.metadata_store.set_expiry('a.txt', time.time() + 0.1)
+    maintenance.run()
+    maintenance.metadata_store.update('a.txt', expires_at=time.time() - 120)
+    assert maintenance.run()['reclaimed'] == 1
+
+
+def test_changed_orphans_are_pruned_on_the_second_look(maintenance):
+    maintenance.run()
+    os.remove(maintenance.layout.locate('c.txt'))
+    maintenance.change_feed.publish('update', 'c.txt')
+    assert maintenance.run()['pruned'] == 0
+    assert maintenance.run()['pruned'] == 1
+    assert maintenance.metadata_store.get('c.txt') is None
+
+
+def test_full_sweep_after_full_interval(maintenance):
+    maintenance.run()
+    os.remove(maintenance.layout.locate('c.txt'))
+    maintenance.full_interval = 0
+    maintenance.run()
+    assert maintenance.run()['pruned'] == 1
+
+
+def test_only_the_leader_sweeps(maintenance):
+    other = Maintenance(maintenance.layout, maintenance.metadata_store, maintenance.blob_store, Variants(),
+                        maintenance.change_feed, state_path=maintenance.state_path)
+    assert not other._is_leader()
+    other.on_change('update', 'a.txt')
+    assert other._changed == set()
+    maintenance.on_change('update', 'a.txt')
+    assert maintenance._changed == {'a.txt'}
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from counters import VisitCounters
+from metadata_store import JsonMetadataStore, SqliteMetadataStore
+
+
+@pytest.fixture
+def json_store(tmp_path):
+    stores = []
+    def open_store():
+        store = JsonMetadataStore(str(tmp_path / 'file_metadata.json'), counters_path=str(tmp_path / 'counts.log'),
+                                  flush_interval=3600, reload_interval=0)
+        stores.append(store)
+        return store
+    yield open_store
+    for store in stores:
+        store._stopped.set()
+
+
+def test_json_writes_are_flushed_and_reloaded(json_store, tmp_path):
+    store = json_store()
+    store.put('a.txt', {'size': 1})
+    store.set_password('a.txt', 'secret')
+    store.set_visit_limit('a.txt', 2)
+    assert store.record_visit('a.txt', 2)
+    assert not (tmp_path / 'file_metadata.json').exists()
+    store.flush()
+    on_disk = json.loads((tmp_path / 'file_metadata.json').read_text())
+    assert on_disk == {'a.txt': {'size': 1, 'password': 'secret', 'visit_limit': 2}}
+    assert json_store().get('a.txt') == {'size': 1, 'password': 'secret', 'visit_limit': 2, 'visit_count': 1}
+
+
+def test_json_rename_survives_a_reload(json_store):
+    store = json_store()
+    store.put('a.txt', {'size': 1, 'visit_limit': 5})
+    store.record_visit('a.txt', 5)
+    store.flush()
+    assert store.rename('a.txt', 'b.txt')
+    assert not store.rename('missing.txt', 'c.txt')
+    store.flush()
+    reloaded = json_store()
+    assert reloaded.get('a.txt') is None
+    assert reloaded.get('b.txt') == {'size': 1, 'visit_limit': 5, 'visit_count': 1}
+    assert list(reloaded.all()) == ['b.txt']
+
+
+def test_json_flush_keeps_other_processes_writes(json_store):
+    first, second = json_store(), json_store()
+    first.put('a.txt', {'size': 1})
+    first.flush()
+    second.put('b.txt', {'size': 2})
+    first.delete('a.txt')
+    second.flush()
+    first.flush()
+    assert json_store().all() == {'b.txt': {'size': 2}}
+    # Each store picks up the other's flushed changes on its next read.
+    assert second.get('a.txt') is None and first.get('b.txt') == {'size': 2}
+
+
+def test_json_unflushed_writes_are_kept_across_reloads(json_store, tmp_path):
+    store = json_store()
+    store.put('a.txt', {'size': 1})
+    (tmp_path / 'file_metadata.json').write_text(json.dumps({'b.txt': {'size': 2}}))
+    assert store.all() == {'a.txt': {'size': 1}, 'b.txt': {'size': 2}}
+
+
+def test_sqlite_catalog_imports_the_json_file_once(tmp_path):
+    (tmp_path / 'file_metadata.json').write_text(json.dumps({
+        'a.txt': {'password': 'secret', 'visit_limit': 3, 'visit_count': 1},
+        'b.txt': {},
+    }))
+    VisitCounters(str(tmp_path / 'counts.log')).set('a.txt', 2)
+    (tmp_path / 'files').mkdir()
+    (tmp_path / 'files' / 'b.txt').write_bytes(b'12345')
+    store = SqliteMetadataStore(str(tmp_path / 'catalog.db'), legacy_path=str(tmp_path / 'file_metadata.json'),
+                                counters_path=str(tmp_path / 'counts.log'), upload_folder=str(tmp_path / 'files'))
+    assert store.get('a.txt') == {'password': 'secret', 'visit_limit': 3, 'visit_count': 2}
+    assert store.get('b.txt')['size'] == 5
+    store.delete('b.txt')
+    store.close()
+    reopened = SqliteMetadataStore(str(tmp_path / 'catalog.db'), legacy_path=str(tmp_path / 'file_metadata.json'))
+    assert sorted(reopened.all()) == ['a.txt']
+
+
+def test_sqlite_rename_and_visits(tmp_path):
+    store = SqliteMetadataStore(str(tmp_path / 'catalog.db'))
+    store.put('a.txt', {'size': 1})
+    store.put('b.txt', {'size': 2})
+    store.set_visit_limit('a.txt', 2)
+    assert [store.record_visit('a.txt', 2) for _ in range(3)] == [True, True, False]
+    assert store.rename('a.txt', 'b.txt')
+    assert not store.rename('missing.txt', 'c.txt')
+    assert store.all() == {'b.txt': {'size': 1, 'visit_limit': 2, 'visit_count': 2}}
+    store.set_visit_limit('b.txt', None)
+    assert store.get('b.txt') == {'size': 1}
+    with pytest.raises(KeyError):
+        store.update('b.txt', colour='red')
+
+
+def test_sqlite_batch_rolls_back_together(tmp_path):
+    store = SqliteMetadataStore(str(tmp_path / 'catalog.db'))
+    store.put('a.txt', {'size': 1})
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.set_password('a.txt', 'secret')
+            store.delete('a.txt')
+            raise RuntimeError()
+    assert store.get('a.txt') == {'size': 1}
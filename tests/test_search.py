@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from search import SearchIndex, parse_query
+
+
+class Files:
+    def __init__(self, names):
+        self._names = list(names)
+
+    def names(self):
+        return list(self._names)
+
+
+class Catalog:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def all(self):
+        return {name: dict(meta) for name, meta in self.entries.items()}
+
+    def get(self, name):
+        meta = self.entries.get(name)
+        return dict(meta) if meta is not None else None
+
+
+NAMES = ['report.pdf', 'report-final.pdf', 'annual_report_2024.pdf', 'new.txt', 'news-letter.txt',
+         'holiday.png', 'a.txt']
+
+
+@pytest.fixture
+def index():
+    catalog = Catalog({
+        'report.pdf': {'password': 'x'},
+        'new.txt': {'visit_limit': 5, 'visit_count': 5},
+        'news-letter.txt': {'visit_limit': 10, 'visit_count': 8},
+        'holiday.png': {'expires_at': time.time() + 3600},
+    })
+    return SearchIndex(Files(NAMES), catalog)
+
+
+def test_parse_query():
+    assert parse_query('Report is:locked final IS:password is:bogus') == (['report', 'final', 'is:bogus'],
+                                                                          {'locked', 'password'})
+
+
+def test_ranking(index):
+    assert index.search('report') == ['report.pdf', 'report-final.pdf', 'annual_report_2024.pdf']
+    assert index.search('new') == ['new.txt', 'news-letter.txt']
+
+
+def test_multi_word_queries_match_every_term(index):
+    assert index.search('report final') == ['report-final.pdf']
+    assert index.search('final report') == ['report-final.pdf']
+    assert index.search('ne w') == ['new.txt', 'news-letter.txt']
+    assert index.search('report 2024 pdf') == ['annual_report_2024.pdf']
+    assert index.search('report missing') == []
+
+
+def test_short_terms(index):
+    assert index.search('a') == ['a.txt', 'annual_report_2024.pdf', 'holiday.png', 'report-final.pdf']
+    assert index.search('p report') == ['report.pdf', 'report-final.pdf', 'annual_report_2024.pdf']
+
+
+def test_flags(index):
+    assert index.search('is:password') == ['report.pdf']
+    assert index.search('is:locked') == ['new.txt']
+    assert index.search('is:near-limit') == ['news-letter.txt']
+    assert index.search('is:expiring') == ['holiday.png']
+    assert index.search('new is:limited') == ['new.txt', 'news-letter.txt']
+    assert set(index.search('is:public', limit=50)) == {'report-final.pdf', 'annual_report_2024.pdf', 'a.txt', 'holiday.png'}
+
+
+def test_find_pages_and_counts(index):
+    names, total = index.find('report', limit=2)
+    assert names == ['report.pdf', 'report-final.pdf'] and total == 3
+    names, total = index.find('report', limit=2, offset=2)
+    assert names == ['annual_report_2024.pdf'] and total == 3
+
+
+def test_changes_update_the_index(index):
+    index.search('x')
+    index.file_index._names.append('quarterly-report.pdf')
+    index.on_change('upload', 'quarterly-report.pdf')
+    index.on_change('rename', 'report.pdf', 'summary.pdf')
+    index.file_index._names.remove('report.pdf')
+    index.on_change('delete', 'a.txt')
+    assert 'quarterly-report.pdf' in index.search('report')
+    assert 'report.pdf' not in index.search('report')
+    assert index.search('summary') == ['summary.pdf']
+    assert index.search('a.txt') == []
@@ -0,0 +1,69 @@
+import io
+import time
+import json
+
+import pytest
+
+from tokens import DownloadTokens, ensure_secret_key
+
+
+@pytest.fixture
+def tokens(tmp_path):
+    return DownloadTokens('secret', counters_path=str(tmp_path / 'token_visits.log'))
+
+
+def test_issue_and_verify(tokens):
+    token, expires = tokens.issue('a.txt', ttl=60)
+    assert tokens.verify('a.txt', token) == {'expires': expires, 'visits': None, 'id': ''}
+    assert tokens.verify('b.txt', token) is None
+    assert DownloadTokens('other', counters=tokens.counters).verify('a.txt', token) is None
+
+
+def test_expiry(tokens, monkeypatch):
+    token, expires = tokens.issue('a.txt', ttl=60, not_after=time.time() + 30)
+    assert expires <= time.time() + 30
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 31)
+    assert tokens.verify('a.txt', token) is None
+
+
+def test_tampered_tokens_are_refused(tokens):
+    token, _ = tokens.issue('a.txt', ttl=60, visits=2)
+    expires, visits, token_id, signature = token.split('.')
+    for forged in [f"{int(expires) + 3600}.{visits}.{token_id}.{signature}",
+                   f"{expires}.20.{token_id}.{signature}",
+                   f"{expires}.{visits}.{token_id}.{signature[:-1]}A",
+                   f"{expires}.{visits}.{token_id}.{signature}\udcff",
+                   'not-a-token']:
+        assert tokens.verify('a.txt', forged) is None
+
+
+def test_visit_quota(tokens):
+    token, _ = tokens.issue('a.txt', visits=2)
+    grant = tokens.verify('a.txt', token)
+    assert [tokens.record_visit(grant) for _ in range(3)] == [True, True, False]
+
+
+def test_empty_secret_key_is_generated_once(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_bytes(b'{\r\n    "password_hash": "",\r\n    "secret_key": "",\r\n    "admin_path": ""\r\n}\r\n')
+    first = ensure_secret_key(json.loads(path.read_bytes()), str(path))
+    assert len(first['secret_key']) == 48
+    assert path.read_bytes() == (b'{\r\n    "password_hash": "",\r\n    "secret_key": "%s",\r\n    "admin_path": ""\r\n}\r\n'
+                                 % first['secret_key'].encode())
+    assert ensure_secret_key({'secret_key': ''}, str(path))['secret_key'] == first['secret_key']
+    path.write_text('{}')
+    generated = ensure_secret_key({}, str(path))['secret_key']
+    assert json.loads(path.read_text()) == {'secret_key': generated}
+
+
+def test_locked_file_does_not_spend_the_link(server, admin):
+    admin.post('/upload', data={'file': (io.BytesIO(b'limited'), 'limited.txt'), 'custom_name': 'limited'})
+    server.metadata_store.set_visit_limit('limited.txt', 1)
+    url = admin.post('/api/file/limited.txt/link', json={'visits': 1}).get_json()['url']
+    token = url.split('token=')[1]
+    grant = server.download_tokens.verify('limited.txt', token)
+    client = server.app.test_client()
+    assert client.get('/files/limited.txt?password=').status_code == 200
+    assert client.get(f"/files/limited.txt?token={token}").status_code == 403
+    assert server.download_tokens.counters.get(grant['id']) == 0
@@ -0,0 +1,58 @@
+import io
+
+import pytest
+
+from uploads import ResumableUploads, UploadError
+
+
+def test_resume_after_an_interrupted_chunk(tmp_path):
+    uploads = ResumableUploads(str(tmp_path), max_size=1000)
+    upload = uploads.create('a.txt', 10)
+    # The client dropped after four of the six bytes it meant to send.
+    assert uploads.append(upload['id'], 0, io.BytesIO(b'0123'))['offset'] == 4
+    assert uploads.get(upload['id'])['offset'] == 4
+    with pytest.raises(UploadError) as error:
+        uploads.append(upload['id'], 6, io.BytesIO(b'6789'))
+    assert (error.value.status, error.value.offset) == (409, 4)
+    assert uploads.append(upload['id'], 4, io.BytesIO(b'456789extra'))['offset'] == 10
+    stored = []
+    uploads.commit(upload, lambda part_path: stored.append(open(part_path, 'rb').read()))
+    assert stored == [b'0123456789']
+    with pytest.raises(UploadError):
+        uploads.get(upload['id'])
+
+
+def test_unknown_and_oversized_uploads(tmp_path):
+    uploads = ResumableUploads(str(tmp_path), max_size=10)
+    with pytest.raises(UploadError) as error:
+        uploads.create('a.txt', 11)
+    assert error.value.status == 413
+    for upload_id in ['0' * 32, '../config']:
+        with pytest.raises(UploadError) as error:
+            uploads.get(upload_id)
+        assert error.value.status == 404
+
+
+def test_resumable_upload_over_http(server, admin):
+    created = admin.post('/api/uploads', json={'filename': 'resume.txt', 'length': 10, 'custom_name': 'resumed'})
+    assert created.status_code == 201
+    location = created.headers['Location']
+    response = admin.patch(location, data=b'01234', headers={'Upload-Offset': '0'})
+    assert response.status_code == 204 and response.headers['Upload-Offset'] == '5'
+    assert admin.head(location).headers['Upload-Offset'] == '5'
+
+    response = admin.patch(location, data=b'56789', headers={'Upload-Offset': '3'})
+    assert response.status_code == 409 and response.headers['Upload-Offset'] == '5'
+    response = admin.patch(location, data=b'56789xx', headers={'Upload-Offset': '5'})
+    assert response.status_code == 413
+    assert admin.patch(location, data=b'5', headers={}).status_code == 400
+
+    response = admin.patch(location, data=b'56789', headers={'Upload-Offset': '5'})
+    assert response.status_code == 200 and response.get_json()['filename'] == 'resumed.txt'
+    assert server.app.test_client().get('/files/resumed.txt').data == b'0123456789'
+    assert admin.head(location).status_code == 404
+
+
+def test_uploads_need_a_login(server):
+    client = server.app.test_client()
+    assert client.post('/api/uploads', json={'filename': 'a.txt', 'length': 1}).status_code == 401
@@ -0,0 +1,90 @@
+import struct
+
+import pytest
+
+from compression import Unchanged
+from video import boxes, faststart
+
+
+def box(kind, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+def offset_table(kind, offsets):
+    fmt = '>I' if kind == b'stco' else '>Q'
+    return box(kind, struct.pack('>II', 0, len(offsets)) + b''.join(struct.pack(fmt, o) for o in offsets))
+
+def moov(table):
+    return box(b'moov', box(b'mvhd', bytes(100)) + box(b'trak', box(b'mdia', box(b'minf', box(b'stbl', table)))))
+
+def read_offsets(data, kind):
+    # Walks down to the offset table of a file laid out by moov() above.
+    def find(start, end):
+        for name, offset, header, size in boxes(data, start, end):
+            if name == kind:
+                count = struct.unpack_from('>I', data, offset + header + 4)[0]
+                fmt = '>I' if kind == b'stco' else '>Q'
+                width = struct.calcsize(fmt)
+                return [struct.unpack_from(fmt, data, offset + header + 8 + i * width)[0] for i in range(count)]
+            if name in (b'moov', b'trak', b'mdia', b'minf', b'stbl'):
+                found = find(offset + header, offset + size)
+                if found is not None:
+                    return found
+        return None
+    return find(0, len(data))
+
+
+SAMPLES = [b'first sample', b'second', b'third sample here']
+
+
+def mp4(kind, front=False):
+    ftyp = box(b'ftyp', b'isom\x00\x00\x02\x00isomiso2mp41')
+    payload = b''.join(SAMPLES)
+    # Offsets into the file for a layout with the index at the end.
+    mdat_start = len(ftyp) + 8
+    offsets, position = [], mdat_start
+    for sample in SAMPLES:
+        offsets.append(position)
+        position += len(sample)
+    if front:
+        index = moov(offset_table(kind, [o + len(moov(offset_table(kind, offsets))) for o in offsets]))
+        return ftyp + index + box(b'mdat', payload)
+    return ftyp + box(b'mdat', payload) + moov(offset_table(kind, offsets))
+
+
+def samples_at(data, offsets):
+    return [data[o:o + len(sample)] for o, sample in zip(offsets, SAMPLES)]
+
+
+@pytest.mark.parametrize('kind', [b'stco', b'co64'])
+def test_faststart_moves_index_and_shifts_offsets(tmp_path, kind):
+    source = tmp_path / 'in.mp4'
+    source.write_bytes(mp4(kind))
+    target = tmp_path / 'out.mp4'
+    faststart(str(source), str(target))
+    data = target.read_bytes()
+    assert len(data) == source.stat().st_size
+    assert [name for name, *_ in boxes(data, 0, len(data))] == [b'ftyp', b'moov', b'mdat']
+    assert samples_at(data, read_offsets(data, kind)) == SAMPLES
+    assert data == mp4(kind, front=True)
+
+
+def test_faststart_leaves_streamable_files_alone(tmp_path):
+    source = tmp_path / 'in.mp4'
+    source.write_bytes(mp4(b'stco', front=True))
+    with pytest.raises(Unchanged):
+        faststart(str(source), str(tmp_path / 'out.mp4'))
+
+
+def test_faststart_skips_overflowing_32_bit_offsets(tmp_path):
+    ftyp = box(b'ftyp', b'isom')
+    source = tmp_path / 'in.mp4'
+    source.write_bytes(ftyp + box(b'mdat', b'x') + moov(offset_table(b'stco', [(1 << 32) - 10])))
+    with pytest.raises(Unchanged):
+        faststart(str(source), str(tmp_path / 'out.mp4'))
+
+
+def test_faststart_rejects_malformed_boxes(tmp_path):
+    source = tmp_path / 'in.mp4'
+    source.write_bytes(box(b'ftyp', b'isom') + struct.pack('>I4s', 4096, b'mdat') + b'short')
+    with pytest.raises(ValueError):
+        faststart(str(source), str(tmp_path / 'out.mp4'))
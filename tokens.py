@@ -0,0 +1,82 @@
+import os
+import re
+import hmac
+import json
+import time
+import fcntl
+import base64
+import hashlib
+import secrets
+from counters import VisitCounters
+
+
+def encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def ensure_secret_key(config, config_file):
+    # The shipped config.json leaves secret_key empty. The first process to
+    # start generates one and saves it, so the web workers and the bot agree.
+    if config.get('secret_key'):
+        return config
+    with open(f"{config_file}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        with open(config_file, 'r', newline='') as f:
+            text = f.read()
+        saved = json.loads(text)
+        if not saved.get('secret_key'):
+            saved['secret_key'] = secrets.token_hex(24)
+            # Edited in place so the rest of the file keeps its layout.
+            text, found = re.subn(r'("secret_key"\s*:\s*)""', lambda m: f'{m.group(1)}"{saved["secret_key"]}"', text, count=1)
+            if not found:
+                text = json.dumps(saved, indent=4)
+            tmp_path = f"{config_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', newline='') as f:
+                f.write(text)
+            os.replace(tmp_path, config_file)
+            print(f"Generated a secret_key and saved it to {config_file}.")
+    config['secret_key'] = saved['secret_key']
+    return config
+
+
+class DownloadTokens:
+    # A token is <expires>.<visits>.<id>.<signature>, signed over the file
+    # name, so checking one needs no catalog lookup. Only tokens that carry a
+    # visit quota get an id, and only those touch the shared counter log.
+    def __init__(self, secret_key, counters_path='token_visits.log', default_ttl=24 * 3600, max_ttl=30 * 24 * 3600,
+                 counters=None):
+        if not secret_key:
+            raise ValueError("A secret_key is required to sign download links.")
+        self.key = hashlib.sha256(f"download-token:{secret_key}".encode('utf-8')).digest()
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self.counters = counters or VisitCounters(counters_path)
+
+    def _sign(self, name, expires, visits, token_id):
+        message = f"{name}\n{expires}\n{visits}\n{token_id}".encode('utf-8')
+        return encode(hmac.new(self.key, message, hashlib.sha256).digest()[:18])
+
+    def issue(self, name, ttl=None, visits=None, not_after=None):
+        expires = int(time.time() + min(ttl or self.default_ttl, self.max_ttl))
+        if not_after is not None:
+            expires = min(expires, int(not_after))
+        visits = int(visits) if visits else ''
+        token_id = encode(secrets.token_bytes(8)) if visits else ''
+        return f"{expires}.{visits}.{token_id}.{self._sign(name, expires, visits, token_id)}", expires
+
+    def verify(self, name, token):
+        try:
+            expires, visits, token_id, signature = token.split('.')
+            expires = int(expires)
+        except ValueError:
+            return None
+        expected = self._sign(name, expires, visits, token_id).encode('ascii')
+        # Compared as bytes: compare_digest raises on non-ASCII str.
+        if expires <= time.time() or not hmac.compare_digest(signature.encode('utf-8', 'surrogateescape'), expected):
+            return None
+        return {'expires': expires, 'visits': int(visits) if visits else None, 'id': token_id}
+
+    def record_visit(self, grant):
+        if grant['visits'] is None:
+            return True
+        return self.counters.hit(grant['id'], grant['visits'])
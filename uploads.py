@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ResumableUploads:
+    def __init__(self, upload_folder, max_size, session_ttl=24 * 3600):
+        self.upload_folder = upload_folder
+        self.sessions_dir = os.path.join(upload_folder, '.uploads')
+        self.max_size = max_size
+        self.session_ttl = session_ttl
+        os.makedirs(self.sessions_dir, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if not upload_id.isalnum():
+            raise UploadError('Unknown upload.', 404)
+        base = os.path.join(self.sessions_dir, upload_id)
+        return f"{base}.json", f"{base}.part"
+
+    def create(self, filename, length, options=None):
+        if length < 0 or length > self.max_size:
+            raise UploadError(f'Upload length must be between 0 and {self.max_size} bytes.', 413)
+        self.expire_stale()
+        upload_id = uuid.uuid4().hex
+        info_path, part_path = self._paths(upload_id)
+        session = {'id': upload_id, 'filename': filename, 'length': length, 'options': options or {}, 'created': time.time()}
+        open(part_path, 'wb').close()
+        with open(info_path, 'w') as f:
+            json.dump(session, f)
+        session['offset'] = 0
+        return session
+
+    def get(self, upload_id):
+        info_path, part_path = self._paths(upload_id)
+        try:
+            with open(info_path, 'r') as f:
+                session = json.load(f)
+            session['offset'] = os.path.getsize(part_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            raise UploadError('Unknown upload.', 404)
+        return session
+
+    def append(self, upload_id, offset, stream):
+        session = self.get(upload_id)
+        _, part_path = self._paths(upload_id)
+        with open(part_path, 'ab') as part:
+            try:
+                fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError('Another request is writing to this upload.', 409, session['offset'])
+            current = os.fstat(part.fileno()).st_size
+            if offset != current:
+                raise UploadError('Upload-Offset does not match the received length.', 409, current)
+            remaining = session['length'] - current
+            while remaining > 0:
+                chunk = stream.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                part.write(chunk)
+                remaining -= len(chunk)
+            part.flush()
+            session['offset'] = os.fstat(part.fileno()).st_size
+        os.utime(self._paths(upload_id)[0])
+        return session
+
+    def commit(self, session, store):
+        info_path, part_path = self._paths(session['id'])
+        try:
+            result = store(part_path)
+        except FileNotFoundError:
+            raise UploadError('Upload was already completed.', 409)
+        os.remove(info_path)
+        return result
+
+    def abort(self, upload_id):
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def expire_stale(self):
+        cutoff = time.time() - self.session_ttl
+        for entry in os.scandir(self.sessions_dir):
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            if entry.name.endswith('.json'):
+                self.abort(entry.name[:-len('.json')])
+            elif entry.name.endswith('.tmp'):
+                os.remove(entry.path)
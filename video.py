@@ -0,0 +1,184 @@
+import os
+import re
+import mmap
+import shutil
+import struct
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from compression import VariantCache, Unchanged
+
+
+VIDEO_TYPES = {'video/mp4', 'video/quicktime', 'video/webm'}
+FASTSTART_TYPES = {'video/mp4', 'video/quicktime'}
+# Boxes on the way from moov down to the chunk offset tables.
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+CHUNK_SIZE = 1024 * 1024
+
+
+def boxes(data, start, end):
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            size, header = struct.unpack_from('>Q', data, offset + 8)[0], 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise ValueError(f"malformed {kind!r} box at offset {offset}")
+        yield kind, offset, header, size
+        offset += size
+
+def shift_offsets(data, start, end, delta):
+    for kind, offset, header, size in boxes(data, start, end):
+        if kind in CONTAINER_BOXES:
+            shift_offsets(data, offset + header, offset + size, delta)
+        elif kind == b'cmov':
+            raise Unchanged()
+        elif kind in (b'stco', b'co64'):
+            fmt = '>I' if kind == b'stco' else '>Q'
+            width = struct.calcsize(fmt)
+            count = struct.unpack_from('>I', data, offset + header + 4)[0]
+            table = offset + header + 8
+            if table + count * width > offset + size:
+                raise ValueError(f"truncated {kind!r} table at offset {offset}")
+            for position in range(table, table + count * width, width):
+                value = struct.unpack_from(fmt, data, position)[0] + delta
+                # 32-bit offset tables that would overflow are left alone
+                # rather than rewritten as co64.
+                if value >= 1 << (8 * width):
+                    raise Unchanged()
+                struct.pack_into(fmt, data, position, value)
+
+def faststart(source_path, tmp_path):
+    # Moves the moov box in front of the media data, like qt-faststart, so a
+    # player can start before the whole file has arrived.
+    with open(source_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise Unchanged()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            top = list(boxes(data, 0, len(data)))
+            kinds = [box[0] for box in top]
+            if b'moov' not in kinds or b'mdat' not in kinds or kinds.index(b'moov') < kinds.index(b'mdat') \
+                    or b'mdat' in kinds[kinds.index(b'moov'):]:
+                raise Unchanged()
+            _, offset, _, size = top[kinds.index(b'moov')]
+            moov = bytearray(data[offset:offset + size])
+            shift_offsets(moov, 0, len(moov), len(moov))
+            first_mdat = kinds.index(b'mdat')
+            with open(tmp_path, 'wb') as out:
+                for index, (kind, offset, _, size) in enumerate(top):
+                    if index == first_mdat:
+                        out.write(moov)
+                    if kind != b'moov':
+                        for start in range(offset, offset + size, CHUNK_SIZE):
+                            out.write(data[start:min(start + CHUNK_SIZE, offset + size)])
+
+def rewrite_playlist(path, media_url):
+    with open(path, 'r') as f:
+        text = re.sub(r'URI="[^"]*"', f'URI="{media_url}"', f.read())
+    return ''.join(f"{line if not line or line.startswith('#') else media_url}\n" for line in text.splitlines())
+
+
+class VideoVariants(VariantCache):
+    # Playback-friendly copies of videos, built in the background after upload:
+    # MP4/MOV files with the index moved to the front, and, when ffmpeg is
+    # installed, an HLS playlist over one fragmented MP4 stored as <etag>.media.
+    def __init__(self, cache_dir, max_bytes=4 * 1024 * 1024 * 1024, workers=1, faststart=True, hls=True,
+                 segment_seconds=6, timeout=3600):
+        super().__init__(cache_dir, max_bytes)
+        self.faststart = faststart
+        self.ffmpeg = shutil.which('ffmpeg') if hls else None
+        self.segment_seconds = segment_seconds
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='video-variants')
+        self._pending = set()
+        self._skipped = set()
+
+    def streamable(self, static_file):
+        return self.ffmpeg is not None and static_file.mimetype in VIDEO_TYPES
+
+    def _path(self, name, etag, suffix):
+        return os.path.join(self._key_dir(name), f"{etag}.{suffix}")
+
+    def _ready(self, path):
+        if not os.path.exists(path):
+            return False
+        os.utime(path)
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def _submit(self, static_file, name, suffix, build):
+        key = (name, static_file.etag, suffix)
+        with self._lock:
+            if key in self._pending or key in self._skipped:
+                return
+            self._pending.add(key)
+        def run():
+            try:
+                self._cached(name, static_file.etag, suffix, build)
+            except Unchanged:
+                with self._lock:
+                    self._skipped.add(key)
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                print(f"Failed to build {suffix} variant of {name}: {e}")
+                with self._lock:
+                    self._skipped.add(key)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+        self.executor.submit(run)
+
+    def process(self, static_file, name):
+        if self.faststart and static_file.mimetype in FASTSTART_TYPES:
+            self._submit(static_file, name, 'faststart', lambda tmp_path: faststart(static_file.path, tmp_path))
+        if self.streamable(static_file):
+            self._submit(static_file, name, 'm3u8', lambda tmp_path: self._segment(static_file, tmp_path))
+
+    def select(self, static_file, name):
+        if not self.faststart or static_file.mimetype not in FASTSTART_TYPES:
+            return static_file
+        path = self._path(name, static_file.etag, 'faststart')
+        if self._ready(path):
+            return static_file.derived(path, static_file.mimetype, 'faststart')
+        self.process(static_file, name)
+        return static_file
+
+    def playlist(self, static_file, name):
+        path = self._path(name, static_file.etag, 'm3u8')
+        if os.path.exists(self._path(name, static_file.etag, 'media')):
+            if self._ready(path):
+                return path
+        elif os.path.exists(path):
+            self._remove(path)
+        self.process(static_file, name)
+        return None
+
+    def media(self, static_file, name):
+        path = self._path(name, static_file.etag, 'media')
+        return path if self._ready(path) else None
+
+    def _segment(self, static_file, tmp_path):
+        media_path = os.path.join(os.path.dirname(tmp_path), f"{static_file.etag}.media")
+        work = tempfile.mkdtemp(prefix='hls-', dir=os.path.dirname(os.path.abspath(self.cache_dir)))
+        try:
+            subprocess.run([self.ffmpeg, '-nostdin', '-loglevel', 'error', '-i', static_file.path,
+                            '-map', '0:v:0?', '-map', '0:a:0?', '-c', 'copy',
+                            '-f', 'hls', '-hls_time', str(self.segment_seconds), '-hls_playlist_type', 'vod',
+                            '-hls_segment_type', 'fmp4', '-hls_flags', 'single_file',
+                            os.path.join(work, 'index.m3u8')],
+                           check=True, capture_output=True, timeout=self.timeout)
+            media = [entry.path for entry in os.scandir(work) if not entry.name.endswith('.m3u8')]
+            if len(media) != 1:
+                raise ValueError(f"ffmpeg wrote {len(media)} media files instead of one")
+            os.replace(media[0], media_path)
+            with self._lock:
+                self._total += os.path.getsize(media_path)
+            shutil.move(os.path.join(work, 'index.m3u8'), tmp_path)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+    def close(self):
+        self.executor.shutdown(wait=False)